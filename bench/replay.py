@@ -0,0 +1,316 @@
+import argparse
+import datetime
+import http.client
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "src"))
+
+import config
+from archive import latest_entries, read_entry
+from browser import replay_target
+from parser import get_url_type, url_key
+from run_bench import FIXTURES, throwaway_database
+
+#INFO: End-to-end crawler throughput against a recorded site. A local HTTP server serves a
+# snapshot (the newest copy of every page in the raw HTML archive, or the fixture corpus)
+# under the real URLs; the unmodified NairalandCrawler loop runs against it with a fresh
+# database and every delay at zero until the frontier is drained. Results are JSON, like
+# run_bench.py, so two runs can be diffed with --compare.
+
+SITE = "https://www.nairaland.com"
+
+NOT_FOUND = b"<html><head><title>Not Found</title></head><body></body></html>"
+
+#INFO: Stylesheets, scripts and images the browser asks for; answered 404 and not counted as pages
+_ASSET = re.compile(r"\.[a-z0-9]{2,5}$", re.IGNORECASE)
+
+
+class Snapshot:
+    #INFO: url_key -> page. Archive pages are read from their segment on every request, a big
+    # snapshot would not fit in memory. fallback serves unknown URLs by page type
+    def __init__(self, source: str, pages, loader=None, fallback=None):
+        self.source = source
+        self.pages = pages
+        self.loader = loader
+        self.fallback = fallback or {}
+
+    def get(self, url: str):
+        page = self.pages.get(url_key(url))
+        if page is None:
+            return self.fallback.get(get_url_type(url))
+        return self.loader(page) if self.loader else page
+
+
+def archive_snapshot(root: Path, since=None) -> Snapshot:
+    pages = {url_key(url): entry for url, entry in latest_entries(root, since).items()}
+    return Snapshot(f"archive:{root}", pages, loader=lambda entry: read_entry(root, entry))
+
+
+def fixture_snapshot() -> Snapshot:
+    #NOTE: The corpus links to ~700 topics it does not contain; each is answered with the
+    # first fixture of its page type so the crawl has a realistic frontier to work through
+    manifest = json.loads((FIXTURES / "manifest.json").read_text())
+    pages, fallback = {}, {}
+    for name, url in manifest.items():
+        html = (FIXTURES / name).read_text(encoding="utf-8")
+        pages[url_key(url)] = html
+        fallback.setdefault(get_url_type(url), html)
+    return Snapshot("fixtures", pages, fallback=fallback)
+
+
+class ReplayServer:
+    def __init__(self, snapshot: Snapshot, port: int = 0, delay: float = 0.0):
+        self.snapshot = snapshot
+        self.delay = delay
+        self.fetches = Counter()
+        self.missing = 0
+        self.assets = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            #NOTE: Headers and body go out in separate writes, Nagle would hold the body ~40ms
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if _ASSET.search(path):
+                    with server._lock: server.assets += 1
+                    self._send(404, NOT_FOUND)
+                    return
+                url = SITE + path
+                html = server.snapshot.get(url)
+                with server._lock:
+                    server.fetches[url_key(url)] += 1
+                    if html is None: server.missing += 1
+                if server.delay: time.sleep(server.delay)
+                if html is None:
+                    self._send(404, NOT_FOUND)
+                else:
+                    self._send(200, html.encode("utf-8"))
+
+            def _send(self, status, body):
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="replay-http", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def duplicate_fetches(self) -> int:
+        #INFO: Fetches beyond the first of each page, counted per url_key so slug and /0
+        # spellings of one page are duplicates too
+        with self._lock:
+            return sum(count - 1 for count in self.fetches.values())
+
+
+class HttpPage:
+    #INFO: The part of Playwright's Page that safe_goto uses, over one keep-alive connection
+    def __init__(self, replay_url: str):
+        self.replay_url = replay_url
+        self._netloc = urlsplit(replay_url).netloc
+        self._conn = None
+        self._html = ""
+
+    def goto(self, url, wait_until=None, timeout=60000):
+        target = urlsplit(replay_target(url, self.replay_url) or url)
+        path = target.path + (f"?{target.query}" if target.query else "")
+        for attempt in range(2):
+            try:
+                if self._conn is None:
+                    self._conn = http.client.HTTPConnection(self._netloc, timeout=timeout / 1000)
+                self._conn.request("GET", path or "/")
+                self._html = self._conn.getresponse().read().decode("utf-8", "replace")
+                return
+            except (http.client.HTTPException, OSError):
+                self.close()
+                if attempt: raise
+
+    def wait_for_function(self, *args, **kwargs):
+        return True
+
+    def title(self):
+        m = re.search(r"<title>(.*?)</title>", self._html, re.IGNORECASE | re.DOTALL)
+        return m.group(1).strip() if m else ""
+
+    def content(self):
+        return self._html
+
+    def close(self):
+        if self._conn: self._conn.close()
+        self._conn = None
+
+
+class HttpBrowser:
+    #INFO: Stand-in for BrowserManager with --no-browser: the run then measures the crawl
+    # loop, pipeline and database without Chromium's share of each page
+    resource_filter = None
+
+    def __init__(self, replay_url: str):
+        self.page = HttpPage(replay_url)
+        self.navigations = 0
+
+    def __enter__(self):
+        return self.page
+
+    def after_navigation(self):
+        self.navigations += 1
+        return self.page
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.page.close()
+
+
+def _total(counter, **labels):
+    want = set(labels.items())
+    return sum(v for key, v in counter.values.items() if want <= set(key))
+
+
+def run_replay(snapshot, db_url, use_browser=True, seeds=None, max_topics=0, parse_workers=None,
+               server_delay=0.0, keep_db=False):
+    server = ReplayServer(snapshot, delay=server_delay).start()
+    #INFO: Zero delays: no pacing, no startup jitter, and the crawler returns once it runs dry
+    config.REPLAY_URL = server.url
+    config.RATE_LIMIT = "none"
+    config.STARTUP_JITTER_SECONDS = 0
+    config.IDLE_SLEEP_SECONDS = 0
+    config.HEADLESS = True
+    config.METRICS_PORT = 0
+    config.ARCHIVE_HTML = False
+    config.MAX_TOPICS = max_topics or sys.maxsize
+    if parse_workers is not None: config.PARSE_WORKERS = parse_workers
+
+    from scraper import NairalandCrawler
+    from metrics import PAGES, POSTS, STAGE_SECONDS
+
+    try:
+        with throwaway_database(db_url, prefix="nl_replay", keep=keep_db) as dsn:
+            config.DATABASE_URL = dsn
+            crawler = NairalandCrawler()
+            crawler.stop_when_idle = True
+            if not use_browser:
+                crawler.browser = HttpBrowser(server.url)
+            if seeds:
+                for url in seeds: crawler.db.add_urls([url], url_type=get_url_type(url))
+                crawler.db.flush()
+            start = time.perf_counter()
+            try:
+                crawler.start()
+            finally:
+                #NOTE: Includes draining the pipeline and the last flush, that is crawl work too
+                crawler.shutdown()
+            elapsed = time.perf_counter() - start
+            db_calls = {name: st["calls"] for name, st in crawler.db.pool.stats.items()}
+    finally:
+        server.stop()
+
+    stages = {}
+    for key, counts in STAGE_SECONDS.series.items():
+        name = "/".join(str(v) for _, v in key)
+        stages[name] = round(counts[-1], 3)
+    pages = _total(PAGES, outcome="completed")
+    posts = _total(POSTS)
+    round_trips = sum(db_calls.values())
+    per_page = max(pages, 1)
+    return {
+        "seconds": round(elapsed, 3),
+        "pages": int(pages),
+        "pages_per_s": round(pages / elapsed, 2),
+        "posts": int(posts),
+        "posts_per_s": round(posts / elapsed, 2),
+        "fetches": sum(server.fetches.values()),
+        "duplicate_fetches": server.duplicate_fetches(),
+        "missing_pages": server.missing,
+        "page_errors": int(_total(PAGES, outcome="error")),
+        "db_round_trips": round_trips,
+        "db_round_trips_per_page": round(round_trips / per_page, 2),
+        "db_by_statement": {name: round(calls / per_page, 2)
+                            for name, calls in sorted(db_calls.items(), key=lambda kv: -kv[1])},
+        #INFO: Seconds per crawl stage summed over the run, the fetch stages overlap parse and store
+        "stage_seconds": dict(sorted(stages.items(), key=lambda kv: -kv[1])),
+    }
+
+
+def compare(old_path, new):
+    old = json.loads(Path(old_path).read_text())["replay"]
+    print(f"\nChange vs {old_path}:")
+    for metric in ("pages_per_s", "posts_per_s", "duplicate_fetches", "db_round_trips_per_page"):
+        before = old.get(metric)
+        if before:
+            print(f"  {metric:26s} {before:>9} -> {new[metric]:<9} {(new[metric] - before) / before:+.1%}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay a recorded site snapshot through the crawler at full speed")
+    ap.add_argument("--archive", help="raw HTML archive to serve, defaults to the fixture corpus")
+    ap.add_argument("--since", help="only archive fetches at or after this ISO time")
+    ap.add_argument("--db-url", default=os.getenv("BENCH_DATABASE_URL", ""),
+                    help="Postgres server to create a throwaway replay database on")
+    ap.add_argument("--keep-db", action="store_true", help="leave the replay database in place for inspection")
+    ap.add_argument("--no-browser", action="store_true", help="fetch over plain HTTP instead of Chromium")
+    ap.add_argument("--seed", action="append", help="start URL(s), defaults to the crawler's own bootstrap")
+    ap.add_argument("--max-topics", type=int, default=0, help="stop after this many topic pages (0: drain)")
+    ap.add_argument("--parse-workers", type=int, help="override PARSE_WORKERS")
+    ap.add_argument("--server-delay-ms", type=float, default=0, help="added latency per page served")
+    ap.add_argument("--out", default=str(BENCH_DIR / "results" / f"replay-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"))
+    ap.add_argument("--compare", help="previous replay results JSON to diff against")
+    args = ap.parse_args()
+    if not args.db_url:
+        print("#WARN: A Postgres server is needed, pass --db-url or set BENCH_DATABASE_URL")
+        return 2
+
+    snapshot = archive_snapshot(Path(args.archive), args.since) if args.archive else fixture_snapshot()
+    print(f"#INFO: Replaying {len(snapshot.pages)} pages from {snapshot.source}")
+    results = run_replay(snapshot, args.db_url, use_browser=not args.no_browser, seeds=args.seed,
+                         max_topics=args.max_topics, parse_workers=args.parse_workers,
+                         server_delay=args.server_delay_ms / 1000, keep_db=args.keep_db)
+
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "snapshot": {"source": snapshot.source, "pages": len(snapshot.pages)},
+        "fetcher": "http" if args.no_browser else "browser",
+        "parse_workers": config.PARSE_WORKERS,
+        "replay": results,
+    }
+    print(f"#INFO: {results['pages']} pages in {results['seconds']:.1f}s: {results['pages_per_s']:.1f} pages/s, "
+          f"{results['posts_per_s']:.0f} posts/s")
+    print(f"#INFO: {results['fetches']} fetches, {results['duplicate_fetches']} duplicates, "
+          f"{results['missing_pages']} not in the snapshot, {results['page_errors']} errors")
+    top = ", ".join(f"{name} {calls}" for name, calls in list(results["db_by_statement"].items())[:6])
+    print(f"#INFO: {results['db_round_trips_per_page']} DB round trips per page ({top})")
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"#INFO: Results written to {out}")
+    if args.compare:
+        compare(args.compare, results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "src"))
+
+import config
+import parser as nl_parser
+
+FIXTURES = BENCH_DIR / "fixtures"
+
+#INFO: Parser and storage benchmarks over the checked-in fixture corpus.
+# Results are written as JSON so two runs can be diffed with --compare.
+
+def load_corpus():
+    manifest = json.loads((FIXTURES / "manifest.json").read_text())
+    return [(name, url, (FIXTURES / name).read_text(encoding="utf-8")) for name, url in manifest.items()]
+
+
+def _legacy(html):
+    return (sorted(nl_parser.extract_topic_links(html)),
+            sorted(nl_parser.extract_pagination_links(html)),
+            nl_parser.parse_topic_content(html))
+
+
+def check_parity(corpus):
+    #INFO: parse_page on every backend must agree with the legacy html.parser functions
+    mismatches = []
+    for backend in backends():
+        for name, url, html in corpus:
+            config.PARSER_BACKEND = 'html.parser'
+            expected = _legacy(html)
+            config.PARSER_BACKEND = backend
+            page = nl_parser.parse_page(html, url, url_type='topic')
+            got = (sorted(page["topic_links"]), sorted(page["pagination_links"]), page["posts"])
+            if got != expected:
+                mismatches.append(f"{backend}:{name}")
+    return mismatches
+
+
+def backends():
+    return ['html.parser'] + (['lxml'] if nl_parser.HAS_LXML else [])
+
+
+def _measure(fn, corpus, min_seconds):
+    pages = posts = rounds = 0
+    start = time.perf_counter()
+    while True:
+        for name, url, html in corpus:
+            result = fn(html, url)
+            pages += 1
+            posts += result
+        rounds += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds: break
+    tracemalloc.start()
+    for name, url, html in corpus:
+        fn(html, url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"pages": pages, "seconds": round(elapsed, 4), "pages_per_s": round(pages / elapsed, 2),
+            "posts_per_s": round(posts / elapsed, 2), "peak_mem_kb": peak // 1024}
+
+
+def bench_parser(corpus, min_seconds):
+    cases = {
+        "extract_topic_links": lambda html, url: (nl_parser.extract_topic_links(html), 0)[1],
+        "extract_pagination_links": lambda html, url: (nl_parser.extract_pagination_links(html), 0)[1],
+        "parse_topic_content": lambda html, url: len(nl_parser.parse_topic_content(html)),
+        "legacy_three_pass": lambda html, url: (nl_parser.extract_topic_links(html),
+                                                nl_parser.extract_pagination_links(html),
+                                                len(nl_parser.parse_topic_content(html)))[2],
+        "parse_page": lambda html, url: len(nl_parser.parse_page(html, url)["posts"]),
+    }
+    results = {}
+    for backend in backends():
+        config.PARSER_BACKEND = backend
+        for case, fn in cases.items():
+            results[f"{backend}/{case}"] = _measure(fn, corpus, min_seconds)
+            print(f"  {backend:12s} {case:26s} {results[f'{backend}/{case}']['pages_per_s']:>9.1f} pages/s")
+    config.PARSER_BACKEND = 'auto'
+    return results
+
+
+@contextmanager
+def throwaway_database(db_url, prefix="nl_bench", keep=False):
+    #INFO: Yields the DSN of a fresh database created next to db_url, dropped afterwards
+    import psycopg2
+    from psycopg2.extensions import make_dsn, parse_dsn
+
+    name = f"{prefix}_{os.getpid()}"
+    admin = psycopg2.connect(db_url)
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f"CREATE DATABASE {name}")
+    try:
+        yield make_dsn(**{**parse_dsn(db_url), "dbname": name})
+    finally:
+        if keep:
+            print(f"#NOTE: Kept database {name}")
+        else:
+            with admin.cursor() as cur:
+                cur.execute(f"DROP DATABASE IF EXISTS {name}")
+        admin.close()
+
+
+def bench_database(db_url, corpus, rows):
+    #INFO: Runs against a throwaway database created next to db_url and dropped afterwards
+    from database import DatabaseManager
+
+    results = {}
+    with throwaway_database(db_url) as dsn:
+        db = DatabaseManager(dsn, flush_rows=rows + 1, flush_seconds=3600)
+        sample = [p for _, url, html in corpus for p in nl_parser.parse_page(html, url)["posts"]]
+        posts = [{**sample[i % len(sample)], "post_id": str(i), "topic_id": "7901234",
+                  "source_url": "https://www.nairaland.com/7901234"} for i in range(rows)]
+        urls = [f"https://www.nairaland.com/{7000000 + i}/bench-topic" for i in range(rows)]
+
+        start = time.perf_counter()
+        for i in range(0, rows, 100):
+            db.save_posts(posts[i:i + 100])
+        db.flush()
+        elapsed = time.perf_counter() - start
+        results["insert_posts"] = {"rows": rows, "seconds": round(elapsed, 4), "rows_per_s": round(rows / elapsed, 1)}
+
+        start = time.perf_counter()
+        for i in range(0, rows, 80):
+            db.add_urls(urls[i:i + 80], url_type='topic')
+        db.flush()
+        elapsed = time.perf_counter() - start
+        results["add_urls"] = {"rows": rows, "seconds": round(elapsed, 4), "rows_per_s": round(rows / elapsed, 1)}
+
+        start = time.perf_counter()
+        claimed = 0
+        while True:
+            batch = db.claim_batch("bench", 50, url_type='topic')
+            if not batch: break
+            claimed += len(batch)
+            for url, _, _ in batch:
+                db.mark_url_completed(url, "bench")
+        elapsed = time.perf_counter() - start
+        results["claim_and_complete"] = {"rows": claimed, "seconds": round(elapsed, 4),
+                                         "rows_per_s": round(claimed / elapsed, 1)}
+        for name, r in results.items():
+            print(f"  {name:26s} {r['rows_per_s']:>9.1f} rows/s")
+        db.close()
+    return results
+
+
+def compare(old_path, new):
+    old = json.loads(Path(old_path).read_text())
+    print(f"\nChange vs {old_path}:")
+    for section, metric in (("parser", "pages_per_s"), ("database", "rows_per_s")):
+        for case, r in new.get(section, {}).items():
+            before = old.get(section, {}).get(case, {}).get(metric)
+            if before:
+                print(f"  {section}/{case:36s} {(r[metric] - before) / before:+.1%}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Parser and storage benchmarks")
+    ap.add_argument("--seconds", type=float, default=2.0, help="minimum run time per parser case")
+    ap.add_argument("--db-url", default=os.getenv("BENCH_DATABASE_URL", ""),
+                    help="Postgres server to create a throwaway benchmark database on")
+    ap.add_argument("--rows", type=int, default=5000)
+    ap.add_argument("--out", default=str(BENCH_DIR / "results" / f"bench-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"))
+    ap.add_argument("--compare", help="previous results JSON to diff against")
+    args = ap.parse_args()
+
+    corpus = load_corpus()
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "corpus": {"pages": len(corpus), "bytes": sum(len(h) for _, _, h in corpus)},
+    }
+    mismatches = check_parity(corpus)
+    report["parity_mismatches"] = mismatches
+    print(f"#INFO: parse_page parity: {'OK' if not mismatches else 'MISMATCH ' + ', '.join(mismatches)}")
+
+    print("#INFO: Parser throughput")
+    report["parser"] = bench_parser(corpus, args.seconds)
+    if args.db_url:
+        print("#INFO: Database throughput")
+        report["database"] = bench_database(args.db_url, corpus, args.rows)
+    else:
+        print("#NOTE: No --db-url / BENCH_DATABASE_URL, skipping database benchmarks")
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"#INFO: Results written to {out}")
+    if args.compare:
+        compare(args.compare, report)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#INFO: Raw HTML archive. Pages are stored content-addressed (sha256 of the HTML) as
+# independently compressed frames appended to large segment files; a JSONL index per
+# writer maps (url, fetched_at) to (segment, offset, length). Each replica writes its
+# own segments and index, so writers never share a file on the data volume.
+# Deduplication looks digests up in small per-writer sqlite files instead of holding
+# every index entry in memory.
+
+SEGMENT_BYTES = 256 * 1024 * 1024
+BLOB_FIELDS = ("sha256", "segment", "offset", "length", "codec", "raw_size")
+
+
+def _compress(data: bytes, level: int) -> Tuple[bytes, str]:
+    if zstandard:
+        return zstandard.ZstdCompressor(level=level).compress(data), "zstd"
+    return zlib.compress(data, 6), "zlib"
+
+
+def _decompress(blob: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if not zstandard:
+            raise RuntimeError("zstandard is required to read zstd archive segments")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return zlib.decompress(blob)
+
+
+class PageArchive:
+    def __init__(self, root: Path, writer_id: str, level: int = 10, segment_bytes: int = SEGMENT_BYTES):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.writer_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in writer_id)
+        self.level = level
+        self.segment_bytes = segment_bytes
+        self.index_path = self.root / f"index-{self.writer_id}.jsonl"
+        self.digest_path = self.root / f"digests-{self.writer_id}.sqlite"
+        self._lock = threading.Lock()
+        #INFO: sha256 -> location on disk; this writer's own digests are read-write, the
+        # other replicas' are opened read-only so identical pages are still stored once
+        self._digests = self._open_digests()
+        self._peer_digests: Dict[str, sqlite3.Connection] = {}
+        self._scan_peers()
+        self._segment_no = len(list(self.root.glob(f"seg-{self.writer_id}-*")))
+        self._segment = None
+        self.stats = {"pages": 0, "stored": 0, "raw_bytes": 0, "stored_bytes": 0}
+
+    def _open_digests(self):
+        fresh = not self.digest_path.exists()
+        db = sqlite3.connect(self.digest_path, check_same_thread=False)
+        #NOTE: A digest lost in a crash only costs one duplicate blob, not worth an fsync per page
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("PRAGMA synchronous = OFF")
+        db.execute("""CREATE TABLE IF NOT EXISTS blobs (sha256 TEXT PRIMARY KEY, segment TEXT, "offset" INTEGER,
+                      length INTEGER, codec TEXT, raw_size INTEGER)""")
+        if fresh and self.index_path.exists():
+            #INFO: Archives written before the digest files existed are indexed once, streaming
+            db.executemany("INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?, ?, ?)",
+                           (tuple(entry[k] for k in BLOB_FIELDS) for entry in _iter_index_file(self.index_path)))
+        db.commit()
+        return db
+
+    def _scan_peers(self):
+        #INFO: Replicas started after this one show up on the next scan, one that failed a
+        # read is dropped and opened again here
+        for path in sorted(self.root.glob("digests-*.sqlite")):
+            if path.name == self.digest_path.name or path.name in self._peer_digests: continue
+            try:
+                self._peer_digests[path.name] = sqlite3.connect(f"file:{path}?mode=ro", uri=True,
+                                                                check_same_thread=False)
+            except sqlite3.Error as e:
+                print(f"    #WARN: Could not open archive digests {path.name}: {str(e)[:80]}")
+
+    def _lookup(self, digest: str) -> Optional[Dict]:
+        row = self._digests.execute("SELECT * FROM blobs WHERE sha256 = ?", (digest,)).fetchone()
+        if row: return dict(zip(BLOB_FIELDS, row))
+        for name, db in list(self._peer_digests.items()):
+            try:
+                row = db.execute("SELECT * FROM blobs WHERE sha256 = ?", (digest,)).fetchone()
+            except sqlite3.Error as e:
+                print(f"    #WARN: Dropping archive digests {name} until the next scan: {str(e)[:80]}")
+                db.close()
+                del self._peer_digests[name]
+                continue
+            if row: return dict(zip(BLOB_FIELDS, row))
+        return None
+
+    def _segment_handle(self):
+        if self._segment is None or self._segment.tell() >= self.segment_bytes:
+            if self._segment:
+                self._segment.close()
+                self._scan_peers()
+            self._segment_no += 1
+            name = f"seg-{self.writer_id}-{self._segment_no:05d}.bin"
+            self._segment = open(self.root / name, "ab")
+        return self._segment
+
+    def put(self, url: str, html: str, fetched_at: Optional[datetime.datetime] = None) -> str:
+        data = html.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        fetched_at = (fetched_at or datetime.datetime.utcnow()).isoformat(timespec="seconds")
+        with self._lock:
+            location = self._lookup(digest)
+            if location is None:
+                blob, codec = _compress(data, self.level)
+                segment = self._segment_handle()
+                offset = segment.tell()
+                segment.write(blob)
+                segment.flush()
+                location = {"sha256": digest, "segment": Path(segment.name).name, "offset": offset,
+                            "length": len(blob), "codec": codec, "raw_size": len(data)}
+                self._digests.execute("INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?, ?, ?)",
+                                      tuple(location[k] for k in BLOB_FIELDS))
+                self._digests.commit()
+                self.stats["stored"] += 1
+                self.stats["stored_bytes"] += len(blob)
+            entry = {"url": url, "fetched_at": fetched_at, **{k: location[k] for k in BLOB_FIELDS}}
+            with open(self.index_path, "a", encoding="utf-8") as index:
+                index.write(json.dumps(entry) + "\n")
+            self.stats["pages"] += 1
+            self.stats["raw_bytes"] += len(data)
+        return digest
+
+    def close(self):
+        with self._lock:
+            if self._segment:
+                self._segment.close()
+                self._segment = None
+            for db in [self._digests, *self._peer_digests.values()]:
+                db.close()
+            self._peer_digests = {}
+
+
+def _iter_index_file(index_path: Path) -> Iterator[Dict]:
+    with open(index_path, "r", encoding="utf-8") as index:
+        for line in index:
+            line = line.strip()
+            if not line: continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                #NOTE: A writer killed mid-append leaves a torn last line
+                continue
+
+
+def iter_index(root: Path) -> Iterator[Dict]:
+    for index_path in sorted(Path(root).glob("index-*.jsonl")):
+        yield from _iter_index_file(index_path)
+
+
+def latest_entries(root: Path, since: Optional[str] = None) -> Dict[str, Dict]:
+    #INFO: Most recent fetch per URL; ISO timestamps compare correctly as strings
+    latest = {}
+    for entry in iter_index(root):
+        if since and entry["fetched_at"] < since: continue
+        current = latest.get(entry["url"])
+        if current is None or entry["fetched_at"] >= current["fetched_at"]:
+            latest[entry["url"]] = entry
+    return latest
+
+
+def read_entry(root: Path, entry: Dict) -> str:
+    with open(os.path.join(root, entry["segment"]), "rb") as segment:
+        segment.seek(entry["offset"])
+        blob = segment.read(entry["length"])
+    return _decompress(blob, entry["codec"]).decode("utf-8")
+
+
+def latest_fetches(root: Path, since: Optional[str] = None) -> Dict[str, Tuple[str, str]]:
+    #INFO: url -> (fetched_at, sha256) of its most recent fetch, without keeping the entries
+    # themselves; the digest tells apart two fetches within the same second
+    latest = {}
+    for entry in iter_index(root):
+        fetched_at = entry["fetched_at"]
+        if since and fetched_at < since: continue
+        if fetched_at >= latest.get(entry["url"], ("",))[0]:
+            latest[entry["url"]] = (fetched_at, entry["sha256"])
+    return latest
+
+
+def iter_latest(root: Path, latest: Dict[str, Tuple[str, str]]) -> Iterator[Dict]:
+    #INFO: Second pass over the index, yields the entry of each URL's latest fetch once.
+    # Consumes the mapping as it goes
+    for entry in iter_index(root):
+        if latest.get(entry["url"]) == (entry["fetched_at"], entry["sha256"]):
+            del latest[entry["url"]]
+            yield entry
@@ -0,0 +1,78 @@
+import argparse
+import datetime
+import os
+import sys
+import time
+
+import psycopg2
+from database import DatabaseManager
+from parser import parse_post_time, _resolve_post_time
+import config
+
+#INFO: One-off fill of posts.posted_at for rows stored before it was parsed at ingest.
+# Relative and year-less times resolve against each row's scraped_at, the closest thing
+# to a fetch time those rows have. Display strings repeat heavily, so the parser's cache
+# absorbs most of the work and the cost is dominated by the batched UPDATEs.
+
+UPDATE_POSTED_SQL = """
+    UPDATE posts SET posted_at = v.posted_at::timestamptz
+    FROM (VALUES %s) AS v (post_id, posted_at)
+    WHERE posts.post_id = v.post_id AND posts.posted_at IS NULL
+"""
+
+
+def run_backfill(batch_rows=5000, dry_run=False):
+    db = DatabaseManager(config.DATABASE_URL)
+    reader = psycopg2.connect(config.DATABASE_URL, connect_timeout=20)
+    start = time.time()
+    scanned = filled = unparsed = 0
+    batch = []
+
+    def write():
+        if not dry_run and batch:
+            db._execute_with_retry(UPDATE_POSTED_SQL, values=batch)
+        batch.clear()
+
+    try:
+        with reader.cursor(name='backfill_posted_at') as cur:
+            cur.itersize = 20000
+            #NOTE: scraped_at is a naive timestamp in the server's zone, the cast makes it absolute
+            cur.execute("""
+                SELECT post_id, post_time, scraped_at::timestamptz FROM posts
+                WHERE posted_at IS NULL AND COALESCE(post_time, '') <> ''
+            """)
+            for post_id, post_time, scraped_at in cur:
+                scanned += 1
+                posted_at = parse_post_time(post_time, scraped_at or datetime.datetime.now(datetime.timezone.utc))
+                if posted_at is None:
+                    unparsed += 1
+                    if unparsed <= 5:
+                        print(f"  #NOTE: Unrecognised post time {post_time!r} on post {post_id}")
+                    continue
+                filled += 1
+                batch.append((post_id, posted_at.isoformat()))
+                if len(batch) >= batch_rows:
+                    write()
+                if scanned % 100000 == 0:
+                    print(f"  #INFO: {scanned} posts scanned, {filled} dated "
+                          f"({scanned / max(time.time() - start, 1e-6):.0f} rows/s)")
+        write()
+        reader.commit()
+    finally:
+        reader.close()
+        db.close()
+
+    cache = _resolve_post_time.cache_info()
+    hit_rate = cache.hits / max(cache.hits + cache.misses, 1)
+    print(f"#INFO: {'Would date' if dry_run else 'Dated'} {filled}/{scanned} posts in {time.time() - start:.1f}s, "
+          f"{unparsed} unrecognised, parser cache hit rate {hit_rate:.1%}")
+
+
+if __name__ == "__main__":
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(current_dir)
+    ap = argparse.ArgumentParser(description="Fill posts.posted_at from the stored post_time text")
+    ap.add_argument("--batch-rows", type=int, default=5000)
+    ap.add_argument("--dry-run", action="store_true", help="parse and report without writing")
+    args = ap.parse_args()
+    run_backfill(batch_rows=args.batch_rows, dry_run=args.dry_run)
@@ -1,7 +1,20 @@
-from playwright.sync_api import sync_playwright, Page, BrowserContext
+from playwright.sync_api import sync_playwright, Page, BrowserContext, Route, Request
 from playwright_stealth import stealth_sync
+from collections import Counter
+from typing import Dict, List, Optional
+import os
+import shutil
+import tempfile
 import time
 import random
+import config
+from parser import get_url_type
+from metrics import REGISTRY, stage, CF_BLOCKS
+
+BROWSER_RSS = REGISTRY.gauge("browser_rss_bytes", "Resident memory of the Chromium process tree")
+BROWSER_PROFILE = REGISTRY.gauge("browser_profile_bytes", "Size of the browser user_data_dir on disk")
+BROWSER_NAVIGATIONS = REGISTRY.gauge("browser_navigations", "Navigations since the browser context was launched")
+BROWSER_RECYCLES = REGISTRY.counter("browser_recycles_total", "Browser context restarts by reason")
 
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -10,16 +23,148 @@ USER_AGENTS = [
     "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
 ]
 
+class ResourceFilter:
+    #INFO: Aborts subresources we never read. Only page.content() matters to the crawler,
+    # so images, fonts, media and ad/tracker scripts are pure egress and render time
+    def __init__(self, block_types: List[str], block_patterns: List[str], allow_patterns: List[str]):
+        self.block_types = set(block_types)
+        self.block_patterns = block_patterns
+        self.allow_patterns = allow_patterns
+        self.totals = {"requests": 0, "blocked": 0, "bytes_loaded": 0}
+        self._page = self._empty_stats()
+
+    def _empty_stats(self) -> Dict:
+        return {"requests": 0, "blocked": 0, "bytes_loaded": 0, "blocked_by_type": Counter()}
+
+    def should_block(self, url: str, resource_type: str) -> bool:
+        if any(p in url for p in self.allow_patterns):
+            return False
+        return resource_type in self.block_types or any(p in url for p in self.block_patterns)
+
+    def handle_route(self, route: Route):
+        request = route.request
+        self._page["requests"] += 1
+        self.totals["requests"] += 1
+        if self.should_block(request.url, request.resource_type):
+            self._page["blocked"] += 1
+            self._page["blocked_by_type"][request.resource_type] += 1
+            self.totals["blocked"] += 1
+            route.abort()
+        else:
+            route.continue_()
+
+    def handle_request_finished(self, request: Request):
+        #NOTE: Aborted requests never finish, so this counts what was actually loaded.
+        # content-length is missing on chunked and compressed responses, the sizes are
+        # what went over the wire (body as transferred plus headers)
+        try:
+            sizes = request.sizes()
+            size = sizes["responseBodySize"] + sizes["responseHeadersSize"]
+        except Exception:
+            size = 0
+        self._page["bytes_loaded"] += max(size, 0)
+        self.totals["bytes_loaded"] += max(size, 0)
+
+    def take_page_stats(self) -> Dict:
+        stats, self._page = self._page, self._empty_stats()
+        return stats
+
+
+def replay_target(url: str, replay_url: str) -> Optional[str]:
+    #INFO: Where a site URL is served from during a replay run, None for third-party URLs
+    scheme, _, rest = url.partition("://")
+    host, _, path = rest.partition("/")
+    if not scheme.startswith("http") or not host.endswith("nairaland.com"):
+        return None
+    return f"{replay_url.rstrip('/')}/{path}"
+
+
+def _browser_tree_rss(user_data_dir: str) -> int:
+    #INFO: Sum of VmRSS over the Chromium browser process and every descendant, read from
+    # /proc. Chromium runs one renderer process per page plus GPU/utility helpers, so the
+    # browser's own RSS says little. The browser is found by its --user-data-dir flag,
+    # which is unique per context; the parse pool and the Playwright driver are not counted.
+    # Returns 0 where /proc is unavailable
+    children: Dict[int, List[int]] = {}
+    parent: Dict[int, int] = {}
+    rss: Dict[int, int] = {}
+    flag = f"--user-data-dir={user_data_dir}".encode()
+    browsers = set()
+    try:
+        pids = [int(p) for p in os.listdir("/proc") if p.isdigit()]
+    except OSError:
+        return 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                ppid = kb = 0
+                for line in f:
+                    if line.startswith("PPid:"): ppid = int(line.split()[1])
+                    elif line.startswith("VmRSS:"): kb = int(line.split()[1])
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                if flag in f.read().split(b"\0"): browsers.add(pid)
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(pid)
+        parent[pid] = ppid
+        rss[pid] = kb * 1024
+    #NOTE: Some helpers inherit the flag, only the topmost flagged process is a root
+    total = 0
+    stack = [pid for pid in browsers if parent.get(pid) not in browsers]
+    while stack:
+        pid = stack.pop()
+        total += rss.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
 class BrowserManager:
-    def __init__(self, headless: bool = True):
+    #INFO: One persistent context at a time. recycle() replaces it with a fresh one in a new
+    # profile directory, carrying the cookies (and with them the Cloudflare clearance) across
+    def __init__(self, headless: bool = True, resource_filter: Optional[ResourceFilter] = None,
+                 recycle_navigations: int = 0, max_rss_mb: int = 0, max_profile_mb: int = 0,
+                 check_every: int = 10, profile_dir: str = "", replay_url: str = ""):
         self.headless = headless
         self.playwright = None
         self.browser = None
         self.context = None
-        self.user_data_dir = "/tmp/playwright_user_data"
+        self.page = None
+        #NOTE: A fixed profile path was shared by every run and only ever grew, each run
+        # now starts from an empty directory under profile_dir (or the system temp dir)
+        self.profile_root = profile_dir or None
+        self.user_data_dir = None
+        if resource_filter is None and config.BLOCK_RESOURCES:
+            resource_filter = ResourceFilter(
+                config.BLOCK_RESOURCE_TYPES, config.BLOCK_URL_PATTERNS, config.ALLOW_URL_PATTERNS
+            )
+        #NOTE: A replay run never leaves the local snapshot server, there is nothing to filter
+        self.replay_url = replay_url
+        self.resource_filter = None if replay_url else resource_filter
+        self.recycle_navigations = recycle_navigations
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.max_profile = max_profile_mb * 1024 * 1024
+        self.check_every = max(check_every, 1)
+        self.navigations = 0
+        self.recycles = 0
 
     def __enter__(self) -> Page:
         self.playwright = sync_playwright().start()
+        return self._launch()
+
+    def _launch(self, cookies: Optional[List[Dict]] = None) -> Page:
+        if self.profile_root: os.makedirs(self.profile_root, exist_ok=True)
+        self.user_data_dir = tempfile.mkdtemp(prefix="playwright_user_data_", dir=self.profile_root)
         
         #INFO: Launching persistent context to maintain challenge state
         self.context = self.playwright.chromium.launch_persistent_context(
@@ -31,9 +176,19 @@ class BrowserManager:
                 "--disable-blink-features=AutomationControlled",
                 "--no-sandbox",
                 "--disable-setuid-sandbox",
+                #NOTE: Docker's 64MB /dev/shm makes renderers crash under memory pressure
+                "--disable-dev-shm-usage",
             ]
         )
+        if cookies:
+            self.context.add_cookies(cookies)
         
+        if self.replay_url:
+            self.context.route("**/*", self._route_replay)
+        elif self.resource_filter:
+            self.context.route("**/*", self.resource_filter.handle_route)
+            self.context.on("requestfinished", self.resource_filter.handle_request_finished)
+
         page = self.context.pages[0] if self.context.pages else self.context.new_page()
         stealth_sync(page)
         
@@ -41,10 +196,76 @@ class BrowserManager:
             Object.defineProperty(navigator, 'webdriver', { get: () => undefined });
         """)
         
+        self.page = page
+        self.navigations = 0
+        BROWSER_NAVIGATIONS.set(0)
         return page
 
+    def _route_replay(self, route: Route):
+        #INFO: The page keeps its real URL, so parsing and URL keys behave exactly as live;
+        # only the bytes come from the snapshot server
+        target = replay_target(route.request.url, self.replay_url)
+        if target is None:
+            route.abort()
+            return
+        try:
+            route.fulfill(response=route.fetch(url=target))
+        except Exception as e:
+            print(f"    #WARN: Replay fetch failed for {route.request.url}: {str(e)[:80]}")
+            route.abort()
+
+    def _close_context(self):
+        if self.context:
+            try:
+                self.context.close()
+            except Exception as e:
+                print(f"    #WARN: Browser context did not close cleanly: {str(e)[:80]}")
+            self.context = None
+        if self.user_data_dir:
+            shutil.rmtree(self.user_data_dir, ignore_errors=True)
+            self.user_data_dir = None
+
+    def recycle(self, reason: str) -> Page:
+        #INFO: Only called between navigations. Fetched pages travel down the pipeline as
+        # HTML strings, so nothing in flight holds on to the old page
+        cookies = []
+        try:
+            cookies = self.context.cookies()
+        except Exception as e:
+            print(f"    #WARN: Could not carry cookies over: {str(e)[:80]}")
+        print(f"#INFO: Recycling browser after {self.navigations} navigations ({reason}), keeping {len(cookies)} cookies")
+        self._close_context()
+        self.recycles += 1
+        BROWSER_RECYCLES.inc(reason=reason)
+        return self._launch(cookies)
+
+    def check_health(self) -> Optional[str]:
+        #INFO: Returns the reason the context should be recycled, or None
+        if self.recycle_navigations and self.navigations >= self.recycle_navigations:
+            return "navigations"
+        if self.navigations % self.check_every:
+            return None
+        rss = _browser_tree_rss(self.user_data_dir) if self.user_data_dir else 0
+        profile = _dir_size(self.user_data_dir) if self.user_data_dir else 0
+        BROWSER_RSS.set(rss)
+        BROWSER_PROFILE.set(profile)
+        if self.max_rss and rss > self.max_rss:
+            return "rss"
+        if self.max_profile and profile > self.max_profile:
+            return "profile"
+        return None
+
+    def after_navigation(self) -> Page:
+        #INFO: Call once per fetched URL; returns the page to use for the next one
+        self.navigations += 1
+        BROWSER_NAVIGATIONS.set(self.navigations)
+        reason = self.check_health()
+        if reason:
+            return self.recycle(reason)
+        return self.page
+
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.context: self.context.close()
+        self._close_context()
         if self.playwright: self.playwright.stop()
 
 
@@ -135,32 +356,66 @@ def wait_for_cloudflare(page: Page, max_wait: int = 180):
     return False
 
 
+#INFO: Per page type, the element that carries what the parser reads. The page counts as
+# ready once that element exists and the document has finished parsing, or once it has
+# fully loaded whatever it contains (challenge, error and empty pages never match)
+READY_SELECTORS = {
+    "topic": "table[summary='posts']",
+    "listing": "table[summary='links'], table.boards, td.featured",
+}
+
+READY_JS = """
+    (selector) => document.readyState === 'complete'
+        || (document.readyState === 'interactive' && document.querySelector(selector) !== null)
+"""
+
+
+def wait_until_ready(page: Page, url_type: str, timeout: int):
+    selector = READY_SELECTORS.get(url_type, "body")
+    try:
+        page.wait_for_function(READY_JS, arg=selector, timeout=timeout, polling=100)
+        return True
+    except Exception:
+        return False
+
+
 def human_delay():
     time.sleep(random.uniform(2.0, 5.0))
 
 
-def safe_goto(page: Page, url: str, timeout: int = 60000, is_first_request: bool = False):
+def safe_goto(page: Page, url: str, timeout: int = 60000, is_first_request: bool = False, delay: bool = True,
+              url_type: Optional[str] = None, ready_timeout: Optional[int] = None):
+    #NOTE: delay=False when the caller already paces requests (rate_limit.RateController)
     print(f"    #INFO: Navigating to {url}")
     
-    if not is_first_request:
-        human_delay()
+    if delay and not is_first_request:
+        with stage('human_delay'):
+            human_delay()
     
+    url_type = url_type or get_url_type(url)
+    ready_timeout = ready_timeout if ready_timeout is not None else config.READY_TIMEOUT_MS
     try:
-        page.goto(url, wait_until="commit", timeout=timeout)
-        time.sleep(2)
+        with stage('goto'):
+            page.goto(url, wait_until="commit", timeout=timeout)
     except Exception as e:
         print(f"    #WARN: Navigation issue: {str(e)[:50]}")
     
+    #INFO: One deadline for the whole readiness wait, content is taken as soon as the
+    # page type's target DOM is in place
+    with stage('ready_wait', type=url_type):
+        ready = wait_until_ready(page, url_type, ready_timeout)
+    
     title = page.title()
     if "Just a moment" in title or "Checking your browser" in title:
-        success = wait_for_cloudflare(page, max_wait=180)
+        CF_BLOCKS.inc(source='challenge')
+        with stage('cloudflare_wait'):
+            success = wait_for_cloudflare(page, max_wait=180)
         if not success:
             return page.content()
+        with stage('ready_wait', type=url_type):
+            ready = wait_until_ready(page, url_type, ready_timeout)
     
-    try:
-        page.wait_for_selector("body", timeout=10000)
-        page.wait_for_selector("#up, .topictitle, table[summary='posts']", timeout=10000)
-    except:
-        pass
-    
-    return page.content()
+    if not ready:
+        print(f"    #NOTE: {url_type} page not ready after {ready_timeout}ms, taking what has loaded")
+    with stage('content'):
+        return page.content()
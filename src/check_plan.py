@@ -0,0 +1,19 @@
+from database import DatabaseManager
+import config
+
+def check_plan():
+    db = DatabaseManager(config.DATABASE_URL)
+    print(f"Schema version: {db.schema_version()}")
+    for url_type in ['listing', 'topic']:
+        uses_index, nodes = db.explain_refill(url_type)
+        if not uses_index:
+            #NOTE: Small tables are cheaper to seq scan, check the index is at least usable
+            forced, nodes = db.explain_refill(url_type, disable_seqscan=True)
+            print(f"[{url_type}] planner chose a seq scan, index usable when forced: {forced}")
+        else:
+            print(f"[{url_type}] refill uses index")
+        for node_type, index_name in nodes:
+            print(f"    {node_type}" + (f" on {index_name}" if index_name else ""))
+
+if __name__ == "__main__":
+    check_plan()
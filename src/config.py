@@ -11,6 +11,109 @@ BASE_URL: str = os.getenv("BASE_URL", "https://www.nairaland.com")
 HEADLESS: bool = os.getenv("HEADLESS", "false").lower() == "true"
 CRAWL_DELAY: float = float(os.getenv("CRAWL_DELAY", "12.0"))
 MAX_TOPICS: int = int(os.getenv("MAX_TOPICS", "50000"))
+STARTUP_JITTER_SECONDS: float = float(os.getenv("STARTUP_JITTER_SECONDS", "5"))
+IDLE_SLEEP_SECONDS: float = float(os.getenv("IDLE_SLEEP_SECONDS", "30"))
+
+#INFO: Replay: the browser sends every site request to this local snapshot server instead
+# (bench/replay.py). Third-party requests are aborted
+REPLAY_URL: str = os.getenv("REPLAY_URL", "")
+
+#INFO: BeautifulSoup tree builder: auto (lxml if installed), lxml or html.parser
+PARSER_BACKEND: str = os.getenv("PARSER_BACKEND", "auto")
+
+#INFO: Browser request policy. Cloudflare challenge assets are always let through
+def _csv(name: str, default: str) -> list:
+    return [item.strip() for item in os.getenv(name, default).split(",") if item.strip()]
+
+BLOCK_RESOURCES: bool = os.getenv("BLOCK_RESOURCES", "true").lower() == "true"
+BLOCK_RESOURCE_TYPES: list = _csv("BLOCK_RESOURCE_TYPES", "image,media,font")
+BLOCK_URL_PATTERNS: list = _csv(
+    "BLOCK_URL_PATTERNS",
+    "googlesyndication.com,doubleclick.net,google-analytics.com,googletagmanager.com,"
+    "adservice.google,amazon-adsystem.com,facebook.net,scorecardresearch.com,quantserve.com",
+)
+ALLOW_URL_PATTERNS: list = _csv("ALLOW_URL_PATTERNS", "challenges.cloudflare.com,/cdn-cgi/")
+
+#INFO: Longest wait, after navigation commits, for the page type's content to be in the DOM
+READY_TIMEOUT_MS: int = int(os.getenv("READY_TIMEOUT_MS", "10000"))
+
+#INFO: Browser recycling: restart the context (cookies kept) after N navigations or when the
+# Chromium process tree / profile directory outgrow these limits. 0 disables a limit
+BROWSER_RECYCLE_NAVIGATIONS: int = int(os.getenv("BROWSER_RECYCLE_NAVIGATIONS", "500"))
+BROWSER_MAX_RSS_MB: int = int(os.getenv("BROWSER_MAX_RSS_MB", "1500"))
+BROWSER_MAX_PROFILE_MB: int = int(os.getenv("BROWSER_MAX_PROFILE_MB", "300"))
+BROWSER_CHECK_EVERY: int = int(os.getenv("BROWSER_CHECK_EVERY", "10"))
+BROWSER_PROFILE_DIR: str = os.getenv("BROWSER_PROFILE_DIR", "")
+
+#INFO: Crawl pipeline: parse processes (0 parses on the writer thread) and fetched pages in flight
+PARSE_WORKERS: int = int(os.getenv("PARSE_WORKERS", "2"))
+PIPELINE_DEPTH: int = int(os.getenv("PIPELINE_DEPTH", "8"))
+
+#INFO: Write-behind buffer for posts and discovered URLs
+DB_FLUSH_ROWS: int = int(os.getenv("DB_FLUSH_ROWS", "500"))
+DB_FLUSH_SECONDS: float = float(os.getenv("DB_FLUSH_SECONDS", "5.0"))
+
+#INFO: Pooled database sessions; hot statements are server-side prepared per connection
+DB_POOL_MIN: int = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX: int = int(os.getenv("DB_POOL_MAX", "4"))
+DB_PREPARE: bool = os.getenv("DB_PREPARE", "true").lower() == "true"
+
+#INFO: How long a schema migration waits for a table lock before giving up (Postgres interval)
+MIGRATION_LOCK_TIMEOUT: str = os.getenv("MIGRATION_LOCK_TIMEOUT", "60s")
+
+#INFO: Work claims expire after this many seconds and are returned to the frontier
+LEASE_SECONDS: int = int(os.getenv("LEASE_SECONDS", "3600"))
+
+#INFO: Frontier sharding: replicas heartbeat into the workers table and split the URL shards
+# between the live ones; a replica missing heartbeats for WORKER_TTL_SECONDS is dropped
+SHARDING: bool = os.getenv("SHARDING", "true").lower() == "true"
+WORKER_HEARTBEAT_SECONDS: float = float(os.getenv("WORKER_HEARTBEAT_SECONDS", "30"))
+WORKER_TTL_SECONDS: float = float(os.getenv("WORKER_TTL_SECONDS", "180"))
+SHARD_VNODES: int = int(os.getenv("SHARD_VNODES", "128"))
+
+#INFO: Failed URLs are retried with exponential backoff and jitter, then dead-lettered
+RETRY_MAX_ATTEMPTS: int = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS: float = float(os.getenv("RETRY_BASE_SECONDS", "300"))
+RETRY_MAX_SECONDS: float = float(os.getenv("RETRY_MAX_SECONDS", str(6 * 3600)))
+RETRY_BATCH: int = int(os.getenv("RETRY_BATCH", "100"))
+#INFO: Longest the crawler pauses after consecutive Cloudflare blocks
+CF_PAUSE_MAX: float = float(os.getenv("CF_PAUSE_MAX", "120"))
+
+#INFO: Request pacing: postgres (one AIMD token bucket shared by all replicas), local (same,
+# per process), fixed (one request per CRAWL_DELAY per process) or none (replay runs only).
+# Rates are requests/second
+RATE_LIMIT: str = os.getenv("RATE_LIMIT", "postgres")
+RATE_INITIAL: float = float(os.getenv("RATE_INITIAL", "0.25"))
+RATE_MIN: float = float(os.getenv("RATE_MIN", "0.02"))
+RATE_MAX: float = float(os.getenv("RATE_MAX", "1.0"))
+RATE_BURST: float = float(os.getenv("RATE_BURST", "2"))
+RATE_STEP: float = float(os.getenv("RATE_STEP", "0.02"))
+RATE_INTERVAL: float = float(os.getenv("RATE_INTERVAL", "30"))
+RATE_TARGET_LATENCY: float = float(os.getenv("RATE_TARGET_LATENCY", "8"))
+
+#INFO: In-process visited-URL cache (Bloom filter + LRU of recent statuses)
+URL_CACHE: bool = os.getenv("URL_CACHE", "true").lower() == "true"
+URL_CACHE_CAPACITY: int = int(os.getenv("URL_CACHE_CAPACITY", "1000000"))
+URL_CACHE_ERROR_RATE: float = float(os.getenv("URL_CACHE_ERROR_RATE", "0.001"))
+URL_CACHE_LRU_SIZE: int = int(os.getenv("URL_CACHE_LRU_SIZE", "100000"))
+
+#INFO: Frontier priority: hours of discovery freshness one point of page value is worth
+PRIORITY_HOURS_PER_POINT: float = float(os.getenv("PRIORITY_HOURS_PER_POINT", "24"))
+
+#INFO: Topic recrawl: revisit bounds and the number of new replies a revisit should find
+RECRAWL_MIN_SECONDS: int = int(os.getenv("RECRAWL_MIN_SECONDS", "1800"))
+RECRAWL_MAX_SECONDS: int = int(os.getenv("RECRAWL_MAX_SECONDS", str(14 * 24 * 3600)))
+RECRAWL_TARGET_POSTS: int = int(os.getenv("RECRAWL_TARGET_POSTS", "20"))
+RECRAWL_BATCH: int = int(os.getenv("RECRAWL_BATCH", "20"))
+
+#INFO: Raw HTML archive (content-addressed, zstd segments) for offline re-parsing
+ARCHIVE_HTML: bool = os.getenv("ARCHIVE_HTML", "false").lower() == "true"
+ARCHIVE_DIR: Path = Path(os.getenv("ARCHIVE_DIR", str(OUTPUT_DIR / "archive")))
+ARCHIVE_LEVEL: int = int(os.getenv("ARCHIVE_LEVEL", "10"))
+
+#INFO: Telemetry: Prometheus text endpoint (0 disables) and optional JSONL event file
+METRICS_PORT: int = int(os.getenv("METRICS_PORT", "9100"))
+METRICS_JSONL: str = os.getenv("METRICS_JSONL", "")
 
 #INFO: Cloudflare retry settings
 MAX_CF_RETRIES: int = 5
@@ -1,146 +1,921 @@
 import psycopg2
+from psycopg2.extras import execute_values
+from parser import url_key, canonical_url
+import datetime
+import threading
 import time
 import random
+from db_pool import ConnectionPool, CONNECTION_ERRORS
+from metrics import DB_RETRIES, DB_ERRORS, STAGE_SECONDS, RETRIES, FRONTIER
+import frontier
+import config
+
+MIGRATION_LOCK_ID = 7312001
+
+def month_start(day):
+    return datetime.date(day.year, day.month, 1)
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+def create_month_partitions(cur, first, end, table="posts"):
+    #INFO: One partition per calendar month in [first, end), always named posts_YYYY_MM so
+    # they keep their names when partition_posts.py renames the parent. Bounds are UTC month
+    # starts; existing partitions are left alone
+    created = 0
+    month = first
+    while month < end:
+        name = f"posts_{month:%Y_%m}"
+        cur.execute("SELECT to_regclass(%s)", (name,))
+        if cur.fetchone()[0] is None:
+            cur.execute(f"CREATE TABLE {name} PARTITION OF {table} "
+                        f"FOR VALUES FROM ('{month:%Y-%m-%d} 00:00+00') TO ('{add_months(month, 1):%Y-%m-%d} 00:00+00')")
+            created += 1
+        month = add_months(month, 1)
+    return created
+
+URL_STATUS_RANK = "CASE status WHEN 'completed' THEN 0 WHEN 'processing' THEN 1 WHEN 'failed' THEN 2 ELSE 3 END"
+
+def _dedupe_url_keys(cur):
+    #INFO: One-off: key every existing row, then keep one row per key. The survivor is the
+    # most finished one, so a page that was already fetched under any spelling stays done.
+    # Surviving rows keep their url, posts.source_url and topic_state point at it
+    cur.execute("ALTER TABLE visited_urls ADD COLUMN IF NOT EXISTS url_key TEXT")
+    cur.execute("CREATE TEMP TABLE url_keys (url TEXT PRIMARY KEY, url_key TEXT) ON COMMIT DROP")
+    with cur.connection.cursor(name='key_urls') as scan, cur.connection.cursor() as out:
+        scan.itersize = 20000
+        scan.execute("SELECT url FROM visited_urls")
+        while True:
+            rows = scan.fetchmany(20000)
+            if not rows: break
+            execute_values(out, "INSERT INTO url_keys (url, url_key) VALUES %s",
+                           [(url, url_key(url)) for (url,) in rows], page_size=len(rows))
+    cur.execute("UPDATE visited_urls v SET url_key = k.url_key FROM url_keys k WHERE v.url = k.url")
+    cur.execute(f"""
+        DELETE FROM visited_urls v USING (
+            SELECT url, ROW_NUMBER() OVER (
+                PARTITION BY url_key ORDER BY {URL_STATUS_RANK}, last_visited DESC, url
+            ) AS rn
+            FROM visited_urls
+        ) ranked
+        WHERE v.url = ranked.url AND ranked.rn > 1
+    """)
+    print(f"#INFO: Removed {cur.rowcount} duplicate visited_urls rows")
+    cur.execute("""
+        UPDATE topic_state t SET last_page_url = v.url
+        FROM url_keys k JOIN visited_urls v ON v.url_key = k.url_key
+        WHERE t.last_page_url = k.url AND v.url <> k.url
+    """)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_visited_urls_key ON visited_urls (url_key)")
+
+def _priority_frontier(cur):
+    #INFO: Existing pending rows are scored by frontier.score_url for their url and type, as
+    # if discovered when they were last touched, so they slot in among newly found URLs
+    cur.execute("ALTER TABLE visited_urls ADD COLUMN IF NOT EXISTS priority DOUBLE PRECISION DEFAULT 0")
+    cur.execute("CREATE TEMP TABLE scored (url TEXT PRIMARY KEY, priority DOUBLE PRECISION) ON COMMIT DROP")
+    with cur.connection.cursor(name='score_pending') as scan, cur.connection.cursor() as out:
+        scan.itersize = 20000
+        scan.execute("SELECT url, url_type, EXTRACT(EPOCH FROM last_visited) FROM visited_urls WHERE status = 'pending'")
+        while True:
+            rows = scan.fetchmany(20000)
+            if not rows: break
+            execute_values(out, "INSERT INTO scored (url, priority) VALUES %s",
+                           [(url, frontier.score_url(url, url_type or 'topic', now=float(seen or 0)))
+                            for url, url_type, seen in rows], page_size=len(rows))
+    cur.execute("UPDATE visited_urls v SET priority = s.priority FROM scored s WHERE v.url = s.url")
+    cur.execute("DROP INDEX IF EXISTS idx_visited_urls_pending")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_visited_urls_priority
+            ON visited_urls (url_type, priority DESC) WHERE status = 'pending'
+    """)
+
+#INFO: Versioned schema. Steps run once, in order, each in its own transaction.
+# Append new versions at the end and never edit one that has shipped
+MIGRATIONS = [
+    (1, "base tables", """
+        CREATE TABLE IF NOT EXISTS posts (
+            post_id TEXT PRIMARY KEY,
+            topic_id TEXT,
+            author TEXT,
+            post_time TEXT,
+            content TEXT,
+            source_url TEXT,
+            scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS visited_urls (
+            url TEXT PRIMARY KEY,
+            status TEXT DEFAULT 'pending',
+            url_type TEXT DEFAULT 'topic',
+            last_visited TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        ALTER TABLE posts ADD COLUMN IF NOT EXISTS topic_id TEXT;
+        ALTER TABLE visited_urls ADD COLUMN IF NOT EXISTS url_type TEXT DEFAULT 'topic';
+    """),
+    (2, "work leases", """
+        ALTER TABLE visited_urls ADD COLUMN IF NOT EXISTS lease_owner TEXT;
+        ALTER TABLE visited_urls ADD COLUMN IF NOT EXISTS lease_expires TIMESTAMP;
+    """),
+    (3, "frontier indexes", """
+        CREATE INDEX IF NOT EXISTS idx_visited_urls_pending
+            ON visited_urls (url_type, last_visited) WHERE status = 'pending';
+        CREATE INDEX IF NOT EXISTS idx_visited_urls_leases
+            ON visited_urls (lease_expires) WHERE status = 'processing';
+    """),
+    (4, "integer topic id", """
+        ALTER TABLE posts ADD COLUMN IF NOT EXISTS topic_num BIGINT
+            GENERATED ALWAYS AS (CASE WHEN topic_id ~ '^[0-9]{1,18}$' THEN topic_id::BIGINT END) STORED;
+        CREATE INDEX IF NOT EXISTS idx_posts_topic_num ON posts (topic_num);
+    """),
+    (5, "topic recrawl state", """
+        CREATE TABLE IF NOT EXISTS topic_state (
+            topic_id TEXT PRIMARY KEY,
+            last_page INTEGER DEFAULT 0,
+            last_page_url TEXT,
+            pages_seen INTEGER DEFAULT 0,
+            max_post_id BIGINT DEFAULT 0,
+            post_count INTEGER DEFAULT 0,
+            last_activity TIMESTAMP,
+            last_crawled TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            recrawl_interval INTEGER DEFAULT 3600,
+            next_recrawl_at TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_topic_state_due ON topic_state (next_recrawl_at);
+        -- Seed from already scraped posts, spreading the first revisits over a day
+        INSERT INTO topic_state (topic_id, last_page_url, max_post_id, post_count, last_crawled, next_recrawl_at)
+        SELECT DISTINCT ON (topic_id) topic_id, source_url, post_id::BIGINT,
+            COUNT(*) OVER (PARTITION BY topic_id), scraped_at,
+            CURRENT_TIMESTAMP + random() * INTERVAL '1 day'
+        FROM posts
+        WHERE topic_id ~ '^[0-9]{1,18}$' AND post_id ~ '^[0-9]{1,18}$'
+        ORDER BY topic_id, post_id::BIGINT DESC
+        ON CONFLICT (topic_id) DO NOTHING;
+    """),
+    (6, "priority frontier", _priority_frontier),
+    (7, "canonical url keys", _dedupe_url_keys),
+    (8, "bulk load checkpoints", """
+        CREATE TABLE IF NOT EXISTS load_checkpoints (
+            source TEXT,
+            split INTEGER,
+            start_offset BIGINT,
+            end_offset BIGINT,
+            next_offset BIGINT,
+            file_size BIGINT,
+            rows_loaded BIGINT DEFAULT 0,
+            rows_rejected BIGINT DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (source, split)
+        );
+    """),
+    (9, "export watermark index", """
+        CREATE INDEX IF NOT EXISTS idx_posts_scraped ON posts (scraped_at, post_id);
+    """),
+    (10, "content hashes and quote references", """
+        ALTER TABLE posts ADD COLUMN IF NOT EXISTS content_hash BYTEA
+            GENERATED ALWAYS AS (decode(md5(COALESCE(content, '')), 'hex')) STORED;
+        CREATE INDEX IF NOT EXISTS idx_posts_content_hash ON posts (content_hash);
+        CREATE TABLE IF NOT EXISTS post_quotes (
+            post_id TEXT,
+            position INTEGER,
+            quoted_post_id TEXT,
+            quoted_author TEXT,
+            PRIMARY KEY (post_id, position)
+        );
+        CREATE INDEX IF NOT EXISTS idx_post_quotes_quoted ON post_quotes (quoted_post_id);
+    """),
+    (11, "retry scheduling and dead letters", """
+        ALTER TABLE visited_urls ADD COLUMN IF NOT EXISTS attempts INTEGER DEFAULT 0;
+        ALTER TABLE visited_urls ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP;
+        ALTER TABLE visited_urls ADD COLUMN IF NOT EXISTS last_error TEXT;
+        -- Failures so far were never retried, give each one more try spread over an hour
+        UPDATE visited_urls
+        SET status = 'retry', attempts = 1, next_attempt_at = CURRENT_TIMESTAMP + random() * INTERVAL '1 hour'
+        WHERE status = 'failed';
+        CREATE INDEX IF NOT EXISTS idx_visited_urls_retry
+            ON visited_urls (next_attempt_at) WHERE status = 'retry';
+        CREATE INDEX IF NOT EXISTS idx_visited_urls_dead
+            ON visited_urls (last_visited) WHERE status = 'dead';
+    """),
+    (12, "shared rate limits", """
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            key TEXT PRIMARY KEY,
+            rate DOUBLE PRECISION NOT NULL,
+            burst DOUBLE PRECISION NOT NULL,
+            tokens DOUBLE PRECISION NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+            increased_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+            decreased_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+        );
+    """),
+    (13, "worker membership and frontier shards", """
+        CREATE TABLE IF NOT EXISTS workers (
+            worker_id TEXT PRIMARY KEY,
+            started_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            heartbeat_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            owned_shards INTEGER NOT NULL DEFAULT 0
+        );
+        -- Every page of a topic or board lands in the same shard: the page number is cut
+        -- off url_key ("t:123:4" -> "t:123") before hashing
+        ALTER TABLE visited_urls ADD COLUMN IF NOT EXISTS shard SMALLINT
+            GENERATED ALWAYS AS ((hashtext(regexp_replace(url_key, ':[0-9]+$', '')) & 255)::smallint) STORED;
+    """),
+    (14, "typed post timestamps", """
+        -- Filled at ingest from post_time; rows stored before this by backfill_posted_at.py
+        ALTER TABLE posts ADD COLUMN IF NOT EXISTS posted_at TIMESTAMPTZ;
+        CREATE INDEX IF NOT EXISTS idx_posts_posted ON posts (posted_at);
+    """),
+    (15, "full-text search", """
+        -- Rewrites posts once under an exclusive lock, crawlers wait for it to finish
+        ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+            GENERATED ALWAYS AS (to_tsvector('english'::regconfig, COALESCE(content, ''))) STORED;
+        CREATE INDEX IF NOT EXISTS idx_posts_search ON posts USING GIN (search_vector);
+        -- Lets an author filter combine with the text match instead of rechecking every hit
+        CREATE INDEX IF NOT EXISTS idx_posts_author ON posts (lower(author));
+    """),
+]
+
+CLAIM_CANDIDATES_SQL = """
+    SELECT url FROM visited_urls
+    WHERE status = 'pending' {type_filter}
+    ORDER BY priority DESC
+    LIMIT %s
+"""
+
+#INFO: Posts are unique on post_id, or on (post_id, posted_at) once partition_posts.py has
+# split the table by month: a unique index on a partitioned table must cover the partition key
+POSTS_CONFLICT = {False: "post_id", True: "post_id, posted_at"}
+
+#INFO: posted_at depends on the fetch time a post is resolved against ("3:15pm" is a
+# different day on every crawl), so an incoming row takes the stored row's posted_at. On the
+# partitioned table that keeps (post_id, posted_at) hitting the existing row instead of adding
+# a second copy; unpartitioned, a missing posted_at may still be filled in
+POSTS_POSTED_AT = {
+    False: "COALESCE(e.posted_at, n.posted_at::timestamptz)",
+    True: "CASE WHEN e.post_id IS NULL THEN n.posted_at::timestamptz ELSE e.posted_at END",
+}
+
+POSTS_EXISTING_SQL = "LEFT JOIN LATERAL (SELECT post_id, posted_at FROM posts WHERE post_id = n.post_id LIMIT 1) e ON true"
+
+INSERT_POSTS_SQL = """
+    INSERT INTO posts (post_id, topic_id, author, post_time, content, source_url, posted_at)
+    SELECT n.post_id, n.topic_id, n.author, n.post_time, n.content, n.source_url, {posted_at}
+    FROM (VALUES %s) AS n (post_id, topic_id, author, post_time, content, source_url, posted_at)
+    {existing}
+    ON CONFLICT ({conflict}) DO NOTHING
+"""
+
+UPSERT_POSTS_SQL = """
+    INSERT INTO posts (post_id, topic_id, author, post_time, content, source_url, posted_at)
+    SELECT n.post_id, n.topic_id, n.author, n.post_time, n.content, n.source_url, {posted_at}
+    FROM (VALUES %s) AS n (post_id, topic_id, author, post_time, content, source_url, posted_at)
+    {existing}
+    ON CONFLICT ({conflict}) DO UPDATE SET
+        topic_id = EXCLUDED.topic_id, author = EXCLUDED.author, post_time = EXCLUDED.post_time,
+        content = EXCLUDED.content, source_url = EXCLUDED.source_url, posted_at = EXCLUDED.posted_at
+    WHERE (posts.topic_id, posts.author, posts.post_time, posts.content, posts.posted_at)
+        IS DISTINCT FROM (EXCLUDED.topic_id, EXCLUDED.author, EXCLUDED.post_time, EXCLUDED.content, EXCLUDED.posted_at)
+"""
+
+def posts_sql(template, partitioned):
+    return template.format(conflict=POSTS_CONFLICT[partitioned], posted_at=POSTS_POSTED_AT[partitioned],
+                           existing=POSTS_EXISTING_SQL)
+
+#INFO: Column types for the prepared unnest() form of each batched insert
+UNNEST_TYPES = {
+    "insert_urls": ("text", "text", "text", "text", "float8"),
+    "insert_posts": ("text",) * 6 + ("timestamptz",),
+    "upsert_posts": ("text",) * 6 + ("timestamptz",),
+    "insert_posts_by_month": ("text",) * 6 + ("timestamptz",),
+    "upsert_posts_by_month": ("text",) * 6 + ("timestamptz",),
+    "insert_quotes": ("text", "int4", "text", "text"),
+    "upsert_quotes": ("text", "int4", "text", "text"),
+}
+
+def _unnest(query, types):
+    return query.replace("VALUES %s", "SELECT * FROM unnest({})".format(
+        ", ".join(f"%s::{t}[]" for t in types)))
+
+INSERT_QUOTES_SQL = """
+    INSERT INTO post_quotes (post_id, position, quoted_post_id, quoted_author)
+    VALUES %s
+    ON CONFLICT (post_id, position) DO NOTHING
+"""
+
+UPSERT_QUOTES_SQL = """
+    INSERT INTO post_quotes (post_id, position, quoted_post_id, quoted_author)
+    VALUES %s
+    ON CONFLICT (post_id, position) DO UPDATE SET
+        quoted_post_id = EXCLUDED.quoted_post_id, quoted_author = EXCLUDED.quoted_author
+"""
+
+#NOTE: No conflict target, a row is skipped if either its url or its url_key is taken
+INSERT_URLS_SQL = """
+    INSERT INTO visited_urls (url, url_key, status, url_type, priority)
+    VALUES %s
+    ON CONFLICT DO NOTHING
+    RETURNING url_key
+"""
 
 #INFO: Database management module for distributed scraping
 class DatabaseManager:
-    def __init__(self, db_url: str):
+    def __init__(self, db_url: str, flush_rows: int = 500, flush_seconds: float = 5.0, lease_seconds: int = 3600,
+                 cache=None, upsert_posts: bool = False, pool_min: int = 1, pool_max: int = 4, prepare: bool = True,
+                 retry_max_attempts: int = 5, retry_base_seconds: float = 300, retry_max_seconds: float = 6 * 3600):
         self.db_url = db_url
-        self.conn = None
+        self.pool = ConnectionPool(db_url, min_size=pool_min, max_size=pool_max, prepare=prepare)
+        #INFO: The crawler's fetch and writer stages share one manager. _lock guards the write
+        # buffers and the cache and is never held across a query; _flush_lock keeps flushes in
+        # order, so once flush() returns everything buffered before the call is stored
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self.lease_seconds = lease_seconds
+        self.retry_max_attempts = retry_max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        #INFO: Optional url_cache.VisitedCache keyed by url_key, kept current by every method
+        # that changes a status
+        self.cache = cache
+        #INFO: Re-parses overwrite stored posts, the crawler only ever adds new ones
+        self.quotes_sql, self.quotes_name = (UPSERT_QUOTES_SQL, 'upsert_quotes') if upsert_posts else (INSERT_QUOTES_SQL, 'insert_quotes')
+        self.upsert_posts = upsert_posts
+        self._unverified = set()
+        #INFO: Write-behind buffers, keyed by post_id / url_key so repeats collapse before the insert
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self._post_buffer = {}
+        self._quote_buffer = {}
+        self._url_buffer = {}
+        self._buffered_since = None
+        self.write_stats = {"rows_written": 0, "flushes": 0, "flush_seconds": 0.0, "last_flush_ms": 0.0}
         self._init_db()
+        self._partitions_checked = 0.0
+        self._refresh_posts_sql()
 
-    def _get_conn(self, force_reconnect=False):
-        if force_reconnect and self.conn:
-            try: self.conn.close()
-            except: pass
-            self.conn = None
-
-        attempts = 0
-        while attempts < 5:
-            try:
-                if not self.conn or self.conn.closed:
-                    self.conn = psycopg2.connect(
-                        self.db_url, 
-                        connect_timeout=20,
-                        options="-c statement_timeout=30000"
-                    )
-                    self.conn.autocommit = True
-                
-                with self.conn.cursor() as cur:
-                    cur.execute("SELECT 1")
-                return self.conn
-            except Exception as e:
-                attempts += 1
-                print(f"    #NOTE: DB Connection attempt {attempts} failed: {e}")
-                if self.conn:
-                    try: self.conn.close()
-                    except: pass
-                    self.conn = None
-                time.sleep(random.uniform(2, 5))
-        
-        raise Exception("#WARN: Persistent DB connection failure")
+    def connection(self):
+        #INFO: Borrow a pooled autocommit connection for multi-statement work
+        return self.pool.connection()
 
     def _init_db(self):
         try:
-            conn = self._get_conn()
-            with conn.cursor() as cur:
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS posts (
-                        post_id TEXT PRIMARY KEY,
-                        topic_id TEXT,
-                        author TEXT,
-                        post_time TEXT,
-                        content TEXT,
-                        source_url TEXT,
-                        scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    );
-                    CREATE TABLE IF NOT EXISTS visited_urls (
-                        url TEXT PRIMARY KEY,
-                        status TEXT DEFAULT 'pending',
-                        url_type TEXT DEFAULT 'topic',
-                        last_visited TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    );
-                """)
-                # Migration: Add topic_id if missing
-                try: cur.execute("ALTER TABLE posts ADD COLUMN IF NOT EXISTS topic_id TEXT")
-                except: pass
-                try: cur.execute("ALTER TABLE visited_urls ADD COLUMN IF NOT EXISTS url_type TEXT DEFAULT 'topic'")
-                except: pass
+            self._migrate()
         except Exception as e:
+            #WARN: Running against a half-migrated schema fails later in less obvious ways
             print(f"#WARN: Init DB failed: {e}")
+            self.pool.close()
+            raise
 
-    def _execute_with_retry(self, query, params=None, is_select=False, fetch_all=False):
-        for attempt in range(4):
+    def _migrate(self):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            #INFO: Replicas start together, only one of them may run the migrations
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+            try:
+                cur.execute("SELECT version FROM schema_migrations")
+                applied = {row[0] for row in cur.fetchall()}
+                for version, name, step in MIGRATIONS:
+                    if version in applied: continue
+                    print(f"#INFO: Applying schema migration {version}: {name}")
+                    conn.autocommit = False
+                    try:
+                        with conn.cursor() as mcur:
+                            #INFO: Table rewrites and index builds outlive the pool's statement_timeout;
+                            # lock_timeout keeps a migration from queueing every crawler behind it
+                            # while it waits on a long-running transaction
+                            mcur.execute("SET LOCAL statement_timeout = 0")
+                            mcur.execute("SELECT set_config('lock_timeout', %s, true)", (config.MIGRATION_LOCK_TIMEOUT,))
+                            if callable(step): step(mcur)
+                            else: mcur.execute(step)
+                            mcur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    finally:
+                        conn.autocommit = True
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+
+    def _refresh_posts_sql(self):
+        #INFO: Returns True when posts changed shape since the last check
+        row = self._execute_with_retry("SELECT relkind FROM pg_class WHERE oid = to_regclass('posts')", is_select=True)
+        partitioned = bool(row) and row[0] == 'p'
+        changed = partitioned != getattr(self, 'posts_partitioned', partitioned)
+        self.posts_partitioned = partitioned
+        sql, name = (UPSERT_POSTS_SQL, 'upsert_posts') if self.upsert_posts else (INSERT_POSTS_SQL, 'insert_posts')
+        self.posts_sql = posts_sql(sql, partitioned)
+        self.posts_name = name + ('_by_month' if partitioned else '')
+        return changed
+
+    def ensure_post_partitions(self, months_ahead=3):
+        #INFO: Keep monthly partitions open ahead of the calendar so new posts never land in
+        # the default partition; checked at most once an hour
+        if not self.posts_partitioned or time.time() - self._partitions_checked < 3600: return 0
+        self._partitions_checked = time.time()
+        today = month_start(datetime.date.today())
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                created = create_month_partitions(cur, today, add_months(today, months_ahead + 1))
+        except Exception as e:
+            #NOTE: Fails if posts_undated already holds rows for that month, they have to be moved by hand
+            print(f"#WARN: Could not add posts partitions: {str(e)[:120]}")
+            return 0
+        if created: print(f"#INFO: Created {created} monthly posts partitions")
+        return created
+
+    def schema_version(self):
+        res = self._execute_with_retry("SELECT MAX(version) FROM schema_migrations", is_select=True)
+        return res[0] if res else None
+
+    def explain_refill(self, url_type='topic', disable_seqscan=False):
+        #INFO: EXPLAIN the claim subquery; on a tiny table the planner may still prefer a
+        # seq scan, disable_seqscan shows whether the index is usable at all
+        query = "EXPLAIN (FORMAT JSON) " + CLAIM_CANDIDATES_SQL.format(type_filter="AND url_type = %s")
+        with self.connection() as conn:
+            conn.autocommit = False
             try:
-                conn = self._get_conn(force_reconnect=(attempt > 0))
                 with conn.cursor() as cur:
-                    cur.execute(query, params)
+                    if disable_seqscan:
+                        cur.execute("SET LOCAL enable_seqscan = off")
+                    cur.execute(query, (url_type, 50))
+                    plan = cur.fetchone()[0][0]["Plan"]
+            finally:
+                conn.rollback()
+
+        nodes = []
+        stack = [plan]
+        while stack:
+            node = stack.pop()
+            nodes.append((node["Node Type"], node.get("Index Name")))
+            stack.extend(node.get("Plans", []))
+        uses_index = any(index_name for _, index_name in nodes)
+        return uses_index, nodes
+
+    def _execute_with_retry(self, query, params=None, is_select=False, fetch_all=False, values=None, returning=False,
+                            name=None):
+        #INFO: Runs without the manager lock, each call borrows its own pooled connection.
+        # A name marks a hot statement: it is PREPAREd once per connection and reported under that name
+        label = name or query.split(None, 1)[0].lower()
+        for attempt in range(4):
+            start = time.perf_counter()
+            try:
+                with self.pool.connection() as conn, conn.cursor() as cur:
+                    if values is not None:
+                        if name in UNNEST_TYPES and self.pool.prepare:
+                            #INFO: Column arrays through unnest() keep the statement text fixed
+                            # whatever the batch size, so it can stay prepared
+                            columns = [list(col) for col in zip(*values)] or [[] for _ in UNNEST_TYPES[name]]
+                            self.pool.execute(cur, name, _unnest(query, UNNEST_TYPES[name]), columns)
+                            return cur.fetchall() if returning else cur.rowcount
+                        #INFO: One multi-row statement, rowcount is the number of rows actually inserted
+                        rows = execute_values(cur, query, values, page_size=max(len(values), 1), fetch=returning)
+                        return rows if returning else cur.rowcount
+                    self.pool.execute(cur, name, query, params)
                     if is_select:
                         if fetch_all: return cur.fetchall()
                         return cur.fetchone()
                     return True
-            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            except CONNECTION_ERRORS as e:
                 if attempt == 3: raise
-                if self.conn:
-                    try: self.conn.close()
-                    except: pass
-                    self.conn = None
-                time.sleep(2 ** attempt)
+                DB_RETRIES.inc()
+                print(f"      #NOTE: DB connection lost ({str(e).strip()[:80]}), retrying")
             except Exception as e:
+                DB_ERRORS.inc()
                 if "duplicate key" not in str(e).lower():
                     print(f"      #NOTE: DB operation error: {str(e)[:100]}")
                 return None
+            finally:
+                self.pool.record(label, time.perf_counter() - start)
+            time.sleep(min(0.25 * 2 ** attempt, 2) * random.uniform(0.5, 1.5))
 
-    def is_url_visited(self, url):
-        res = self._execute_with_retry("SELECT status FROM visited_urls WHERE url = %s", (url,), is_select=True)
-        if not res: return False
-        return res[0] in ['completed', 'processing']
+    def mark_url_completed(self, url, worker_id):
+        #INFO: Only the current lease holder may finish a URL. Returns False when the lease was
+        # lost (expired and reclaimed by another worker), the row is then left to its new owner
+        self.flush()
+        row = self._execute_with_retry("""
+            UPDATE visited_urls SET status = 'completed', last_visited = CURRENT_TIMESTAMP,
+                lease_owner = NULL, lease_expires = NULL
+            WHERE url = %s AND lease_owner = %s
+            RETURNING url
+        """, (url, worker_id), is_select=True, name='mark_completed')
+        if row is None: return False
+        self._remember_many([url_key(url)], 'completed')
+        return True
 
-    def mark_url_processing(self, url):
-        self._execute_with_retry("""
-            UPDATE visited_urls SET status = 'processing', last_visited = CURRENT_TIMESTAMP WHERE url = %s
-        """, (url,))
+    def mark_url_failed(self, url, worker_id, error=None, count_attempt=True, delay=None):
+        #INFO: Park the URL as 'retry' with exponential backoff and jitter, or as 'dead' once
+        # it has used up its attempts. count_attempt=False reschedules without spending one,
+        # delay overrides the backoff in seconds. Returns (status, attempts), status is None
+        # when worker_id no longer holds the lease
+        self.flush()
+        row = self._execute_with_retry("""
+            UPDATE visited_urls SET
+                attempts = attempts + %(inc)s,
+                status = CASE WHEN attempts + %(inc)s >= %(max)s THEN 'dead' ELSE 'retry' END,
+                next_attempt_at = CASE WHEN attempts + %(inc)s >= %(max)s THEN NULL
+                    ELSE CURRENT_TIMESTAMP + make_interval(secs => COALESCE(%(delay)s::float8,
+                        LEAST(%(cap)s::float8, %(base)s::float8 * power(2, GREATEST(attempts + %(inc)s - 1, 0))))
+                        * (0.5 + random()))
+                    END,
+                last_error = %(error)s, last_visited = CURRENT_TIMESTAMP,
+                lease_owner = NULL, lease_expires = NULL
+            WHERE url = %(url)s AND lease_owner = %(owner)s
+            RETURNING status, attempts
+        """, {"url": url, "owner": worker_id, "inc": 1 if count_attempt else 0, "max": self.retry_max_attempts,
+              "base": self.retry_base_seconds, "cap": self.retry_max_seconds, "delay": delay,
+              "error": (error or "")[:500]}, is_select=True, name='mark_failed')
+        if row is None: return None, 0
+        status, attempts = row
+        self._remember_many([url_key(url)], status)
+        RETRIES.inc(outcome=status)
+        return status, attempts
 
-    def mark_url_completed(self, url):
-        self._execute_with_retry("UPDATE visited_urls SET status = 'completed', last_visited = CURRENT_TIMESTAMP WHERE url = %s", (url,))
+    def schedule_retries(self, limit=100):
+        #INFO: Hand retries whose backoff has elapsed back to the frontier
+        rows = self._execute_with_retry("""
+            UPDATE visited_urls SET status = 'pending', next_attempt_at = NULL
+            WHERE url IN (
+                SELECT url FROM visited_urls
+                WHERE status = 'retry' AND next_attempt_at <= CURRENT_TIMESTAMP
+                ORDER BY next_attempt_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING url
+        """, (limit,), is_select=True, fetch_all=True, name='schedule_retries')
+        if rows:
+            print(f"    #INFO: Re-queued {len(rows)} URLs for retry")
+            self._remember_many((url_key(row[0]) for row in rows), 'pending')
+        return len(rows) if rows else 0
 
-    def mark_url_failed(self, url):
-        self._execute_with_retry("UPDATE visited_urls SET status = 'failed', last_visited = CURRENT_TIMESTAMP WHERE url = %s", (url,))
+    def retry_stats(self):
+        rows = self._execute_with_retry("""
+            SELECT 'retry', COUNT(*), COUNT(*) FILTER (WHERE next_attempt_at <= CURRENT_TIMESTAMP)
+            FROM visited_urls WHERE status = 'retry'
+            UNION ALL
+            SELECT 'dead', COUNT(*), 0 FROM visited_urls WHERE status = 'dead'
+        """, is_select=True, fetch_all=True) or []
+        stats = {"retry": 0, "retry_due": 0, "dead": 0}
+        for status, count, due in rows:
+            stats[status] = count
+            if status == 'retry': stats["retry_due"] = due
+        for status in ("retry", "dead"):
+            FRONTIER.set(stats[status], status=status)
+        return stats
+
+    def requeue_dead(self, url_type=None, limit=None):
+        #INFO: Give dead letters a fresh set of attempts, e.g. after a parser fix
+        type_filter = "AND url_type = %s" if url_type else ""
+        params = ([url_type] if url_type else []) + [limit]
+        rows = self._execute_with_retry(f"""
+            UPDATE visited_urls SET status = 'pending', attempts = 0, next_attempt_at = NULL
+            WHERE url IN (
+                SELECT url FROM visited_urls WHERE status = 'dead' {type_filter}
+                ORDER BY last_visited LIMIT %s
+            )
+            RETURNING url
+        """, tuple(params), is_select=True, fetch_all=True)
+        if rows: self._remember_many((url_key(row[0]) for row in rows), 'pending')
+        return len(rows) if rows else 0
 
-    def add_urls(self, urls, url_type='topic'):
+    def add_urls(self, urls, url_type='topic', source_type=None):
         if not urls: return
+        #INFO: Every spelling of a page reduces to one key, the first one seen is the one fetched
+        by_key = {}
         for url in urls:
-            self._execute_with_retry("""
-                INSERT INTO visited_urls (url, status, url_type) 
-                VALUES (%s, 'pending', %s) 
-                ON CONFLICT (url) DO NOTHING
-            """, (url, url_type))
-
-    def get_pending_urls(self, url_type=None, limit=50):
-        if url_type:
-            query = "SELECT url, url_type FROM visited_urls WHERE status = 'pending' AND url_type = %s ORDER BY last_visited ASC LIMIT %s"
-            params = (url_type, limit)
-        else:
-            query = "SELECT url, url_type FROM visited_urls WHERE status = 'pending' ORDER BY last_visited ASC LIMIT %s"
-            params = (limit,)
-            
-        rows = self._execute_with_retry(query, params, is_select=True, fetch_all=True)
+            by_key.setdefault(url_key(url), canonical_url(url))
+        now = time.time()
+        with self._lock:
+            keys = [k for k in by_key if k not in self._url_buffer]
+            if self.cache:
+                #INFO: Links this process already knows the status of never reach the database.
+                # Bloom positives still go out; the insert's RETURNING tells us if they were real
+                _, new, unverified = self.cache.partition(keys)
+                self._unverified.update(unverified)
+                keys = new + unverified
+            for key in keys:
+                url = by_key[key]
+                self._url_buffer[key] = (url, key, 'pending', url_type, frontier.score_url(url, url_type, source_type, now))
+            self._mark_buffered()
+        self._maybe_flush()
+
+    def claim_batch(self, worker_id, n, url_type=None, shards=None):
+        #INFO: Atomically lease up to n pending URLs; SKIP LOCKED lets replicas claim disjoint rows.
+        # With shards, only URLs in those frontier shards (sharding.Membership) are considered;
+        # the scan still walks the priority index and skips other replicas' rows
+        type_filter = "AND url_type = %s" if url_type else ""
+        if shards is not None: type_filter += " AND shard = ANY(%s::smallint[])"
+        query = f"""
+            UPDATE visited_urls
+            SET status = 'processing', lease_owner = %s,
+                lease_expires = CURRENT_TIMESTAMP + make_interval(secs => %s),
+                last_visited = CURRENT_TIMESTAMP
+            WHERE url IN ({CLAIM_CANDIDATES_SQL.format(type_filter=type_filter)} FOR UPDATE SKIP LOCKED)
+              AND status = 'pending'
+            RETURNING url, url_type, priority
+        """
+        params = [worker_id, self.lease_seconds]
+        if url_type: params.append(url_type)
+        if shards is not None: params.append(list(shards))
+        params.append(n)
+        rows = self._execute_with_retry(query, tuple(params), is_select=True, fetch_all=True,
+                                        name=f"claim_{url_type or 'any'}" + ("_sharded" if shards is not None else ""))
+        if rows: self._remember_many((url_key(row[0]) for row in rows), 'processing')
         return rows if rows else []
 
+    def reap_expired_leases(self):
+        #INFO: Return work held by dead workers to the frontier. Rows with no lease at all
+        # predate leasing and are treated as expired once they are older than one lease
+        rows = self._execute_with_retry("""
+            UPDATE visited_urls
+            SET status = 'pending', lease_owner = NULL, lease_expires = NULL
+            WHERE status = 'processing'
+              AND (lease_expires < CURRENT_TIMESTAMP
+                   OR (lease_expires IS NULL AND last_visited < CURRENT_TIMESTAMP - make_interval(secs => %s)))
+            RETURNING url
+        """, (self.lease_seconds,), is_select=True, fetch_all=True)
+        if rows:
+            print(f"    #INFO: Reaped {len(rows)} expired leases")
+            self._remember_many((url_key(row[0]) for row in rows), 'pending')
+        return len(rows) if rows else 0
+
+    def renew_leases(self, worker_id):
+        #INFO: Push out the expiry of everything this worker still holds, so URLs waiting in
+        # its local queue are not reaped and fetched twice. Returns the number renewed
+        rows = self._execute_with_retry("""
+            UPDATE visited_urls SET lease_expires = CURRENT_TIMESTAMP + make_interval(secs => %s)
+            WHERE status = 'processing' AND lease_owner = %s
+            RETURNING url
+        """, (self.lease_seconds, worker_id), is_select=True, fetch_all=True, name='renew_leases')
+        return len(rows) if rows else 0
+
+    def release_leases(self, worker_id):
+        #INFO: Hand unprocessed claims back on clean shutdown instead of waiting for expiry
+        self._execute_with_retry("""
+            UPDATE visited_urls
+            SET status = 'pending', lease_owner = NULL, lease_expires = NULL
+            WHERE status = 'processing' AND lease_owner = %s
+        """, (worker_id,))
+
+    def heartbeat(self, worker_id, owned_shards=0):
+        self._execute_with_retry("""
+            INSERT INTO workers (worker_id, owned_shards) VALUES (%(id)s, %(shards)s)
+            ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = CURRENT_TIMESTAMP, owned_shards = %(shards)s
+        """, {"id": worker_id, "shards": owned_shards}, name='worker_heartbeat')
+
+    def live_workers(self, ttl_seconds):
+        rows = self._execute_with_retry("""
+            SELECT worker_id FROM workers
+            WHERE heartbeat_at >= CURRENT_TIMESTAMP - make_interval(secs => %s)
+        """, (ttl_seconds,), is_select=True, fetch_all=True, name='live_workers')
+        return [row[0] for row in rows] if rows else []
+
+    def reap_dead_workers(self, ttl_seconds):
+        #INFO: A replica that stopped heartbeating loses its membership and its leases at
+        # once, instead of holding URLs until LEASE_SECONDS runs out
+        rows = self._execute_with_retry("""
+            WITH dead AS (
+                DELETE FROM workers
+                WHERE heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                RETURNING worker_id
+            )
+            UPDATE visited_urls v
+            SET status = 'pending', lease_owner = NULL, lease_expires = NULL
+            FROM dead
+            WHERE v.status = 'processing' AND v.lease_owner = dead.worker_id
+            RETURNING v.url
+        """, (ttl_seconds,), is_select=True, fetch_all=True)
+        if rows: self._remember_many((url_key(row[0]) for row in rows), 'pending')
+        return len(rows) if rows else 0
+
+    def deregister_worker(self, worker_id):
+        self._execute_with_retry("DELETE FROM workers WHERE worker_id = %s", (worker_id,))
+
+    def get_topic_state(self, topic_id):
+        row = self._execute_with_retry("""
+            SELECT last_page, max_post_id, post_count, recrawl_interval,
+                EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - last_crawled)
+            FROM topic_state WHERE topic_id = %s
+        """, (topic_id,), is_select=True, name='topic_state_get')
+        if not row: return None
+        return dict(zip(("last_page", "max_post_id", "post_count", "recrawl_interval", "seconds_since_crawl"), row))
+
+    def update_topic_state(self, topic_id, page, url, max_post_id, new_posts, recrawl_interval):
+        #INFO: The last page only ever moves forward, it is where the next recrawl starts
+        self._execute_with_retry("""
+            INSERT INTO topic_state (topic_id, last_page, last_page_url, pages_seen, max_post_id, post_count,
+                                     last_activity, last_crawled, recrawl_interval, next_recrawl_at)
+            VALUES (%(t)s, %(page)s, %(url)s, %(page)s + 1, %(max)s, %(new)s,
+                    CASE WHEN %(new)s > 0 THEN CURRENT_TIMESTAMP END, CURRENT_TIMESTAMP, %(iv)s,
+                    CURRENT_TIMESTAMP + make_interval(secs => %(iv)s::int))
+            ON CONFLICT (topic_id) DO UPDATE SET
+                last_page_url = CASE WHEN %(page)s >= topic_state.last_page THEN %(url)s ELSE topic_state.last_page_url END,
+                last_page = GREATEST(topic_state.last_page, %(page)s),
+                pages_seen = GREATEST(topic_state.pages_seen, %(page)s + 1),
+                max_post_id = GREATEST(topic_state.max_post_id, %(max)s),
+                post_count = topic_state.post_count + %(new)s,
+                last_activity = CASE WHEN %(new)s > 0 THEN CURRENT_TIMESTAMP ELSE topic_state.last_activity END,
+                last_crawled = CURRENT_TIMESTAMP,
+                recrawl_interval = %(iv)s,
+                next_recrawl_at = CURRENT_TIMESTAMP + make_interval(secs => %(iv)s::int)
+        """, {"t": topic_id, "page": page, "url": url, "max": max_post_id, "new": new_posts, "iv": recrawl_interval},
+           name='topic_state_put')
+
+    def schedule_recrawls(self, limit=20):
+        #INFO: Re-open the last known page of topics whose revisit time has come. Pushing
+        # next_recrawl_at forward in the same statement stops other replicas re-picking them
+        rows = self._execute_with_retry("""
+            WITH due AS (
+                UPDATE topic_state
+                SET next_recrawl_at = CURRENT_TIMESTAMP + make_interval(secs => recrawl_interval)
+                WHERE topic_id IN (
+                    SELECT topic_id FROM topic_state
+                    WHERE next_recrawl_at <= CURRENT_TIMESTAMP
+                    ORDER BY next_recrawl_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING last_page_url, recrawl_interval
+            )
+            UPDATE visited_urls v
+            SET status = 'pending', last_visited = CURRENT_TIMESTAMP,
+                priority = EXTRACT(EPOCH FROM CURRENT_TIMESTAMP) / 3600
+                    + %s * (%s + LEAST(2.0, 7200.0 / GREATEST(due.recrawl_interval, 1)))
+            FROM due
+            WHERE v.url = due.last_page_url AND v.status = 'completed'
+            RETURNING v.url
+        """, (limit, config.PRIORITY_HOURS_PER_POINT, frontier.TOPIC), is_select=True, fetch_all=True)
+        if rows:
+            print(f"    #INFO: Scheduled {len(rows)} topic recrawls")
+            self._remember_many((url_key(row[0]) for row in rows), 'pending')
+        return len(rows) if rows else 0
+
     def save_posts(self, posts):
         if not posts: return
-        for p in posts:
-            query = """
-                INSERT INTO posts (post_id, topic_id, author, post_time, content, source_url)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                ON CONFLICT (post_id) DO NOTHING
-            """
-            params = (
-                str(p['post_id']), 
-                str(p.get('topic_id', '')),
-                str(p['author']), 
-                str(p['time']), 
-                str(p['content']), 
-                str(p.get('source_url', ''))
-            )
-            self._execute_with_retry(query, params)
+        with self._lock:
+            for p in posts:
+                post_id = str(p['post_id'])
+                self._post_buffer[post_id] = (
+                    post_id,
+                    str(p.get('topic_id', '')),
+                    str(p['author']),
+                    str(p['time']),
+                    str(p['content']),
+                    str(p.get('source_url', '')),
+                    p.get('posted_at')
+                )
+                for position, quote in enumerate(p.get('quotes') or []):
+                    self._quote_buffer[(post_id, position)] = (post_id, position, str(quote['post_id']),
+                                                               str(quote.get('author', '')))
+            self._mark_buffered()
+        self._maybe_flush()
+
+    def _remember_many(self, keys, status):
+        if not self.cache: return
+        with self._lock:
+            self.cache.remember_many(keys, status)
+
+    def _mark_buffered(self):
+        if self._buffered_since is None:
+            self._buffered_since = time.time()
+
+    def pending_rows(self) -> int:
+        #INFO: URL and post rows buffered but not yet written
+        return len(self._post_buffer) + len(self._url_buffer)
+
+    def _maybe_flush(self):
+        #INFO: Called with _lock released, the flush itself runs outside it
+        since = self._buffered_since
+        pending = self.pending_rows()
+        if pending >= self.flush_rows or (since is not None and time.time() - since >= self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            #INFO: Take the buffers and release _lock, other threads keep buffering while this writes
+            with self._lock:
+                if not self._post_buffer and not self._url_buffer:
+                    return 0
+                url_buffer, self._url_buffer = self._url_buffer, {}
+                unverified, self._unverified = self._unverified, set()
+                post_buffer, self._post_buffer = self._post_buffer, {}
+                quote_buffer, self._quote_buffer = self._quote_buffer, {}
+                self._buffered_since = None
+            return self._write_buffers(url_buffer, unverified, post_buffer, quote_buffer)
+
+    def _write_buffers(self, url_buffer, unverified, post_buffer, quote_buffer):
+        start = time.time()
+        written = 0
+        try:
+            #INFO: URLs first so a crash never leaves posts whose pagination was never queued
+            if url_buffer:
+                rows = list(url_buffer.values())
+                inserted = self._execute_with_retry(INSERT_URLS_SQL, values=rows, returning=True, name='insert_urls')
+                if inserted is None:
+                    #NOTE: A bad row fails the whole statement, retry row by row so only that row is lost
+                    inserted = [r for row in rows for r in (self._execute_with_retry(
+                        INSERT_URLS_SQL, values=[row], returning=True, name='insert_urls') or [])]
+                inserted = {row[0] for row in inserted}
+                written += len(inserted)
+                if self.cache:
+                    unverified = unverified.intersection(url_buffer)
+                    with self._lock:
+                        self.cache.record_checked(len(unverified), len(unverified & inserted))
+                        for key in url_buffer:
+                            if key in inserted: self.cache.remember(key, 'pending')
+                            else: self.cache.bloom.add(key)
+                url_buffer, unverified = {}, set()
+            if post_buffer:
+                rows = list(post_buffer.values())
+                count = self._execute_with_retry(self.posts_sql, values=rows, name=self.posts_name)
+                if count is None and self._refresh_posts_sql():
+                    #INFO: partition_posts.py swapped the table under a running crawler
+                    print(f"#INFO: posts is {'now' if self.posts_partitioned else 'no longer'} partitioned, "
+                          f"conflict target switched")
+                    count = self._execute_with_retry(self.posts_sql, values=rows, name=self.posts_name)
+                if count is None:
+                    count = sum(self._execute_with_retry(self.posts_sql, values=[row], name=self.posts_name) or 0
+                                for row in rows)
+                written += count
+                if self.upsert_posts:
+                    #INFO: A re-parse replaces each post's quote list, it may have fewer entries than before
+                    self._execute_with_retry("DELETE FROM post_quotes WHERE post_id = ANY(%s)",
+                                             (list(post_buffer),))
+                if quote_buffer:
+                    quotes = list(quote_buffer.values())
+                    if self._execute_with_retry(self.quotes_sql, values=quotes, name=self.quotes_name) is None:
+                        for row in quotes: self._execute_with_retry(self.quotes_sql, values=[row], name=self.quotes_name)
+        except CONNECTION_ERRORS:
+            #NOTE: Out of retries. Every write is idempotent, so whatever was not confirmed goes
+            # back into the buffers for the next flush instead of being dropped
+            self._requeue(url_buffer, unverified, post_buffer, quote_buffer)
+            print(f"    #WARN: Flush failed, {len(url_buffer) + len(post_buffer)} rows put back in the buffer")
+            raise
+        finally:
+            elapsed = time.time() - start
+            self.write_stats["rows_written"] += written
+            self.write_stats["flushes"] += 1
+            self.write_stats["flush_seconds"] += elapsed
+            self.write_stats["last_flush_ms"] = elapsed * 1000
+            STAGE_SECONDS.observe(elapsed, stage='db_flush')
+        print(f"    #INFO: Flushed {written} new rows in {elapsed * 1000:.0f}ms")
+        return written
+
+    def _requeue(self, url_buffer, unverified, post_buffer, quote_buffer):
+        #INFO: Rows buffered since the swap are newer and win. A post saved again brings its
+        # own quote list, the old one's quotes are dropped with it
+        with self._lock:
+            self._url_buffer = {**url_buffer, **self._url_buffer}
+            self._unverified |= unverified
+            self._quote_buffer = {**{k: v for k, v in quote_buffer.items() if k[0] not in self._post_buffer},
+                                  **self._quote_buffer}
+            self._post_buffer = {**post_buffer, **self._post_buffer}
+            if url_buffer or post_buffer: self._mark_buffered()
+
+    def warm_cache(self, limit=None):
+        #INFO: Stream every known URL into the Bloom filter, then seed the LRU with the most
+        # recently touched statuses. Server-side cursors keep client memory flat
+        if not self.cache: return 0
+        start = time.time()
+        loaded = 0
+        with self.connection() as conn:
+            conn.autocommit = False
+            try:
+                with conn.cursor(name='warm_bloom') as cur:
+                    if limit: cur.execute("SELECT url_key FROM visited_urls WHERE url_key IS NOT NULL LIMIT %s", (limit,))
+                    else: cur.execute("SELECT url_key FROM visited_urls WHERE url_key IS NOT NULL")
+                    #INFO: The lock is taken per fetched chunk, not across the scan
+                    while True:
+                        chunk = cur.fetchmany(20000)
+                        if not chunk: break
+                        with self._lock:
+                            for (key,) in chunk: self.cache.bloom.add(key)
+                        loaded += len(chunk)
+                with conn.cursor(name='warm_lru') as cur:
+                    cur.execute("""
+                        SELECT url_key, status FROM (
+                            SELECT url_key, status, last_visited FROM visited_urls
+                            WHERE url_key IS NOT NULL
+                            ORDER BY last_visited DESC LIMIT %s
+                        ) recent ORDER BY last_visited ASC
+                    """, (self.cache.lru_size,))
+                    while True:
+                        chunk = cur.fetchmany(20000)
+                        if not chunk: break
+                        with self._lock:
+                            for key, status in chunk: self.cache.remember(key, status)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        print(f"#INFO: URL cache warmed with {loaded} URLs in {time.time() - start:.1f}s")
+        return loaded
+
+    def close(self):
+        self.flush()
+        self.pool.close()
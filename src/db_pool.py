@@ -0,0 +1,188 @@
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+from metrics import REGISTRY
+
+#INFO: Session layer under DatabaseManager. A bounded, thread-safe pool of autocommit
+# connections; a connection is only pinged when a query has failed since it was last
+# checked, and hot statements are PREPAREd once per connection and run with EXECUTE.
+
+DB_QUERY_SECONDS = REGISTRY.histogram("db_query_seconds", "Database round trip time per named query",
+                                      buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 10, 30))
+DB_POOL_IN_USE = REGISTRY.gauge("db_pool_in_use", "Pooled database connections currently borrowed")
+
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+_PARAM = re.compile(r"%%|%\((\w+)\)s|%s")
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.generation = 0
+
+
+def to_prepared(query: str) -> Tuple[str, List]:
+    #INFO: Rewrites %s / %(name)s placeholders to $n. Returns the body and, per $n, either
+    # a positional index or a dict key to pull the value from the caller's params.
+    # The PREPARE runs without params, so psycopg2 would leave a %% escape doubled
+    order: List = []
+    positional = 0
+
+    def sub(match):
+        nonlocal positional
+        if match.group(0) == "%%": return "%"
+        name = match.group(1)
+        if name is None:
+            order.append(positional)
+            positional += 1
+            return f"${len(order)}"
+        if name not in order:
+            order.append(name)
+        return f"${order.index(name) + 1}"
+
+    return _PARAM.sub(sub, query), order
+
+
+class ConnectionPool:
+    def __init__(self, db_url: str, min_size: int = 1, max_size: int = 4, prepare: bool = True,
+                 statement_timeout_ms: int = 30000):
+        self.db_url = db_url
+        self.max_size = max_size
+        self.prepare = prepare
+        self.statement_timeout_ms = statement_timeout_ms
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadedConnectionPool] = None
+        self.min_size = min_size
+        #INFO: Bumped on every connection error; connections checked under an older
+        # generation get a SELECT 1 before their next use
+        self.generation = 0
+        self.in_use = 0
+        self._statements: Dict[str, Tuple[str, List]] = {}
+        self.stats: Dict[str, Dict] = {}
+
+    def _ensure_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = self._open_pool()
+            return self._pool
+
+    def _open_pool(self):
+        for attempt in range(6):
+            try:
+                return ThreadedConnectionPool(
+                    self.min_size, self.max_size, self.db_url,
+                    connect_timeout=20,
+                    options=f"-c statement_timeout={self.statement_timeout_ms}",
+                    connection_factory=PooledConnection,
+                )
+            except psycopg2.OperationalError as e:
+                print(f"    #NOTE: DB pool connect attempt {attempt + 1} failed: {e}")
+                if attempt == 5: raise
+                time.sleep(min(0.25 * 2 ** attempt, 4) * random.uniform(0.5, 1.5))
+
+    def _borrow(self):
+        pool = self._ensure_pool()
+        for attempt in range(6):
+            try:
+                conn = pool.getconn()
+            except CONNECTION_ERRORS as e:
+                print(f"    #NOTE: DB connect attempt {attempt + 1} failed: {e}")
+                self.generation += 1
+                if attempt == 5: raise
+                time.sleep(min(0.25 * 2 ** attempt, 4) * random.uniform(0.5, 1.5))
+                continue
+            if not conn.autocommit:
+                conn.autocommit = True
+            if conn.generation < self.generation:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                    conn.generation = self.generation
+                except CONNECTION_ERRORS:
+                    pool.putconn(conn, close=True)
+                    continue
+            return conn
+        raise psycopg2.OperationalError("no healthy pooled connection")
+
+    @contextmanager
+    def connection(self):
+        #INFO: Blocks while max_size connections are out instead of failing like the raw pool
+        self._slots.acquire()
+        conn = None
+        broken = False
+        try:
+            conn = self._borrow()
+            with self._lock:
+                self.in_use += 1
+                DB_POOL_IN_USE.set(self.in_use)
+            yield conn
+        except CONNECTION_ERRORS:
+            broken = True
+            self.generation += 1
+            raise
+        finally:
+            if conn is not None:
+                with self._lock:
+                    self.in_use -= 1
+                    DB_POOL_IN_USE.set(self.in_use)
+                if not broken and not conn.closed:
+                    try:
+                        if conn.status != psycopg2.extensions.STATUS_READY: conn.rollback()
+                        conn.autocommit = True
+                    except CONNECTION_ERRORS:
+                        broken = True
+                self._pool.putconn(conn, close=broken or bool(conn.closed))
+            self._slots.release()
+
+    def statement(self, name: str, query: str) -> Tuple[str, List]:
+        if name not in self._statements:
+            self._statements[name] = to_prepared(query)
+        return self._statements[name]
+
+    def execute(self, cur, name: Optional[str], query: str, params=None):
+        #INFO: EXECUTE a named statement, PREPAREing it first on this connection if needed
+        if not (self.prepare and name):
+            cur.execute(query, params)
+            return
+        body, order = self.statement(name, query)
+        conn = cur.connection
+        if name not in conn.prepared:
+            cur.execute(f"PREPARE {name} AS {body}")
+            conn.prepared.add(name)
+        args = [params[key] for key in order] if params is not None else []
+        if args:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(args))})", args)
+        else:
+            cur.execute(f"EXECUTE {name}")
+
+    def record(self, name: str, seconds: float):
+        DB_QUERY_SECONDS.observe(seconds, query=name)
+        with self._lock:
+            st = self.stats.setdefault(name, {"calls": 0, "seconds": 0.0, "max_ms": 0.0})
+            st["calls"] += 1
+            st["seconds"] += seconds
+            st["max_ms"] = max(st["max_ms"], seconds * 1000)
+
+    def latency_report(self) -> List[Tuple[str, int, float, float]]:
+        #INFO: (query, calls, mean ms, max ms), slowest total time first
+        with self._lock:
+            rows = [(name, st["calls"], st["seconds"] / st["calls"] * 1000, st["max_ms"])
+                    for name, st in self.stats.items() if st["calls"]]
+            return sorted(rows, key=lambda r: r[1] * r[2], reverse=True)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
@@ -0,0 +1,41 @@
+import argparse
+import os
+import sys
+
+from database import DatabaseManager
+import config
+
+#INFO: Inspect and re-queue URLs that used up their retry attempts
+
+
+def list_dead(db, url_type=None, limit=50):
+    type_filter = "AND url_type = %s" if url_type else ""
+    params = ([url_type] if url_type else []) + [limit]
+    return db._execute_with_retry(f"""
+        SELECT url, url_type, attempts, last_visited, last_error FROM visited_urls
+        WHERE status = 'dead' {type_filter}
+        ORDER BY last_visited DESC LIMIT %s
+    """, tuple(params), is_select=True, fetch_all=True) or []
+
+
+if __name__ == "__main__":
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(current_dir)
+    ap = argparse.ArgumentParser(description="List or re-queue dead-lettered URLs")
+    ap.add_argument("--type", choices=("topic", "listing"), help="only this url_type")
+    ap.add_argument("--limit", type=int, default=50)
+    ap.add_argument("--requeue", action="store_true", help="reset attempts and put them back to pending")
+    args = ap.parse_args()
+
+    db = DatabaseManager(config.DATABASE_URL, retry_max_attempts=config.RETRY_MAX_ATTEMPTS)
+    try:
+        stats = db.retry_stats()
+        print(f"#INFO: {stats['retry']} URLs waiting to retry ({stats['retry_due']} due), {stats['dead']} dead")
+        if args.requeue:
+            count = db.requeue_dead(args.type, args.limit)
+            print(f"#INFO: Re-queued {count} dead URLs")
+        else:
+            for url, url_type, attempts, last_visited, error in list_dead(db, args.type, args.limit):
+                print(f"  {last_visited:%Y-%m-%d %H:%M} {url_type:<7} x{attempts} {url}\n      {error}")
+    finally:
+        db.close()
@@ -0,0 +1,139 @@
+import argparse
+import itertools
+import os
+import sys
+import time
+
+import psycopg2
+from database import DatabaseManager, INSERT_QUOTES_SQL
+import config
+
+#INFO: One-off pass over posts stored before quotes were split out at parse time.
+# Their content embeds quoted copies of earlier posts as "author\n:\n<quoted text>".
+# A block is only lifted out when its text matches the start of an earlier post by that
+# author in the same topic, so unmatched or cross-topic quotes stay inline. Re-parsing
+# the raw archive (reparse.py) is exact and should be preferred for archived pages.
+
+MAX_CANDIDATES = 200
+MIN_QUOTE_CHARS = 20
+
+UPDATE_CONTENT_SQL = """
+    UPDATE posts SET content = v.content
+    FROM (VALUES %s) AS v (post_id, content)
+    WHERE posts.post_id = v.post_id
+"""
+
+
+def _match_quote(lines, start, candidates):
+    #INFO: Longest candidate whose leading lines repeat at lines[start:]. Quotes are often
+    # cut short with "...", so the last matched line may be a truncated prefix
+    best = None
+    for post_id, cand_lines in candidates:
+        k = 0
+        while k < len(cand_lines) and start + k < len(lines) and lines[start + k] == cand_lines[k]:
+            k += 1
+        if k < len(cand_lines) and start + k < len(lines):
+            line = lines[start + k]
+            if line.endswith('...') and len(line) > 3 and cand_lines[k].startswith(line[:-3].rstrip()):
+                k += 1
+        if not k: continue
+        chars = sum(len(l) for l in lines[start:start + k])
+        if chars >= MIN_QUOTE_CHARS and (best is None or k > best[1]):
+            best = (post_id, k)
+    return best
+
+
+def split_topic(posts):
+    #INFO: posts in post order; yields (post_id, new_content, quotes) for rewritten posts
+    by_author = {}
+    for post_id, author, content in posts:
+        lines = (content or '').split('\n')
+        out, quotes = [], []
+        i = 0
+        while i < len(lines):
+            if i + 2 < len(lines) and lines[i + 1] == ':' and lines[i] in by_author:
+                match = _match_quote(lines, i + 2, reversed(by_author[lines[i]]))
+                if match:
+                    quotes.append((match[0], lines[i]))
+                    i += 2 + match[1]
+                    continue
+            out.append(lines[i])
+            i += 1
+        candidates = by_author.setdefault(author, [])
+        candidates.append((post_id, out))
+        if len(candidates) > MAX_CANDIDATES: candidates.pop(0)
+        if quotes:
+            yield post_id, '\n'.join(out), quotes
+
+
+def run_dedupe(batch_rows=1000, dry_run=False, vacuum=False):
+    db = DatabaseManager(config.DATABASE_URL)
+    reader = psycopg2.connect(config.DATABASE_URL, connect_timeout=20)
+    start = time.time()
+    scanned = rewritten = quote_count = bytes_before = bytes_after = 0
+    contents, quotes = [], []
+
+    def write():
+        if dry_run or not contents: return
+        #NOTE: References first, so an interrupted run leaves the quote text inline and a
+        # rerun finds and strips it again
+        if quotes: db._execute_with_retry(INSERT_QUOTES_SQL, values=quotes)
+        db._execute_with_retry(UPDATE_CONTENT_SQL, values=contents)
+        contents.clear()
+        quotes.clear()
+
+    try:
+        with reader.cursor(name='dedupe_posts') as cur:
+            cur.itersize = 20000
+            cur.execute("""
+                SELECT topic_id, post_id, author, content FROM posts
+                ORDER BY topic_id, length(post_id), post_id
+            """)
+            for topic_id, rows in itertools.groupby(cur, key=lambda r: r[0]):
+                originals = {}
+                topic_posts = []
+                for _, post_id, author, content in rows:
+                    scanned += 1
+                    originals[post_id] = content or ''
+                    topic_posts.append((post_id, author, content))
+                for post_id, content, found in split_topic(topic_posts):
+                    rewritten += 1
+                    quote_count += len(found)
+                    bytes_before += len(originals[post_id].encode('utf-8'))
+                    bytes_after += len(content.encode('utf-8'))
+                    contents.append((post_id, content))
+                    quotes.extend((post_id, pos, quoted, author) for pos, (quoted, author) in enumerate(found))
+                if len(contents) >= batch_rows:
+                    write()
+                    print(f"  #INFO: {scanned} posts scanned, {rewritten} rewritten, "
+                          f"{(bytes_before - bytes_after) // 1024}KB of quoted text removed")
+        write()
+        reader.commit()
+    finally:
+        reader.close()
+
+    dupes = db._execute_with_retry("SELECT COUNT(*) - COUNT(DISTINCT content_hash) FROM posts", is_select=True)
+    print(f"#INFO: {'Would rewrite' if dry_run else 'Rewrote'} {rewritten}/{scanned} posts, {quote_count} quotes "
+          f"as references, {(bytes_before - bytes_after) // 1024}KB saved in {time.time() - start:.1f}s")
+    if dupes:
+        print(f"#INFO: {dupes[0]} posts share their body with an earlier post (same content_hash)")
+    db.close()
+    if vacuum and not dry_run:
+        #NOTE: Own connection, the manager's statement timeout is far too short for a VACUUM
+        print("#INFO: VACUUM ANALYZE posts...")
+        conn = psycopg2.connect(config.DATABASE_URL, connect_timeout=20)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("VACUUM ANALYZE posts")
+        conn.close()
+
+
+if __name__ == "__main__":
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(current_dir)
+    ap = argparse.ArgumentParser(description="Replace inline quoted copies in stored posts with quote references")
+    ap.add_argument("--batch-rows", type=int, default=1000)
+    ap.add_argument("--dry-run", action="store_true", help="only report what would change")
+    ap.add_argument("--vacuum", action="store_true", help="VACUUM ANALYZE posts afterwards")
+    args = ap.parse_args()
+    run_dedupe(batch_rows=args.batch_rows, dry_run=args.dry_run, vacuum=args.vacuum)
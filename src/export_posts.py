@@ -0,0 +1,202 @@
+import argparse
+import datetime
+import gzip
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from database import DatabaseManager
+from parser import SITE_TZ
+import config
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+#INFO: Incremental export of posts. Rows stream from a server-side cursor in fixed-size
+# batches straight into Parquet/Arrow or gzipped JSONL files, so memory stays flat however
+# big the table is. A (scraped_at, post_id) watermark per output directory means each run
+# only picks up rows added since the last one.
+
+COLUMNS = ("post_id", "topic_id", "author", "post_time", "content", "source_url", "scraped_at", "posted_at")
+EXTENSIONS = {"parquet": "parquet", "arrow": "arrow", "jsonl": "jsonl.gz"}
+
+def _schema():
+    types = {"scraped_at": pa.timestamp("us"), "posted_at": pa.timestamp("us", tz="UTC")}
+    return pa.schema([(c, types.get(c, pa.string())) for c in COLUMNS])
+
+
+class PartitionWriter:
+    #INFO: One open file at a time. Rows arrive sorted by partition, so a partition is
+    # finished as soon as the next one starts
+    def __init__(self, out_dir: Path, fmt: str, run_id: str):
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.run_id = run_id
+        self.partition = None
+        self.path = None
+        self.handle = None
+        self.files = []
+
+    def write(self, partition: str, rows):
+        if partition != self.partition:
+            self.close()
+            self.partition = partition
+            part_dir = self.out_dir / partition
+            part_dir.mkdir(parents=True, exist_ok=True)
+            self.path = part_dir / f"part-{self.run_id}.{EXTENSIONS[self.fmt]}.inprogress"
+        if self.fmt == "jsonl":
+            if self.handle is None:
+                self.handle = gzip.open(self.path, "wt", encoding="utf-8")
+            for row in rows:
+                record = dict(zip(COLUMNS, row))
+                for column in ("scraped_at", "posted_at"):
+                    record[column] = record[column].isoformat() if record[column] else None
+                self.handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+            return
+        table = pa.Table.from_pylist([dict(zip(COLUMNS, row)) for row in rows], schema=_schema())
+        if self.handle is None:
+            if self.fmt == "parquet":
+                self.handle = pq.ParquetWriter(self.path, _schema(), compression="zstd")
+            else:
+                self.handle = pa.ipc.new_file(str(self.path), _schema())
+        self.handle.write_table(table)
+
+    def close(self):
+        if self.handle is None: return
+        self.handle.close()
+        self.handle = None
+        self.files.append(self.path)
+
+    def publish(self):
+        #INFO: Files only lose their .inprogress suffix once the whole run has succeeded
+        self.close()
+        for path in self.files:
+            path.rename(path.with_suffix(""))
+        return len(self.files)
+
+
+def _partition(row, partition_by: str) -> str:
+    if partition_by == "topic":
+        return f"topic={row[1] or 'unknown'}"
+    return f"scrape_date={row[6]:%Y-%m-%d}" if row[6] else "scrape_date=unknown"
+
+
+def read_watermark(path: Path):
+    if not path.exists(): return None
+    data = json.loads(path.read_text())
+    return datetime.datetime.fromisoformat(data["scraped_at"]), data["post_id"]
+
+
+def write_watermark(path: Path, scraped_at: datetime.datetime, post_id: str, rows: int):
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"scraped_at": scraped_at.isoformat(), "post_id": post_id,
+                               "rows": rows, "exported_at": datetime.datetime.now().isoformat(timespec="seconds")}))
+    tmp.replace(path)
+
+
+def run_export(out_dir, fmt="auto", partition_by="date", batch_rows=10000, lag_seconds=300, full=False,
+               posted_from=None, posted_to=None):
+    if fmt == "auto":
+        fmt = "parquet" if pa else "jsonl"
+    if fmt in ("parquet", "arrow") and not pa:
+        print(f"#NOTE: pyarrow is not installed, exporting gzipped JSONL instead of {fmt}")
+        fmt = "jsonl"
+    #NOTE: A posted_at window is a one-off slice in its own directory, it neither reads nor
+    # moves the incremental watermark
+    windowed = bool(posted_from or posted_to)
+    suffix = ""
+    if windowed:
+        suffix = "-posted-" + "-".join(f"{v:%Y%m%d}" if v else "open" for v in (posted_from, posted_to))
+    out_dir = Path(out_dir) / f"{fmt}-by-{partition_by}{suffix}"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    watermark_path = out_dir / "_watermark.json"
+    watermark = None if full or windowed else read_watermark(watermark_path)
+
+    where, params = [], []
+    #INFO: scraped_at is the inserting transaction's start time, so a slow flush can commit
+    # rows older than ones already visible. The lag keeps those out until they have landed
+    where.append("scraped_at < CURRENT_TIMESTAMP - make_interval(secs => %s)")
+    params.append(lag_seconds)
+    #INFO: A posted_at window lets a partitioned posts table skip every other month
+    if posted_from:
+        where.append("posted_at >= %s")
+        params.append(posted_from)
+    if posted_to:
+        where.append("posted_at < %s")
+        params.append(posted_to)
+    if watermark:
+        where.append("(scraped_at, post_id) > (%s, %s)")
+        params.extend(watermark)
+        print(f"#INFO: Exporting posts after {watermark[0].isoformat()} / {watermark[1]}")
+    order = "topic_id, scraped_at, post_id" if partition_by == "topic" else "scraped_at, post_id"
+    query = f"SELECT {', '.join(COLUMNS)} FROM posts WHERE {' AND '.join(where)} ORDER BY {order}"
+
+    db = DatabaseManager(config.DATABASE_URL)
+    writer = PartitionWriter(out_dir, fmt, datetime.datetime.now().strftime("%Y%m%d-%H%M%S"))
+    start = time.time()
+    rows_out = 0
+    high = watermark
+    try:
+        with db.connection() as conn:
+            conn.autocommit = False
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SET LOCAL statement_timeout = 0")
+                with conn.cursor(name="export_posts") as cur:
+                    cur.itersize = batch_rows
+                    cur.execute(query, params)
+                    while True:
+                        rows = cur.fetchmany(batch_rows)
+                        if not rows: break
+                        group, key = [], None
+                        for row in rows:
+                            part = _partition(row, partition_by)
+                            if part != key and group:
+                                writer.write(key, group)
+                                group = []
+                            key = part
+                            group.append(row)
+                            if row[6] and (high is None or (row[6], row[0]) > high):
+                                high = (row[6], row[0])
+                        writer.write(key, group)
+                        rows_out += len(rows)
+                        print(f"  #INFO: {rows_out} rows ({rows_out / max(time.time() - start, 1e-6):.0f} rows/s)")
+                conn.commit()
+                files = writer.publish()
+            except Exception:
+                conn.rollback()
+                writer.close()
+                raise
+    finally:
+        db.close()
+
+    if rows_out and high and not windowed:
+        write_watermark(watermark_path, high[0], high[1], rows_out)
+    print(f"#INFO: Exported {rows_out} posts into {files} files under {out_dir} in {time.time() - start:.1f}s")
+    return rows_out
+
+
+if __name__ == "__main__":
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(current_dir)
+    ap = argparse.ArgumentParser(description="Export new posts to partitioned Parquet/Arrow or gzipped JSONL")
+    ap.add_argument("--out", default=str(config.OUTPUT_DIR / "export"))
+    ap.add_argument("--format", choices=("auto", "parquet", "arrow", "jsonl"), default="auto",
+                    help="auto picks parquet when pyarrow is installed, gzipped JSONL otherwise")
+    ap.add_argument("--partition-by", choices=("date", "topic"), default="date")
+    ap.add_argument("--batch-rows", type=int, default=10000, help="rows per cursor fetch and write")
+    ap.add_argument("--lag-seconds", type=int, default=300, help="skip rows scraped more recently than this")
+    ap.add_argument("--full", action="store_true", help="ignore the watermark and export everything")
+    ap.add_argument("--posted-from", help="only posts made at or after this ISO date/time (site time if no offset)")
+    ap.add_argument("--posted-to", help="only posts made before this ISO date/time")
+    args = ap.parse_args()
+    window = [datetime.datetime.fromisoformat(v) if v else None for v in (args.posted_from, args.posted_to)]
+    window = [v.replace(tzinfo=SITE_TZ) if v and v.tzinfo is None else v for v in window]
+    run_export(args.out, fmt=args.format, partition_by=args.partition_by, batch_rows=args.batch_rows,
+               lag_seconds=args.lag_seconds, full=args.full, posted_from=window[0], posted_to=window[1])
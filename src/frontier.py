@@ -0,0 +1,41 @@
+import time
+from typing import Optional
+from parser import get_topic_page
+import config
+
+#INFO: Frontier priority. A URL's score is its value in points plus its discovery time in
+# hours, so one point of value is worth PRIORITY_HOURS_PER_POINT hours of freshness and
+# newer discoveries win among equals. Being monotonic in time keeps the score static once
+# written, which is what lets the claim query walk a plain (url_type, priority) index.
+
+FRONT_PAGE = 5.0
+LISTING = 4.0
+TOPIC = 3.0
+LISTING_SOURCE_BONUS = 0.5
+DEPTH_PENALTY = 0.15
+MAX_DEPTH = 20
+
+
+def listing_page(url: str) -> int:
+    path = url.split('nairaland.com')[-1].split('#')[0].split('?')[0].strip('/')
+    parts = path.split('/')
+    if len(parts) > 1 and parts[-1].isdigit():
+        return int(parts[-1])
+    return 0
+
+
+def value_points(url: str, url_type: str, source_type: Optional[str] = None) -> float:
+    if url_type == 'listing':
+        path = url.split('nairaland.com')[-1].strip('/')
+        if not path: return FRONT_PAGE
+        return LISTING - DEPTH_PENALTY * min(listing_page(url), MAX_DEPTH)
+    points = TOPIC - DEPTH_PENALTY * min(get_topic_page(url), MAX_DEPTH)
+    if source_type == 'listing':
+        #INFO: Linked from a board or the front page, i.e. currently active
+        points += LISTING_SOURCE_BONUS
+    return points
+
+
+def score_url(url: str, url_type: str, source_type: Optional[str] = None, now: Optional[float] = None) -> float:
+    hours = (now if now is not None else time.time()) / 3600
+    return hours + config.PRIORITY_HOURS_PER_POINT * value_points(url, url_type, source_type)
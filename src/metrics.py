@@ -0,0 +1,185 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+#INFO: Minimal in-process metrics: counters, gauges and histograms rendered in the
+# Prometheus text format on a local HTTP port, plus an optional JSONL event sink.
+# Kept dependency-free so every module (browser, parser workers, DB) can import it.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _key(labels: Dict) -> Tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _fmt_labels(key: Tuple, extra: Optional[Tuple] = None) -> str:
+    items = list(key) + list(extra or ())
+    if not items: return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, registry, name: str, help_text: str):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.emit(self.name, amount, labels)
+
+    def render(self):
+        with self._lock:
+            return [f"{self.name}{_fmt_labels(k)} {v}" for k, v in self.values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self.values[_key(labels)] = value
+
+    def render(self):
+        with self._lock:
+            return [f"{self.name}{_fmt_labels(k)} {v}" for k, v in self.values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, help_text, buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text)
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = _key(labels)
+        with self._lock:
+            counts = self.series.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound: counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+        self.registry.emit(self.name, value, labels)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for key, counts in self.series.items():
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_fmt_labels(key, (('le', bound),))} {count}")
+                lines.append(f"{self.name}_bucket{_fmt_labels(key, (('le', '+Inf'),))} {counts[-2]}")
+                lines.append(f"{self.name}_count{_fmt_labels(key)} {counts[-2]}")
+                lines.append(f"{self.name}_sum{_fmt_labels(key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+        self.worker_id = ""
+        self._sink = None
+        self._sink_lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(self, name, help_text, **kwargs)
+        return metric
+
+    def counter(self, name: str, help_text: str = "") -> Counter:
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str = "") -> Gauge:
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str = "", buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def open_sink(self, path: str):
+        self._sink = open(path, "a", encoding="utf-8", buffering=1)
+
+    def emit(self, name: str, value: float, labels: Dict):
+        if not self._sink: return
+        event = {"ts": round(time.time(), 3), "worker": self.worker_id, "metric": name,
+                 "value": value, **labels}
+        with self._sink_lock:
+            self._sink.write(json.dumps(event) + "\n")
+
+    def serve(self, port: int, host: str = "0.0.0.0"):
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+
+REGISTRY = Registry()
+
+#INFO: Crawl-wide metrics, shared by every module
+STAGE_SECONDS = REGISTRY.histogram("crawl_stage_seconds", "Wall time per crawl stage")
+PAGES = REGISTRY.counter("crawl_pages_total", "Pages handled, by type and outcome")
+POSTS = REGISTRY.counter("crawl_posts_total", "Posts extracted and queued for storage")
+CF_BLOCKS = REGISTRY.counter("crawl_cf_blocks_total", "Cloudflare challenges and blocks seen")
+DB_RETRIES = REGISTRY.counter("db_retries_total", "Database statements retried after a connection error")
+DB_ERRORS = REGISTRY.counter("db_errors_total", "Database statements that failed without retry")
+QUEUE_DEPTH = REGISTRY.gauge("crawl_queue_depth", "Items waiting in each crawler queue")
+RETRIES = REGISTRY.counter("crawl_url_failures_total", "Failed URLs by resulting status (retry or dead)")
+FRONTIER = REGISTRY.gauge("crawl_frontier_urls", "URLs in the shared frontier by status")
+
+
+def stage(name: str, **labels):
+    return STAGE_SECONDS.time(stage=name, **labels)
@@ -1,21 +1,165 @@
+import argparse
+import datetime
+import io
 import json
 import os
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from database import DatabaseManager
+
+import psycopg2
+from database import DatabaseManager, posts_sql
+from parser import get_topic_id, parse_post_time
 import config
 
+#INFO: Bulk loader for the legacy JSONL export. The file is cut into line-aligned byte
+# ranges, one per worker; each worker COPYs a batch into a temp staging table and merges
+# it into posts with one INSERT ... SELECT. The batch's end offset is written to
+# load_checkpoints in the same transaction, so a restart resumes exactly where the last
+# committed batch ended and never loads a line twice.
+
+POST_COLUMNS = ("post_id", "topic_id", "author", "post_time", "content", "source_url", "posted_at")
+
+MERGE_SQL = """
+    INSERT INTO posts (post_id, topic_id, author, post_time, content, source_url, posted_at)
+    SELECT DISTINCT ON (n.post_id) n.post_id, n.topic_id, n.author, n.post_time, n.content, n.source_url, {posted_at}
+    FROM stage_posts n
+    {existing}
+    ORDER BY n.post_id
+    ON CONFLICT ({conflict}) DO NOTHING
+"""
+
 def sanitize(text):
     if not isinstance(text, str):
         return str(text)
     # Remove null bytes which Postgres hates in TEXT fields
     return text.replace('\u0000', '').replace('\x00', '')
 
-def run_migration():
+def _copy_field(value: str) -> str:
+    #INFO: COPY text format, backslash first so the other escapes survive
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+                 .replace('\n', '\\n').replace('\r', '\\r'))
+
+def to_row(line: str, exported_at=None):
+    data = json.loads(line)
+    # Support both 'time' and 'post_time' keys
+    p_time = data.get('time') or data.get('post_time') or ""
+    source_url = sanitize(data.get('source_url', ''))
+    #NOTE: The export never recorded fetch times, relative dates resolve against the file's mtime
+    posted_at = parse_post_time(str(p_time), exported_at)
+    row = (
+        sanitize(data['post_id']),
+        sanitize(data.get('topic_id') or get_topic_id(source_url)),
+        sanitize(data['author']),
+        sanitize(p_time),
+        sanitize(data['content']),
+        source_url,
+        posted_at.isoformat() if posted_at else None,
+    )
+    if not row[0]: raise ValueError("empty post_id")
+    return row
+
+def plan_splits(path: Path, workers: int):
+    #INFO: Nominal equal byte ranges, each boundary pushed forward to the next line start
+    size = path.stat().st_size
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, workers):
+            f.seek(max(size * i // workers, bounds[-1]))
+            if f.tell() > 0:
+                f.seek(f.tell() - 1)
+                f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+def load_split(db_url, source, split, next_offset, end_offset, batch_rows, reject_path, partitioned=False):
+    conn = psycopg2.connect(db_url, connect_timeout=20)
+    merge_sql = posts_sql(MERGE_SQL, partitioned)
+    exported_at = datetime.datetime.fromtimestamp(os.path.getmtime(source), datetime.timezone.utc)
+    loaded = rejected = 0
+    try:
+        with conn.cursor() as cur:
+            cur.execute("CREATE TEMP TABLE stage_posts (LIKE posts INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+        conn.commit()
+        with open(source, 'rb') as f, open(reject_path, 'a', encoding='utf-8') as rejects:
+            f.seek(next_offset)
+            while f.tell() < end_offset:
+                buf = io.StringIO()
+                rows = bad = 0
+                while rows + bad < batch_rows and f.tell() < end_offset:
+                    offset = f.tell()
+                    raw = f.readline()
+                    if not raw.strip(): continue
+                    try:
+                        row = to_row(raw.decode('utf-8'), exported_at)
+                    except Exception as e:
+                        bad += 1
+                        rejects.write(json.dumps({"offset": offset, "error": str(e)[:200],
+                                                  "line": raw.decode('utf-8', 'replace').rstrip('\n')}) + "\n")
+                        continue
+                    buf.write("\t".join("\\N" if v is None else _copy_field(v) for v in row) + "\n")
+                    rows += 1
+                #NOTE: Rejects hit the disk before the commit, a crash in between can only
+                # repeat a reject line on resume, never lose one
+                rejects.flush()
+                buf.seek(0)
+                with conn.cursor() as cur:
+                    cur.copy_expert(f"COPY stage_posts ({', '.join(POST_COLUMNS)}) FROM STDIN", buf)
+                    cur.execute(merge_sql)
+                    inserted = cur.rowcount
+                    cur.execute("""
+                        UPDATE load_checkpoints
+                        SET next_offset = %s, rows_loaded = rows_loaded + %s,
+                            rows_rejected = rows_rejected + %s, updated_at = CURRENT_TIMESTAMP
+                        WHERE source = %s AND split = %s
+                    """, (f.tell(), inserted, bad, str(source), split))
+                conn.commit()
+                loaded += inserted
+                rejected += bad
+    finally:
+        conn.close()
+    return split, loaded, rejected
+
+def prepare_checkpoints(db, source: Path, workers: int, restart: bool):
+    key = str(source)
+    size = source.stat().st_size
+    if restart:
+        db._execute_with_retry("DELETE FROM load_checkpoints WHERE source = %s", (key,))
+    rows = db._execute_with_retry("""
+        SELECT split, next_offset, end_offset, file_size FROM load_checkpoints
+        WHERE source = %s ORDER BY split
+    """, (key,), is_select=True, fetch_all=True)
+    if rows:
+        if any(r[3] != size for r in rows):
+            raise RuntimeError(f"{source} changed size since the last run, use --restart to load it again")
+        print(f"#INFO: Resuming {len(rows)} splits from checkpoints")
+        return [(split, nxt, end) for split, nxt, end, _ in rows]
+    splits = plan_splits(source, workers)
+    for split, (start, end) in enumerate(splits):
+        db._execute_with_retry("""
+            INSERT INTO load_checkpoints (source, split, start_offset, end_offset, next_offset, file_size)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (key, split, start, end, start, size))
+    return [(split, start, end) for split, (start, end) in enumerate(splits)]
+
+def report_progress(db, source: Path, start: float, base_rows: int):
+    row = db._execute_with_retry("""
+        SELECT COALESCE(SUM(rows_loaded), 0), COALESCE(SUM(rows_rejected), 0),
+               COALESCE(SUM(next_offset - start_offset), 0), COALESCE(SUM(end_offset - start_offset), 0)
+        FROM load_checkpoints WHERE source = %s
+    """, (str(source),), is_select=True)
+    if not row: return
+    loaded, rejected, done, total = (int(v) for v in row)
+    elapsed = max(time.time() - start, 1e-6)
+    print(f"  #INFO: {loaded} posts loaded, {rejected} rejected, {done / max(total, 1):.1%} of file "
+          f"({(loaded - base_rows) / elapsed:.0f} rows/s)")
+
+def run_migration(legacy_file=None, workers=4, batch_rows=10000, restart=False):
     print("#INFO: Starting migration script...")
-    legacy_file = config.OUTPUT_DIR / "scraped_posts.jsonl"
-    
+    legacy_file = Path(legacy_file or config.OUTPUT_DIR / "scraped_posts.jsonl").resolve()
+
     if not legacy_file.exists():
         print(f"#NOTE: No legacy file found at {legacy_file}")
         return
@@ -26,49 +170,47 @@ def run_migration():
     except Exception as e:
         print(f"#WARN: Database connection failed: {e}")
         return
-    
-    total_count = 0
-    print(f"#INFO: Migrating in batches of 50 with sanitization...")
-    
-    batch = []
+
+    try:
+        splits = prepare_checkpoints(db, legacy_file, workers, restart)
+    except RuntimeError as e:
+        print(f"#WARN: {e}")
+        db.close()
+        return
+    todo = [(split, nxt, end) for split, nxt, end in splits if nxt < end]
+    base = db._execute_with_retry("SELECT COALESCE(SUM(rows_loaded), 0) FROM load_checkpoints WHERE source = %s",
+                                  (str(legacy_file),), is_select=True)
+    base_rows = int(base[0]) if base else 0
+    print(f"#INFO: Loading {legacy_file.name} with {len(todo)} workers, {batch_rows} rows per COPY batch...")
+
+    start = time.time()
     try:
-        with open(legacy_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                try:
-                    data = json.loads(line)
-                    # Support both 'time' and 'post_time' keys
-                    p_time = data.get('time') or data.get('post_time') or ""
-                    
-                    cleaned_data = {
-                        "post_id": sanitize(data['post_id']),
-                        "author": sanitize(data['author']),
-                        "time": sanitize(p_time),
-                        "content": sanitize(data['content']),
-                        "source_url": sanitize(data.get('source_url', ''))
-                    }
-                    
-                    batch.append(cleaned_data)
-                    
-                    if len(batch) >= 50:
-                        db.save_posts(batch)
-                        total_count += len(batch)
-                        print(f"  #INFO: Migrated {total_count} posts...")
-                        batch = []
-                        time.sleep(0.5)
-                except Exception as e:
-                    print(f"  #NOTE: Skipped line: {e}")
-                    continue
-        
-        if batch:
-            db.save_posts(batch)
-            total_count += len(batch)
-            
-        print(f"#INFO: Migration complete. Total posts moved: {total_count}")
-        
+        with ProcessPoolExecutor(max_workers=max(len(todo), 1)) as pool:
+            futures = [pool.submit(load_split, config.DATABASE_URL, legacy_file, split, nxt, end, batch_rows,
+                                   legacy_file.with_name(f"{legacy_file.stem}.rejects-{split}.jsonl"),
+                                   db.posts_partitioned)
+                       for split, nxt, end in todo]
+            while not all(f.done() for f in futures):
+                time.sleep(5)
+                report_progress(db, legacy_file, start, base_rows)
+            for f in futures:
+                split, loaded, rejected = f.result()
+                if rejected:
+                    print(f"  #NOTE: Split {split}: {rejected} bad lines written to its reject file")
+        report_progress(db, legacy_file, start, base_rows)
+        print(f"#INFO: Migration complete in {time.time() - start:.1f}s")
     except Exception as e:
-        print(f"#WARN: Migration interrupted: {e}")
+        print(f"#WARN: Migration interrupted: {e}. Run again to resume from the last checkpoint.")
+    finally:
+        db.close()
 
 if __name__ == "__main__":
     current_dir = os.path.dirname(os.path.abspath(__file__))
     sys.path.append(current_dir)
-    run_migration()
+    ap = argparse.ArgumentParser(description="Bulk load the legacy scraped_posts.jsonl into Postgres")
+    ap.add_argument("--file", help="JSONL export, defaults to OUTPUT_DIR/scraped_posts.jsonl")
+    ap.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    ap.add_argument("--batch-rows", type=int, default=10000, help="lines per COPY and merge transaction")
+    ap.add_argument("--restart", action="store_true", help="discard checkpoints and load from the first line")
+    args = ap.parse_args()
+    run_migration(args.file, workers=args.workers, batch_rows=args.batch_rows, restart=args.restart)
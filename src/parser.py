@@ -1,6 +1,27 @@
 from bs4 import BeautifulSoup
 from typing import List, Dict, Optional
 import datetime
+import functools
+import re
+import config
+
+#INFO: lxml is a drop-in BeautifulSoup tree builder that is much faster than html.parser
+try:
+    import lxml  # noqa: F401
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+def resolve_backend(backend: Optional[str] = None) -> str:
+    backend = backend or config.PARSER_BACKEND
+    if backend == 'auto':
+        return 'lxml' if HAS_LXML else 'html.parser'
+    if backend == 'lxml' and not HAS_LXML:
+        return 'html.parser'
+    return backend
+
+def make_soup(html_content: str, backend: Optional[str] = None) -> BeautifulSoup:
+    return BeautifulSoup(html_content, resolve_backend(backend))
 
 def get_topic_id(url: str) -> str:
     #INFO: Extract numeric topic ID from URL
@@ -11,6 +32,14 @@ def get_topic_id(url: str) -> str:
         return parts[0]
     return ""
 
+def get_topic_page(url: str) -> int:
+    #INFO: Zero-based page within a topic, nairaland.com/12345/topic-title/3
+    path = url.split('nairaland.com/')[-1].split('#')[0].split('?')[0].strip('/')
+    parts = path.split('/')
+    if len(parts) > 2 and parts[0].isdigit() and parts[2].isdigit():
+        return int(parts[2])
+    return 0
+
 def get_url_type(url: str) -> str:
     path = url.split('nairaland.com/')[-1].strip('/')
     if not path: return 'listing'
@@ -21,8 +50,82 @@ def get_url_type(url: str) -> str:
         return 'listing'
     return 'listing'
 
+#INFO: Nairaland prints post times in West Africa Time (UTC+1, no DST): "3:15pm" for today,
+# "3:15pm On Jan 05" earlier this year and "3:15pm On Jan 05, 2021" for older posts
+SITE_TZ = datetime.timezone(datetime.timedelta(hours=1))
+_MONTHS = {m: i for i, m in enumerate(("jan", "feb", "mar", "apr", "may", "jun",
+                                        "jul", "aug", "sep", "oct", "nov", "dec"), 1)}
+_POST_TIME = re.compile(r"(\d{1,2}):(\d{2})\s*([ap]m)(?:\s+on\s+([a-z]{3})[a-z]*\.?\s+(\d{1,2})(?:,?\s+(\d{4}))?)?",
+                        re.IGNORECASE)
+
+@functools.lru_cache(maxsize=65536)
+def _resolve_post_time(text: str, today: datetime.date) -> Optional[datetime.datetime]:
+    #NOTE: Keyed on the site-local fetch date, so a whole crawl day shares one cache
+    m = _POST_TIME.match(text)
+    if not m: return None
+    hour = int(m.group(1)) % 12 + (12 if m.group(3).lower() == 'pm' else 0)
+    minute = int(m.group(2))
+    if not m.group(4):
+        return datetime.datetime(today.year, today.month, today.day, hour, minute, tzinfo=SITE_TZ)
+    month = _MONTHS.get(m.group(4).lower())
+    if not month: return None
+    year = int(m.group(6)) if m.group(6) else today.year
+    try:
+        posted = datetime.datetime(year, month, int(m.group(5)), hour, minute, tzinfo=SITE_TZ)
+        #INFO: A year-less date after the fetch date can only be from last year
+        if not m.group(6) and posted.date() > today:
+            posted = posted.replace(year=year - 1)
+    except ValueError:
+        return None
+    return posted
+
+def parse_post_time(text: str, fetched_at: Optional[datetime.datetime] = None) -> Optional[datetime.datetime]:
+    #INFO: Display text to an aware datetime, resolved against the fetch time (naive = UTC)
+    if not text: return None
+    if fetched_at is None:
+        fetched_at = datetime.datetime.now(datetime.timezone.utc)
+    elif fetched_at.tzinfo is None:
+        fetched_at = fetched_at.replace(tzinfo=datetime.timezone.utc)
+    return _resolve_post_time(text.strip(), fetched_at.astimezone(SITE_TZ).date())
+
+def _split_url(url: str) -> List[str]:
+    path = url.split('#')[0].split('?')[0]
+    if '://' in path:
+        host, _, path = path.split('://', 1)[1].partition('/')
+        if 'nairaland.com' not in host: return []
+    return [p for p in path.split('/') if p]
+
+def canonical_url(url: str) -> str:
+    #INFO: One fetchable spelling per page: https, www host, no query or fragment,
+    # no trailing slash and no explicit /0 for the first page
+    parts = _split_url(url)
+    if not parts and 'nairaland.com' not in url and not url.startswith('/'):
+        return url.split('#')[0]
+    if parts and parts[-1] == '0' and len(parts) > 1:
+        parts = parts[:-1]
+    return "https://www.nairaland.com/" + "/".join(parts)
+
+def url_key(url: str) -> str:
+    #INFO: Dedupe key, (topic_id, page) for topics and (board, page) for listings.
+    # Slug spellings, query strings and fragments all collapse onto the same key
+    parts = _split_url(url)
+    if not parts and 'nairaland.com' not in url and not url.startswith('/'):
+        return "url:" + url.split('#')[0]
+    if parts and parts[0].isdigit():
+        page = 0
+        if len(parts) > 2 and parts[2].isdigit(): page = int(parts[2])
+        elif len(parts) == 2 and parts[1].isdigit(): page = int(parts[1])
+        return f"t:{int(parts[0])}:{page}"
+    page = 0
+    if len(parts) > 1 and parts[-1].isdigit():
+        page = int(parts[-1])
+        parts = parts[:-1]
+    return f"b:{'/'.join(parts).lower()}:{page}"
+
 def extract_topic_links(html_content: str) -> List[str]:
-    soup = BeautifulSoup(html_content, 'html.parser')
+    return _topic_links(make_soup(html_content))
+
+def _topic_links(soup: BeautifulSoup) -> List[str]:
     results = []
     links = soup.find_all('a')
     for link in links:
@@ -42,7 +145,9 @@ def extract_topic_links(html_content: str) -> List[str]:
     return list(set(results))
 
 def extract_pagination_links(html_content: str) -> List[str]:
-    soup = BeautifulSoup(html_content, 'html.parser')
+    return _pagination_links(make_soup(html_content))
+
+def _pagination_links(soup: BeautifulSoup) -> List[str]:
     results = []
     pgn_links = soup.find_all('a', class_='pgn')
     for link in pgn_links:
@@ -54,8 +159,26 @@ def extract_pagination_links(html_content: str) -> List[str]:
             results.append(href)
     return list(set(results))
 
-def parse_topic_content(html_content: str) -> List[Dict]:
-    soup = BeautifulSoup(html_content, 'html.parser')
+def parse_topic_content(html_content: str, fetched_at: Optional[datetime.datetime] = None) -> List[Dict]:
+    return _topic_posts(make_soup(html_content), fetched_at)
+
+def _split_quotes(content_div) -> List[Dict]:
+    #INFO: Quotes of other posts are stored as references, not as copies of their text.
+    # Only blockquotes linking to /post/<id> are lifted out, free-form quotes stay inline
+    quotes = []
+    for bq in content_div.find_all('blockquote'):
+        if bq.find_parent('blockquote'): continue
+        #NOTE: The reference has to be the blockquote's own link, not one inside a quote it nests
+        link = next((a for a in bq.find_all('a', href=True) if a.find_parent('blockquote') is bq), None)
+        href = link['href'] if link else ''
+        if '/post/' not in href: continue
+        quoted_id = href.split('/post/')[-1].split('#')[0].split('?')[0].strip('/')
+        if not quoted_id.isdigit(): continue
+        quotes.append({"post_id": quoted_id, "author": link.get_text(strip=True)})
+        bq.decompose()
+    return quotes
+
+def _topic_posts(soup: BeautifulSoup, fetched_at: Optional[datetime.datetime] = None) -> List[Dict]:
     posts = []
     body_cells = soup.find_all('td', class_='l w pd')
     for cell in body_cells:
@@ -65,6 +188,7 @@ def parse_topic_content(html_content: str) -> List[Dict]:
                 post_id = post_id[2:]
             content_div = cell.find('div', class_='narrow')
             if not content_div: continue
+            quotes = _split_quotes(content_div)
             content_text = content_div.get_text('\n', strip=True)
             parent_tr = cell.find_parent('tr')
             header_tr = parent_tr.find_previous_sibling('tr')
@@ -76,12 +200,27 @@ def parse_topic_content(html_content: str) -> List[Dict]:
                 time_span = header_tr.find('span', class_='s')
                 if time_span:
                     post_time = time_span.get_text(' ', strip=True).split('Modified:')[0].strip()
-            if post_id and content_text:
+            if post_id and (content_text or quotes):
                 posts.append({
                     "post_id": post_id,
                     "author": author,
                     "time": post_time,
-                    "content": content_text
+                    "posted_at": parse_post_time(post_time, fetched_at),
+                    "content": content_text,
+                    "quotes": quotes
                 })
         except Exception: continue
     return posts
+
+def parse_page(html_content: str, url: str, url_type: Optional[str] = None,
+               fetched_at: Optional[datetime.datetime] = None) -> Dict:
+    #INFO: Single-pass entry point: builds the tree once and runs every extractor on it
+    page_type = url_type or get_url_type(url)
+    soup = make_soup(html_content)
+    return {
+        "url": url,
+        "page_type": page_type,
+        "topic_links": _topic_links(soup),
+        "pagination_links": _pagination_links(soup),
+        "posts": _topic_posts(soup, fetched_at) if page_type == 'topic' else [],
+    }
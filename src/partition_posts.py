@@ -0,0 +1,157 @@
+import argparse
+import datetime
+import os
+import sys
+import time
+
+from database import DatabaseManager, create_month_partitions, month_start, add_months
+import config
+
+#INFO: Opt-in conversion of posts into a table range-partitioned by month on posted_at.
+# The copy runs beside the live table; only the final catch-up of rows written during the
+# copy and the rename happen under an exclusive lock. Rows without a posted_at go to the
+# posts_undated default partition. The old table is kept as posts_unpartitioned.
+#NOTE: Run backfill_posted_at.py first, and keep reparse.py from running meanwhile: the
+# catch-up only picks up newly inserted rows, not updates to copied ones.
+
+NEW = "posts_partitioned"
+OLD = "posts_unpartitioned"
+
+#INFO: Index name -> definition, created on the parent so every partition gets its own copy
+INDEXES = {
+    "posts_post_key": "UNIQUE (post_id, posted_at) NULLS NOT DISTINCT",
+    "idx_posts_topic_num": "(topic_num)",
+    "idx_posts_scraped": "(scraped_at, post_id)",
+    "idx_posts_content_hash": "(content_hash)",
+    "idx_posts_posted": "(posted_at)",
+    "idx_posts_search": "USING GIN (search_vector)",
+    "idx_posts_author": "(lower(author))",
+}
+
+
+def _columns(cur):
+    #INFO: Generated columns are recomputed by the new table, they cannot be inserted
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'posts' AND is_generated = 'NEVER'
+        ORDER BY ordinal_position
+    """)
+    return ", ".join(row[0] for row in cur.fetchall())
+
+
+def _index_sql(name, definition, table):
+    if definition.startswith("UNIQUE"):
+        return f"CREATE UNIQUE INDEX {name} ON {table} {definition[len('UNIQUE '):]}"
+    return f"CREATE INDEX {name} ON {table} {definition}"
+
+
+def explain_window(db, first, end):
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute("EXPLAIN SELECT COUNT(*) FROM posts WHERE posted_at >= %s AND posted_at < %s", (first, end))
+        plan = [row[0] for row in cur.fetchall()]
+    scanned = sorted({line.split(" on ")[1].split()[0] for line in plan if " on posts" in line})
+    return scanned
+
+
+def run_partition(first_month=None, months_ahead=3):
+    db = DatabaseManager(config.DATABASE_URL)
+    if db.posts_partitioned:
+        print("#INFO: posts is already partitioned")
+        db.close()
+        return
+    start = time.time()
+    with db.connection() as conn:
+        conn.autocommit = False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL statement_timeout = 0")
+                cur.execute("SHOW server_version_num")
+                if int(cur.fetchone()[0]) < 150000:
+                    raise RuntimeError("PostgreSQL 15+ is needed for the NULLS NOT DISTINCT post key")
+                cur.execute("SELECT to_regclass(%s)", (OLD,))
+                if cur.fetchone()[0] is not None:
+                    raise RuntimeError(f"{OLD} still exists from an earlier run, drop it first")
+                cur.execute("""
+                    SELECT MIN(posted_at), COUNT(*) FILTER (WHERE posted_at IS NULL AND COALESCE(post_time, '') <> '')
+                    FROM posts
+                """)
+                earliest, undated = cur.fetchone()
+                if undated:
+                    print(f"#WARN: {undated} posts have a post_time but no posted_at, they will land in posts_undated. "
+                          f"Run backfill_posted_at.py first to avoid that")
+                columns = _columns(cur)
+                #INFO: Everything that happens from here on gets copied again under the lock
+                cur.execute("SELECT CURRENT_TIMESTAMP::timestamp - INTERVAL '10 minutes'")
+                mark = cur.fetchone()[0]
+
+                first = month_start(first_month or (earliest.date() if earliest else datetime.date.today()))
+                end = add_months(month_start(datetime.date.today()), months_ahead + 1)
+                cur.execute(f"DROP TABLE IF EXISTS {NEW} CASCADE")
+                cur.execute(f"CREATE TABLE {NEW} (LIKE posts INCLUDING DEFAULTS INCLUDING GENERATED) "
+                            f"PARTITION BY RANGE (posted_at)")
+                cur.execute(f"CREATE TABLE posts_undated PARTITION OF {NEW} DEFAULT")
+                created = create_month_partitions(cur, first, end, table=NEW)
+                print(f"#INFO: Created {created} monthly partitions from {first:%Y-%m} to {add_months(end, -1):%Y-%m}")
+            conn.commit()
+
+            month = first
+            copied = 0
+            while month < end:
+                nxt = add_months(month, 1)
+                with conn.cursor() as cur:
+                    cur.execute("SET LOCAL statement_timeout = 0")
+                    cur.execute(f"INSERT INTO {NEW} ({columns}) SELECT {columns} FROM posts "
+                                f"WHERE posted_at >= %s AND posted_at < %s", (month, nxt))
+                    copied += cur.rowcount
+                conn.commit()
+                if cur.rowcount:
+                    print(f"  #INFO: {month:%Y-%m}: {cur.rowcount} posts ({copied} total)")
+                month = nxt
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL statement_timeout = 0")
+                cur.execute(f"INSERT INTO {NEW} ({columns}) SELECT {columns} FROM posts "
+                            f"WHERE posted_at IS NULL OR posted_at < %s OR posted_at >= %s", (first, end))
+                print(f"  #INFO: {cur.rowcount} undated or out-of-range posts into posts_undated")
+                for name, definition in INDEXES.items():
+                    cur.execute(_index_sql(f"{name}_new", definition, NEW))
+            conn.commit()
+            print(f"#INFO: Copied and indexed in {time.time() - start:.0f}s, swapping tables...")
+
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL statement_timeout = 0")
+                cur.execute("LOCK TABLE posts IN ACCESS EXCLUSIVE MODE")
+                cur.execute(f"INSERT INTO {NEW} ({columns}) SELECT {columns} FROM posts WHERE scraped_at >= %s "
+                            f"ON CONFLICT (post_id, posted_at) DO NOTHING", (mark,))
+                print(f"  #INFO: Caught up {cur.rowcount} posts written during the copy")
+                cur.execute(f"ALTER TABLE posts RENAME TO {OLD}")
+                cur.execute(f"ALTER TABLE {OLD} RENAME CONSTRAINT posts_pkey TO {OLD}_pkey")
+                for name in INDEXES:
+                    cur.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_unpartitioned")
+                cur.execute(f"ALTER TABLE {NEW} RENAME TO posts")
+                for name in INDEXES:
+                    cur.execute(f"ALTER INDEX {name}_new RENAME TO {name}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    db.close()
+
+    db = DatabaseManager(config.DATABASE_URL)
+    today = month_start(datetime.date.today())
+    scanned = explain_window(db, today, add_months(today, 1))
+    print(f"#INFO: posts is now partitioned by month in {time.time() - start:.0f}s. "
+          f"A one-month window scans: {', '.join(scanned)}")
+    print(f"#NOTE: The old table is kept as {OLD}, drop it once satisfied. Running crawlers switch to the "
+          f"(post_id, posted_at) conflict target on their next failed flush")
+    db.close()
+
+
+if __name__ == "__main__":
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(current_dir)
+    ap = argparse.ArgumentParser(description="Convert posts into a table partitioned by month of posted_at")
+    ap.add_argument("--from-month", type=lambda v: datetime.date.fromisoformat(v + "-01"),
+                    help="YYYY-MM of the first monthly partition, defaults to the oldest posted_at")
+    ap.add_argument("--months-ahead", type=int, default=3, help="future months to create partitions for")
+    args = ap.parse_args()
+    run_partition(first_month=args.from_month, months_ahead=args.months_ahead)
@@ -0,0 +1,182 @@
+import random
+import threading
+import time
+from typing import Optional
+
+from metrics import REGISTRY, stage
+
+#INFO: Site-wide request pacing. One token bucket per site, shared by every replica through
+# a row in rate_limits: a fetch reserves its slot with a single UPDATE and sleeps until it
+# comes up, so N replicas together never exceed the bucket's rate. The rate itself is AIMD:
+# it grows by a fixed step while responses are fast and clean and is cut by a factor on
+# blocks, errors or slow pages. Without a database the same bucket runs in-process.
+
+RATE_GAUGE = REGISTRY.gauge("crawl_rate_limit", "Current request budget in requests per second")
+RATE_CHANGES = REGISTRY.counter("crawl_rate_changes_total", "AIMD rate adjustments by direction and cause")
+
+#INFO: The row is created on first use; later replicas keep whatever rate it has learned
+ENSURE_SQL = """
+    INSERT INTO rate_limits (key, rate, burst, tokens)
+    VALUES (%(key)s, %(rate)s, %(burst)s, 1)
+    ON CONFLICT (key) DO NOTHING
+"""
+
+#NOTE: tokens may go negative, that is the queue of slots already handed out. The wait
+# for this reservation is the debt in front of it divided by the rate
+RESERVE_SQL = """
+    UPDATE rate_limits SET
+        tokens = LEAST(burst, tokens + rate * EXTRACT(EPOCH FROM clock_timestamp() - updated_at)) - 1,
+        updated_at = clock_timestamp()
+    WHERE key = %(key)s
+    RETURNING GREATEST(0, -tokens) / rate, rate
+"""
+
+#INFO: One step per interval across the whole fleet, however many replicas report success.
+# Both adjustments always return one row, NULL when the gate held the rate where it was
+INCREASE_SQL = """
+    WITH changed AS (
+    UPDATE rate_limits SET rate = LEAST(%(max)s::float8, rate + %(step)s::float8), increased_at = clock_timestamp()
+    WHERE key = %(key)s AND rate < %(max)s::float8
+      AND increased_at < clock_timestamp() - make_interval(secs => %(interval)s::float8)
+      AND decreased_at < clock_timestamp() - make_interval(secs => %(interval)s::float8)
+    RETURNING rate
+    )
+    SELECT (SELECT rate FROM changed)
+"""
+
+#INFO: Replicas usually hit the same block together; the cooldown turns that into one cut.
+# Tokens are settled at the old rate first, then banked ones are dropped so no burst follows
+# a block. Queued debt is kept: slots already handed out are still coming up, new
+# reservations line up behind them at the new rate
+DECREASE_SQL = """
+    WITH changed AS (
+    UPDATE rate_limits SET rate = GREATEST(%(min)s::float8, rate * %(factor)s::float8),
+        tokens = LEAST(0, burst, tokens + rate * EXTRACT(EPOCH FROM clock_timestamp() - updated_at)),
+        updated_at = clock_timestamp(), decreased_at = clock_timestamp()
+    WHERE key = %(key)s
+      AND decreased_at < clock_timestamp() - make_interval(secs => %(cooldown)s::float8)
+    RETURNING rate
+    )
+    SELECT (SELECT rate FROM changed)
+"""
+
+
+class LocalBucket:
+    #INFO: In-process stand-in with the same reserve/increase/decrease semantics
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = 1.0
+        self.updated_at = time.monotonic()
+        self.increased_at = self.decreased_at = self.updated_at
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + self.rate * (now - self.updated_at)) - 1
+            self.updated_at = now
+            return max(0.0, -self.tokens) / self.rate, self.rate
+
+    def increase(self, step: float, max_rate: float, interval: float):
+        with self._lock:
+            now = time.monotonic()
+            if self.rate >= max_rate or now - self.increased_at < interval or now - self.decreased_at < interval:
+                return None
+            self.rate = min(max_rate, self.rate + step)
+            self.increased_at = now
+            return self.rate
+
+    def decrease(self, factor: float, min_rate: float, cooldown: float):
+        with self._lock:
+            now = time.monotonic()
+            if now - self.decreased_at < cooldown: return None
+            self.tokens = min(0, self.burst, self.tokens + self.rate * (now - self.updated_at))
+            self.rate = max(min_rate, self.rate * factor)
+            self.updated_at = self.decreased_at = now
+            return self.rate
+
+
+class RateController:
+    #INFO: backend is 'postgres' (shared, adaptive), 'local' (per process, adaptive),
+    # 'fixed' (per process, the old one request every CRAWL_DELAY seconds) or 'none'
+    # (never waits, for replaying a local snapshot at full speed)
+    def __init__(self, db=None, key: str = "nairaland", backend: str = "postgres",
+                 initial_rate: float = 0.25, min_rate: float = 0.02, max_rate: float = 2.0,
+                 burst: float = 2.0, step: float = 0.02, interval: float = 30.0,
+                 block_factor: float = 0.5, error_factor: float = 0.8, slow_factor: float = 0.9,
+                 target_latency: float = 8.0, jitter: float = 0.3):
+        self.db = db if backend == "postgres" else None
+        self.key = key
+        self.backend = backend
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.step = step
+        self.interval = interval
+        self.factors = {"blocked": block_factor, "error": error_factor, "slow": slow_factor}
+        self.target_latency = target_latency
+        self.jitter = jitter
+        self.adaptive = backend not in ("fixed", "none")
+        self.local = LocalBucket(initial_rate, burst)
+        self.rate = initial_rate
+        self._shared_down_until = 0.0
+        if self.db:
+            try:
+                self.db._execute_with_retry(ENSURE_SQL, {"key": key, "rate": initial_rate, "burst": burst})
+            except Exception as e:
+                print(f"    #WARN: Shared rate limit unavailable ({str(e)[:60]})")
+        RATE_GAUGE.set(self.rate, backend=self.backend)
+
+    def _shared(self, name, query, params):
+        #INFO: Any database failure drops to the local bucket for a minute, pacing must never
+        # block on an unreachable database. The local bucket cannot see the other replicas,
+        # so it runs at the floor rate rather than the fleet's
+        if not self.db or time.time() < self._shared_down_until:
+            return False, None
+        try:
+            row = self.db._execute_with_retry(query, params, is_select=True, name=name)
+        except Exception as e:
+            row = None
+            print(f"    #WARN: Shared rate limit unavailable ({str(e)[:60]})")
+        if row is None:
+            print(f"    #NOTE: Pacing locally at {self.min_rate:.3f} req/s for the next 60s")
+            self._shared_down_until = time.time() + 60
+            self.local.rate = self.min_rate
+            return False, None
+        return True, row
+
+    def acquire(self) -> float:
+        #INFO: Blocks until this process may send its next request; returns seconds waited
+        if self.backend == "none": return 0.0
+        ok, row = self._shared('rate_reserve', RESERVE_SQL, {"key": self.key})
+        wait, rate = row if ok else self.local.reserve()
+        self.rate = rate
+        RATE_GAUGE.set(rate, backend=self.backend)
+        wait += random.uniform(0, self.jitter / rate)
+        with stage('politeness_sleep'):
+            time.sleep(wait)
+        return wait
+
+    def report(self, outcome: str, latency: Optional[float] = None):
+        #INFO: Feed back the result of a fetch. outcome is 'ok', 'error' or 'blocked'; an ok
+        # page slower than the target latency counts as 'slow'
+        if not self.adaptive: return
+        if outcome == "ok" and latency is not None and latency > self.target_latency:
+            outcome = "slow"
+        if outcome == "ok":
+            params = {"key": self.key, "step": self.step, "max": self.max_rate, "interval": self.interval}
+            ok, row = self._shared('rate_increase', INCREASE_SQL, params)
+            new_rate = row[0] if ok else self.local.increase(self.step, self.max_rate, self.interval)
+            direction = "up"
+        else:
+            factor = self.factors.get(outcome, self.factors["error"])
+            params = {"key": self.key, "factor": factor, "min": self.min_rate, "cooldown": self.interval}
+            ok, row = self._shared('rate_decrease', DECREASE_SQL, params)
+            new_rate = row[0] if ok else self.local.decrease(factor, self.min_rate, self.interval)
+            direction = "down"
+        if new_rate is None: return
+        RATE_CHANGES.inc(direction=direction, cause=outcome)
+        if direction == "down":
+            print(f"    #NOTE: Request rate cut to {new_rate:.3f} req/s after a {outcome} response")
+        self.rate = new_rate
+        RATE_GAUGE.set(new_rate, backend=self.backend)
@@ -0,0 +1,29 @@
+from typing import Dict, List, Optional
+import config
+
+#INFO: Adaptive revisit policy for topics. Each revisit should find roughly
+# RECRAWL_TARGET_POSTS new replies: busy threads come back sooner, quiet ones back off.
+
+def post_number(post_id) -> int:
+    try:
+        return int(post_id)
+    except (TypeError, ValueError):
+        return 0
+
+
+def new_posts(posts: List[Dict], state: Optional[Dict]) -> List[Dict]:
+    #INFO: Nairaland post ids are monotonic, anything above the stored maximum is new
+    known_max = state["max_post_id"] if state else 0
+    return [p for p in posts if post_number(p["post_id"]) > known_max]
+
+
+def next_interval(state: Optional[Dict], fresh: int) -> int:
+    low, high = config.RECRAWL_MIN_SECONDS, config.RECRAWL_MAX_SECONDS
+    if not state or state.get("seconds_since_crawl") is None:
+        return low
+    current = state.get("recrawl_interval") or low
+    if fresh == 0:
+        return min(high, current * 2)
+    elapsed = max(float(state["seconds_since_crawl"]), 1.0)
+    rate = fresh / elapsed
+    return int(max(low, min(high, config.RECRAWL_TARGET_POSTS / rate)))
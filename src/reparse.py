@@ -0,0 +1,82 @@
+import argparse
+import datetime
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from archive import latest_fetches, iter_latest, read_entry
+from database import DatabaseManager
+from parser import parse_page, get_topic_id
+import config
+
+#INFO: Offline re-extraction. Streams the raw HTML archive through the current parser
+# in a process pool and upserts the results, no browser and no network involved
+
+def _reparse_entry(args):
+    root, entry = args
+    url = entry["url"]
+    try:
+        parsed = parse_page(read_entry(root, entry), url,
+                            fetched_at=datetime.datetime.fromisoformat(entry["fetched_at"]))
+    except Exception as e:
+        return url, None, str(e)
+    topic_id = get_topic_id(url)
+    for post in parsed["posts"]:
+        post["source_url"] = url
+        post["topic_id"] = topic_id
+    return url, parsed, None
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk: return
+        yield chunk
+
+
+def run_reparse(archive_dir, workers=4, since=None, limit=None, discover=False):
+    print(f"#INFO: Loading archive index from {archive_dir}...")
+    latest = latest_fetches(archive_dir, since=since)
+    total = min(len(latest), limit) if limit else len(latest)
+    entries = islice(iter_latest(archive_dir, latest), total)
+    print(f"#INFO: Re-parsing {total} pages with {workers} workers")
+
+    db = DatabaseManager(config.DATABASE_URL, flush_rows=config.DB_FLUSH_ROWS, upsert_posts=True)
+    start = time.time()
+    pages = posts = errors = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        #NOTE: Submit in chunks so a multi-million page archive never sits in the queue at once
+        for chunk in _chunks(entries, workers * 64):
+            jobs = [(archive_dir, entry) for entry in chunk]
+            for url, parsed, error in pool.map(_reparse_entry, jobs, chunksize=16):
+                pages += 1
+                if error:
+                    errors += 1
+                    print(f"  #NOTE: Could not re-parse {url}: {error[:80]}")
+                    continue
+                if parsed["posts"]:
+                    db.save_posts(parsed["posts"])
+                    posts += len(parsed["posts"])
+                if discover:
+                    db.add_urls(parsed["topic_links"], url_type='topic')
+                    db.add_urls(parsed["pagination_links"], url_type=parsed["page_type"])
+            elapsed = time.time() - start
+            print(f"  #INFO: {pages} pages, {posts} posts ({pages / elapsed:.0f} pages/s)")
+    db.close()
+    print(f"#INFO: Re-parse complete. {pages} pages, {posts} posts, {errors} errors in {time.time() - start:.0f}s")
+
+
+if __name__ == "__main__":
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(current_dir)
+    ap = argparse.ArgumentParser(description="Re-run the parser over the raw HTML archive")
+    ap.add_argument("--archive", default=str(config.ARCHIVE_DIR))
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    ap.add_argument("--since", help="only pages fetched at or after this ISO timestamp")
+    ap.add_argument("--limit", type=int)
+    ap.add_argument("--discover", action="store_true", help="also queue links found in archived pages")
+    args = ap.parse_args()
+    run_reparse(args.archive, workers=args.workers, since=args.since, limit=args.limit, discover=args.discover)
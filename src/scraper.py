@@ -1,83 +1,299 @@
 import time
+import datetime
 import random
 import os
-from collections import deque
+import socket
+import queue
+import heapq
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Dict
 
 from browser import BrowserManager, safe_goto
-from parser import extract_topic_links, extract_pagination_links, parse_topic_content, get_url_type, get_topic_id
+from parser import parse_page, get_url_type, get_topic_id, get_topic_page
 import config
 from database import DatabaseManager
+from url_cache import VisitedCache
+from archive import PageArchive
+from rate_limit import RateController
+from sharding import Membership, STEALS
+import recrawl
+from metrics import REGISTRY, stage, STAGE_SECONDS, PAGES, POSTS, CF_BLOCKS, QUEUE_DEPTH
+
+def timed_parse(content: str, url: str, url_type: str, fetched_at=None):
+    #INFO: Runs in the parse pool; the parent records the duration since child processes
+    # have their own metric registries
+    start = time.perf_counter()
+    parsed = parse_page(content, url, url_type=url_type, fetched_at=fetched_at)
+    return parsed, time.perf_counter() - start
 
 class NairalandCrawler:
     def __init__(self):
-        self.topic_queue = deque()
+        #INFO: Local frontier: a max-heap of leased (priority, url, url_type), seq breaks ties
+        self.topic_queue = []
+        self._seq = itertools.count()
         self.processed_count = 0
         self.cf_failures = 0
-        self.db = DatabaseManager(config.DATABASE_URL)
-        time.sleep(random.uniform(0, 5))
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.start_metrics()
+        self.db = DatabaseManager(
+            config.DATABASE_URL,
+            flush_rows=config.DB_FLUSH_ROWS,
+            flush_seconds=config.DB_FLUSH_SECONDS,
+            lease_seconds=config.LEASE_SECONDS,
+            cache=self._make_cache(),
+            pool_min=config.DB_POOL_MIN,
+            pool_max=config.DB_POOL_MAX,
+            prepare=config.DB_PREPARE,
+            retry_max_attempts=config.RETRY_MAX_ATTEMPTS,
+            retry_base_seconds=config.RETRY_BASE_SECONDS,
+            retry_max_seconds=config.RETRY_MAX_SECONDS,
+        )
+        self.db.warm_cache()
+        self.rate = RateController(
+            self.db,
+            backend=config.RATE_LIMIT,
+            initial_rate=1 / config.CRAWL_DELAY if config.RATE_LIMIT == 'fixed' else config.RATE_INITIAL,
+            min_rate=config.RATE_MIN,
+            max_rate=config.RATE_MAX,
+            burst=config.RATE_BURST,
+            step=config.RATE_STEP,
+            interval=config.RATE_INTERVAL,
+            target_latency=config.RATE_TARGET_LATENCY,
+        )
+        self.membership = None
+        if config.SHARDING:
+            self.membership = Membership(
+                self.db, self.worker_id,
+                heartbeat_seconds=config.WORKER_HEARTBEAT_SECONDS,
+                ttl_seconds=config.WORKER_TTL_SECONDS,
+                vnodes=config.SHARD_VNODES,
+            )
+            self.membership.start()
+        self.archive = None
+        if config.ARCHIVE_HTML:
+            self.archive = PageArchive(config.ARCHIVE_DIR, self.worker_id, level=config.ARCHIVE_LEVEL)
+
+        #INFO: Pipeline stages. The browser thread only fetches; parsing runs in a process pool
+        # and a writer thread persists results. The bounded queue is the backpressure point:
+        # when parsing or the DB fall behind, the fetcher blocks on put() instead of racing ahead
+        self.parse_pool = None
+        if config.PARSE_WORKERS > 0:
+            #NOTE: spawn, not fork, the parent runs Playwright's threads
+            self.parse_pool = ProcessPoolExecutor(
+                max_workers=config.PARSE_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        self.browser = BrowserManager(
+            headless=config.HEADLESS,
+            recycle_navigations=config.BROWSER_RECYCLE_NAVIGATIONS,
+            max_rss_mb=config.BROWSER_MAX_RSS_MB,
+            max_profile_mb=config.BROWSER_MAX_PROFILE_MB,
+            check_every=config.BROWSER_CHECK_EVERY,
+            profile_dir=config.BROWSER_PROFILE_DIR,
+            replay_url=config.REPLAY_URL,
+        )
+        self.results = queue.Queue(maxsize=config.PIPELINE_DEPTH)
+        self.writer = threading.Thread(target=self._writer_loop, name="db-writer", daemon=True)
+        self.writer.start()
+        #INFO: Replay runs stop once the frontier is drained instead of waiting for new work
+        self.stop_when_idle = False
+        self._leases_renewed = time.time()
+        time.sleep(random.uniform(0, config.STARTUP_JITTER_SECONDS))
+
+    def start_metrics(self):
+        REGISTRY.worker_id = self.worker_id
+        if config.METRICS_PORT:
+            try:
+                REGISTRY.serve(config.METRICS_PORT)
+                print(f"#INFO: Metrics on :{config.METRICS_PORT}/metrics")
+            except OSError as e:
+                print(f"#WARN: Metrics endpoint unavailable: {e}")
+        if config.METRICS_JSONL:
+            REGISTRY.open_sink(config.METRICS_JSONL)
+
+    def update_queue_gauges(self):
+        QUEUE_DEPTH.set(len(self.topic_queue), queue='frontier')
+        QUEUE_DEPTH.set(self.results.qsize(), queue='pipeline')
+        QUEUE_DEPTH.set(self.db.pending_rows(), queue='db_buffer')
+
+    def _make_cache(self):
+        if not config.URL_CACHE: return None
+        return VisitedCache(
+            capacity=config.URL_CACHE_CAPACITY,
+            error_rate=config.URL_CACHE_ERROR_RATE,
+            lru_size=config.URL_CACHE_LRU_SIZE,
+        )
+
+    def report_cache(self):
+        if not self.db.cache: return
+        st = self.db.cache.stats()
+        print(f"#INFO: URL cache hit {st['hit_rate']:.1%} | miss {st['miss_rate']:.1%} | "
+              f"false positives {st['false_positives']}/{st['bloom_positive_checked']} | "
+              f"{st['bloom_entries']} urls in {st['bloom_bytes'] // 1024}KB")
+
+    def report_db(self):
+        slowest = self.db.pool.latency_report()[:5]
+        if slowest:
+            print("#INFO: DB time by query: " + " | ".join(
+                f"{name} {calls}x {mean:.1f}ms (max {peak:.0f}ms)" for name, calls, mean, peak in slowest))
+
+    def report_resources(self):
+        if not self.browser.resource_filter: return
+        st = self.browser.resource_filter.take_page_stats()
+        if st["blocked"]:
+            by_type = ", ".join(f"{k}: {v}" for k, v in st["blocked_by_type"].most_common())
+            print(f"    #INFO: Blocked {st['blocked']}/{st['requests']} requests ({by_type}), "
+                  f"loaded {st['bytes_loaded'] // 1024}KB")
 
     def is_cloudflare_page(self, html_content: str) -> bool:
         cf_indicators = ["Just a moment...", "Checking your browser", "challenges.cloudflare.com"]
         return any(indicator in html_content for indicator in cf_indicators)
 
+    def report_retries(self):
+        st = self.db.retry_stats()
+        if st["retry"] or st["dead"]:
+            print(f"#INFO: Retries waiting {st['retry']} ({st['retry_due']} due) | dead letters {st['dead']}")
+
     def handle_cf_block(self, url: str):
+        #INFO: The blocked URL is already rescheduled, so this only spaces out the next
+        # fetch. The pause doubles per consecutive block but stays bounded
         self.cf_failures += 1
-        backoff = min(config.CF_BACKOFF_BASE * (2 ** (self.cf_failures - 1)), 600)
-        print(f"\n    #WARN: Cloudflare block detection. Backing off {int(backoff)}s...")
-        time.sleep(backoff)
-        if self.cf_failures >= 5:
-            print("#WARN: Critical block level. Cooling down 10 mins.")
-            time.sleep(600)
-            self.cf_failures = 0
+        backoff = min(config.CF_BACKOFF_BASE * (2 ** (self.cf_failures - 1)), config.CF_PAUSE_MAX)
+        print(f"\n    #WARN: Cloudflare block detection. Pausing {int(backoff)}s before the next URL...")
+        with stage('cf_backoff'):
+            time.sleep(backoff)
 
     def process_url(self, page, url: str, url_type: str):
-        if self.db.is_url_visited(url):
-            return True
-
-        self.db.mark_url_processing(url)
-        
+        #INFO: Fetch stage. Callers pass URLs leased via claim_batch, so the row is already ours
         try:
-            content = safe_goto(page, url)
+            start = time.perf_counter()
+            content = safe_goto(page, url, delay=False, url_type=url_type)
+            latency = time.perf_counter() - start
+            #NOTE: Post times without a year or date are relative to this moment
+            fetched_at = datetime.datetime.utcnow()
+            self.report_resources()
             
             if self.is_cloudflare_page(content):
+                self.rate.report('blocked')
                 print(f"    #WARN: Blocked on {url}")
-                self.db.mark_url_failed(url)
-                return False
+                CF_BLOCKS.inc(source='page')
+                PAGES.inc(type=url_type, outcome='blocked')
+                #NOTE: A block says nothing about the URL, it does not spend one of its attempts
+                delay = config.CF_BACKOFF_BASE * (2 ** min(self.cf_failures, 6))
+                self.db.mark_url_failed(url, self.worker_id, error='cloudflare block', count_attempt=False, delay=delay)
+                return 'blocked'
+
+            parsed = None
+            if self.parse_pool:
+                parsed = self.parse_pool.submit(timed_parse, content, url, url_type, fetched_at)
+            with stage('pipeline_put'):
+                self.results.put((url, url_type, content, parsed, fetched_at))
+            self.rate.report('ok', latency)
+            self.update_queue_gauges()
+            return 'ok'
+                    
+        except Exception as e:
+            self.rate.report('error')
+            PAGES.inc(type=url_type, outcome='error')
+            status, attempts = self.db.mark_url_failed(url, self.worker_id, error=f"fetch: {e}")
+            print(f"    #WARN: Error processing {url}: {e} (attempt {attempts}, now {status or 'leased elsewhere'})")
+            return 'error'
+
+    def _writer_loop(self):
+        while True:
+            item = self.results.get()
+            if item is None: break
+            url, url_type, content, parsed, fetched_at = item
+            try:
+                if self.archive:
+                    with stage('archive'):
+                        self.archive.put(url, content, fetched_at=fetched_at)
+                if parsed is None:
+                    parsed, parse_seconds = timed_parse(content, url, url_type, fetched_at)
+                else:
+                    parsed, parse_seconds = parsed.result()
+                STAGE_SECONDS.observe(parse_seconds, stage='parse')
+                with stage('store'):
+                    self.store_page(url, url_type, parsed)
+                PAGES.inc(type=url_type, outcome='completed')
+            except Exception as e:
+                PAGES.inc(type=url_type, outcome='error')
+                status, attempts = self.db.mark_url_failed(url, self.worker_id, error=f"store: {e}")
+                print(f"    #WARN: Error storing {url}: {e} (attempt {attempts}, now {status or 'leased elsewhere'})")
+            self.results.task_done()
+            self.update_queue_gauges()
+
+    def store_page(self, url: str, url_type: str, parsed: Dict):
+        posts = parsed['posts'] if url_type == 'topic' else []
+        topic_id = get_topic_id(url) if url_type == 'topic' else ""
+        page_no = get_topic_page(url)
+        state = self.db.get_topic_state(topic_id) if topic_id else None
+        fresh = recrawl.new_posts(posts, state)
+        #INFO: A revisit of the last known page that turns up nothing new ends the recrawl,
+        # earlier pages are first-time fetches and always keep discovering
+        is_recrawl = state is not None and page_no >= state["last_page"]
+        if is_recrawl:
+            posts = fresh
 
+        if is_recrawl and not fresh:
+            print(f"    #INFO: No new posts in topic {topic_id}, recrawl stops at page {page_no}")
+        else:
             # Discovery
-            discovered_topics = extract_topic_links(content)
+            discovered_topics = parsed['topic_links']
             if discovered_topics:
-                self.db.add_urls(discovered_topics, url_type='topic')
+                self.db.add_urls(discovered_topics, url_type='topic', source_type=url_type)
 
-            discovered_pgn = extract_pagination_links(content)
+            discovered_pgn = parsed['pagination_links']
             if discovered_pgn:
-                self.db.add_urls(discovered_pgn, url_type=url_type)
+                self.db.add_urls(discovered_pgn, url_type=url_type, source_type=url_type)
 
-            # Post Extraction
-            if url_type == 'topic':
-                posts = parse_topic_content(content)
-                topic_id = get_topic_id(url)
+        # Post Extraction
+        if url_type == 'topic':
+            if posts:
+                for post in posts: 
+                    post['source_url'] = url
+                    post['topic_id'] = topic_id
                 
-                if posts:
-                    for post in posts: 
-                        post['source_url'] = url
-                        post['topic_id'] = topic_id
-                    
-                    self.db.save_posts(posts)
-                    print(f"    #INFO: Saved {len(posts)} posts from topic {topic_id}")
-                else:
-                    print(f"    #NOTE: No posts or broken parsing on: {url}")
-            else:
-                print(f"    #INFO: Processed listing page: {url}")
+                self.db.save_posts(posts)
+                POSTS.inc(len(posts))
+                print(f"    #INFO: Saved {len(posts)} posts from topic {topic_id}")
+            elif not is_recrawl:
+                print(f"    #NOTE: No posts or broken parsing on: {url}")
+            if topic_id and parsed['posts']:
+                max_post_id = max(recrawl.post_number(p['post_id']) for p in parsed['posts'])
+                self.db.update_topic_state(topic_id, page_no, url, max_post_id, len(fresh),
+                                           recrawl.next_interval(state, len(fresh)))
+        else:
+            print(f"    #INFO: Processed listing page: {url}")
 
-            self.db.mark_url_completed(url)
-            return True
-                    
-        except Exception as e:
-            print(f"    #WARN: Error processing {url}: {e}")
-            self.db.mark_url_failed(url)
-            return False
+        if not self.db.mark_url_completed(url, self.worker_id):
+            print(f"    #NOTE: Lease on {url} was lost before it completed, left to its new owner")
+
+    def drain(self) -> bool:
+        #INFO: Wait for every fetched page to be stored and flush the write buffer. True when
+        # that may have put new URLs into the frontier
+        pending = self.results.unfinished_tasks > 0 or self.db.pending_rows() > 0
+        self.results.join()
+        return self.db.flush() > 0 or pending
+
+    def stop_pipeline(self):
+        #INFO: Drain everything already fetched before the caller releases leases
+        self.results.put(None)
+        self.writer.join()
+        if self.parse_pool:
+            self.parse_pool.shutdown(wait=True)
+        if self.archive:
+            self.archive.close()
+
+    def shutdown(self):
+        self.stop_pipeline()
+        self.db.flush()
+        self.db.release_leases(self.worker_id)
+        if self.membership: self.membership.stop()
+        self.db.close()
 
     def start(self):
         print("="*60)
@@ -85,38 +301,72 @@ class NairalandCrawler:
         print(f"#INFO: Goal: {config.MAX_TOPICS} | Remote DB: {config.DATABASE_URL[:25]}...")
         print("="*60)
 
-        with BrowserManager(headless=config.HEADLESS) as page:
+        with self.browser as page:
             while self.processed_count < config.MAX_TOPICS:
                 if not self.topic_queue:
-                    pending_listings = self.db.get_pending_urls(url_type='listing', limit=20)
-                    pending_topics = self.db.get_pending_urls(url_type='topic', limit=50)
+                    self.report_cache()
+                    self.report_db()
+                    with stage('claim'):
+                        self.db.reap_expired_leases()
+                        self.db.ensure_post_partitions()
+                        self.db.schedule_retries(config.RETRY_BATCH)
+                        self.db.schedule_recrawls(config.RECRAWL_BATCH)
+                        shards = self.membership.owned() if self.membership else None
+                        claimed_listings = self.db.claim_batch(self.worker_id, 20, url_type='listing', shards=shards)
+                        claimed_topics = self.db.claim_batch(self.worker_id, 50, url_type='topic', shards=shards)
+                        if shards is not None and not claimed_listings and not claimed_topics:
+                            #INFO: Own shards are dry, help with the rest rather than sit idle. Typed
+                            # claims, like the ones above, so the per-type frontier index is used
+                            claimed_listings = self.db.claim_batch(self.worker_id, 5, url_type='listing')
+                            claimed_topics = self.db.claim_batch(self.worker_id, 20, url_type='topic')
+                            stolen = len(claimed_listings) + len(claimed_topics)
+                            if stolen:
+                                STEALS.inc(stolen)
+                                print(f"#INFO: Own shards empty, took {stolen} URLs from other shards")
                     
-                    batch = pending_listings + pending_topics
+                    self.report_retries()
+                    batch = claimed_listings + claimed_topics
                     if not batch:
-                        print("#INFO: DB empty. Bootstrapping...")
+                        #NOTE: Links from pages still in the pipeline or the write buffer are not
+                        # claimable yet, the frontier only counts as empty once those are in
+                        if self.drain(): continue
+                        print("#INFO: Frontier empty. Bootstrapping...")
                         self.db.add_urls([config.BASE_URL], url_type='listing')
-                        batch = self.db.get_pending_urls(limit=10)
+                        self.db.flush()
+                        batch = self.db.claim_batch(self.worker_id, 10, url_type='listing')
                     
-                    random.shuffle(batch)
-                    self.topic_queue.extend(batch)
+                    for url, url_type, priority in batch:
+                        heapq.heappush(self.topic_queue, (-priority, next(self._seq), url, url_type))
 
                 if not self.topic_queue:
-                    time.sleep(30)
+                    if self.stop_when_idle: break
+                    time.sleep(config.IDLE_SLEEP_SECONDS)
                     continue
 
-                url, url_type = self.topic_queue.popleft()
-                if self.db.is_url_visited(url): continue
+                #INFO: A claimed batch can outlast LEASE_SECONDS at a low crawl rate or through
+                # Cloudflare pauses, keep the queued URLs ours until they are fetched
+                if time.time() - self._leases_renewed > config.LEASE_SECONDS / 3:
+                    self.db.renew_leases(self.worker_id)
+                    self._leases_renewed = time.time()
+
+                _, _, url, url_type = heapq.heappop(self.topic_queue)
                 
                 print(f"\n#INFO: [{self.processed_count}/{config.MAX_TOPICS}] [{url_type.upper()}] {url}")
-                success = self.process_url(page, url, url_type)
+                #INFO: Every replica draws its next request slot from the shared budget
+                self.rate.acquire()
+                outcome = self.process_url(page, url, url_type)
+                page = self.browser.after_navigation()
                 
-                if success:
+                if outcome == 'blocked':
+                    self.handle_cf_block(url)
+                    continue
+                if outcome == 'ok':
                     if url_type == 'topic': self.processed_count += 1
                     self.cf_failures = 0
-                    time.sleep(config.CRAWL_DELAY + random.uniform(-1, 2))
-                else:
-                    self.handle_cf_block(url)
 
 if __name__ == "__main__":
     crawler = NairalandCrawler()
-    crawler.start()
+    try:
+        crawler.start()
+    finally:
+        crawler.shutdown()
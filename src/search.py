@@ -0,0 +1,127 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+from database import DatabaseManager
+from parser import SITE_TZ
+import config
+
+#INFO: Ranked keyword search over posts through the GIN index on posts.search_vector
+# (migration 15). Queries take web-search syntax: words, "quoted phrases", OR and -excluded.
+# Only the rows of the requested page are turned into highlighted snippets.
+#NOTE: The text search config has to match the one search_vector is generated with
+
+SEARCH_CONFIG = "english"
+
+ORDERS = {
+    "rank": "rank DESC, post_id",
+    "recent": "posted_at DESC NULLS LAST, post_id DESC",
+}
+
+SEARCH_SQL = """
+    SELECT post_id, topic_id, author, post_time, posted_at, source_url, rank,
+           ts_headline(%(config)s::regconfig, content, query, %(headline)s) AS snippet
+    FROM (
+        SELECT p.post_id, p.topic_id, p.author, p.post_time, p.posted_at, p.source_url, p.content, q.query,
+               ts_rank_cd(p.search_vector, q.query, 1) AS rank
+        FROM posts p, websearch_to_tsquery(%(config)s::regconfig, %(q)s) AS q (query)
+        WHERE p.search_vector @@ q.query {filters}
+        ORDER BY {order}
+        LIMIT %(limit)s OFFSET %(offset)s
+    ) hits
+    ORDER BY {order}
+"""
+
+HEADLINE_OPTIONS = "StartSel=**, StopSel=**, MaxWords=30, MinWords=10, MaxFragments=2"
+
+COLUMNS = ("post_id", "topic_id", "author", "post_time", "posted_at", "source_url", "rank", "snippet")
+
+
+def _build(query, topic=None, author=None, posted_from=None, posted_to=None, order="rank", page=1, per_page=20):
+    filters = []
+    params = {"config": SEARCH_CONFIG, "q": query, "headline": HEADLINE_OPTIONS,
+              "limit": per_page + 1, "offset": (max(page, 1) - 1) * per_page}
+    if topic is not None:
+        filters.append("AND p.topic_num = %(topic)s")
+        params["topic"] = int(topic)
+    if author:
+        #NOTE: Usernames are case-insensitive on the site
+        filters.append("AND lower(p.author) = lower(%(author)s)")
+        params["author"] = author
+    if posted_from:
+        filters.append("AND p.posted_at >= %(posted_from)s")
+        params["posted_from"] = posted_from
+    if posted_to:
+        filters.append("AND p.posted_at < %(posted_to)s")
+        params["posted_to"] = posted_to
+    sql = SEARCH_SQL.format(filters=" ".join(filters), order=ORDERS[order])
+    return sql, params
+
+
+def search_posts(db, query, topic=None, author=None, posted_from=None, posted_to=None, order="rank",
+                 page=1, per_page=20):
+    #INFO: Returns (hits, has_more). One extra row is fetched to tell whether another page exists
+    sql, params = _build(query, topic, author, posted_from, posted_to, order, page, per_page)
+    rows = db._execute_with_retry(sql, params, is_select=True, fetch_all=True) or []
+    hits = [dict(zip(COLUMNS, row)) for row in rows[:per_page]]
+    return hits, len(rows) > per_page
+
+
+def explain_search(db, query, **filters):
+    #INFO: Whether the match is served by the GIN index (or, once posts is partitioned, by
+    # each partition's copy of it), plus the plan lines
+    sql, params = _build(query, **filters)
+    rows = db._execute_with_retry("EXPLAIN " + sql, params, is_select=True, fetch_all=True) or []
+    plan = [row[0].strip() for row in rows]
+    return any(line.startswith("Index Cond: (search_vector @@") for line in plan), plan
+
+
+def _print_hit(hit):
+    posted = f"{hit['posted_at'].astimezone(SITE_TZ):%Y-%m-%d %H:%M}" if hit['posted_at'] else hit['post_time']
+    print(f"  {hit['rank']:.3f}  {posted}  {hit['author']}  topic {hit['topic_id']}  post {hit['post_id']}")
+    print(f"      {hit['source_url']}")
+    print(f"      {' '.join(hit['snippet'].split())}")
+
+
+if __name__ == "__main__":
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(current_dir)
+    ap = argparse.ArgumentParser(description="Ranked full-text search over scraped posts")
+    ap.add_argument("query", help='web-search syntax: words, "a phrase", OR, -excluded')
+    ap.add_argument("--topic", type=int, help="only this topic id")
+    ap.add_argument("--author", help="only posts by this username")
+    ap.add_argument("--posted-from", help="only posts made at or after this ISO date/time (site time if no offset)")
+    ap.add_argument("--posted-to", help="only posts made before this ISO date/time")
+    ap.add_argument("--order", choices=tuple(ORDERS), default="rank")
+    ap.add_argument("--page", type=int, default=1)
+    ap.add_argument("--per-page", type=int, default=20)
+    ap.add_argument("--json", action="store_true", help="one JSON object per hit on stdout")
+    ap.add_argument("--explain", action="store_true", help="show the query plan instead of results")
+    args = ap.parse_args()
+    window = [datetime.datetime.fromisoformat(v) if v else None for v in (args.posted_from, args.posted_to)]
+    window = [v.replace(tzinfo=SITE_TZ) if v and v.tzinfo is None else v for v in window]
+    filters = dict(topic=args.topic, author=args.author, posted_from=window[0], posted_to=window[1],
+                   order=args.order, page=args.page, per_page=args.per_page)
+
+    db = DatabaseManager(config.DATABASE_URL)
+    try:
+        if args.explain:
+            uses_index, plan = explain_search(db, args.query, **filters)
+            print(f"#INFO: Search {'uses' if uses_index else 'does NOT use'} the search_vector index")
+            for line in plan: print(f"    {line}")
+            sys.exit(0)
+        start = time.time()
+        hits, has_more = search_posts(db, args.query, **filters)
+        elapsed_ms = (time.time() - start) * 1000
+        if args.json:
+            for hit in hits:
+                print(json.dumps(hit, default=lambda v: v.isoformat() if hasattr(v, "isoformat") else str(v)))
+        else:
+            for hit in hits: _print_hit(hit)
+        more = f", more on page {args.page + 1}" if has_more else ""
+        print(f"#INFO: Page {args.page}: {len(hits)} posts in {elapsed_ms:.0f}ms{more}", file=sys.stderr)
+    finally:
+        db.close()
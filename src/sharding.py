@@ -0,0 +1,97 @@
+import bisect
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+from metrics import REGISTRY
+
+#INFO: Frontier sharding over live replicas. visited_urls.shard is a fixed hash of a URL's
+# topic/board key into SHARDS buckets; the buckets are spread over the workers that have
+# heartbeated recently with a consistent-hash ring, so a replica joining or dying only
+# moves the shards next to it on the ring. Every replica derives the same ring from the
+# workers table, claims only its own shards and steals from the rest when those run dry.
+
+SHARDS = 256
+
+LIVE_WORKERS = REGISTRY.gauge("crawl_live_workers", "Replicas with a recent heartbeat")
+OWNED_SHARDS = REGISTRY.gauge("crawl_owned_shards", "Frontier shards owned by this replica")
+STEALS = REGISTRY.counter("crawl_shard_steals_total", "Claims taken from other replicas' shards when idle")
+
+
+def _point(label: str) -> int:
+    return int.from_bytes(hashlib.md5(label.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, members: List[str], vnodes: int = 128):
+        self.members = sorted(members)
+        points = sorted((_point(f"{member}#{i}"), member) for member in self.members for i in range(vnodes))
+        self._keys = [p for p, _ in points]
+        self._owners = [m for _, m in points]
+
+    def owner(self, shard: int) -> Optional[str]:
+        if not self._keys: return None
+        i = bisect.bisect(self._keys, _point(f"shard:{shard}")) % len(self._keys)
+        return self._owners[i]
+
+    def assignment(self) -> Dict[str, List[int]]:
+        owned = {member: [] for member in self.members}
+        for shard in range(SHARDS):
+            owner = self.owner(shard)
+            if owner is not None: owned[owner].append(shard)
+        return owned
+
+
+class Membership:
+    #INFO: Heartbeats from a daemon thread, the crawl loop can sit in a Cloudflare wait or a
+    # rate-limit sleep far longer than one interval
+    def __init__(self, db, worker_id: str, heartbeat_seconds: float = 30, ttl_seconds: float = 180,
+                 vnodes: int = 128):
+        self.db = db
+        self.worker_id = worker_id
+        self.heartbeat_seconds = heartbeat_seconds
+        self.ttl_seconds = ttl_seconds
+        self.vnodes = vnodes
+        self.members: List[str] = []
+        self.shards: Optional[List[int]] = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        self.db.heartbeat(self.worker_id, len(self.shards or ()))
+        reaped = self.db.reap_dead_workers(self.ttl_seconds)
+        if reaped:
+            print(f"    #INFO: Released {reaped} URLs leased by replicas that stopped heartbeating")
+        members = self.db.live_workers(self.ttl_seconds)
+        if not members:
+            return self.shards
+        if self.worker_id not in members: members.append(self.worker_id)
+        if sorted(members) != self.members:
+            shards = HashRing(members, self.vnodes).assignment()[self.worker_id]
+            print(f"#INFO: {len(members)} live replicas, this one owns {len(shards)}/{SHARDS} frontier shards")
+            self.members = sorted(members)
+            self.shards = shards
+            LIVE_WORKERS.set(len(members))
+            OWNED_SHARDS.set(len(shards))
+        return self.shards
+
+    def _loop(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"    #WARN: Heartbeat failed: {str(e)[:80]}")
+
+    def start(self):
+        self.refresh()
+        self._thread = threading.Thread(target=self._loop, name="heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread: self._thread.join(timeout=5)
+        self.db.deregister_worker(self.worker_id)
+
+    def owned(self) -> Optional[List[int]]:
+        #INFO: None until the first successful refresh, i.e. claim from every shard
+        return self.shards
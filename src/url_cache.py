@@ -0,0 +1,134 @@
+import hashlib
+import math
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+#INFO: Process-local membership layer in front of visited_urls.
+# The Bloom filter answers "definitely never seen", the LRU remembers recent statuses.
+# Both only reflect what this process has loaded or touched, other replicas' writes
+# show up through the database fallbacks, never through the cache.
+
+def _hash_pair(key: str) -> Tuple[int, int]:
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, hashes: Tuple[int, int]):
+        h1, h2 = hashes
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def contains(self, hashes: Tuple[int, int]) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(hashes))
+
+    def add(self, hashes: Tuple[int, int]):
+        for pos in self._positions(hashes):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+
+class ScalableBloomFilter:
+    #INFO: Chain of filters, each larger and stricter than the last, so the compound
+    # false-positive rate stays bounded however many URLs the frontier grows to
+    def __init__(self, initial_capacity: int = 100000, error_rate: float = 0.001,
+                 growth: int = 2, tightening: float = 0.85):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.filters: List[BloomFilter] = []
+
+    def __contains__(self, key: str) -> bool:
+        hashes = _hash_pair(key)
+        return any(f.contains(hashes) for f in self.filters)
+
+    def add(self, key: str) -> bool:
+        hashes = _hash_pair(key)
+        if any(f.contains(hashes) for f in self.filters):
+            return False
+        if not self.filters or self.filters[-1].count >= self.filters[-1].capacity:
+            n = len(self.filters)
+            self.filters.append(BloomFilter(
+                self.initial_capacity * (self.growth ** n),
+                self.error_rate * (1 - self.tightening) * (self.tightening ** n),
+            ))
+        self.filters[-1].add(hashes)
+        return True
+
+    def __len__(self):
+        return sum(f.count for f in self.filters)
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(len(f.bits) for f in self.filters)
+
+
+class VisitedCache:
+    def __init__(self, capacity: int = 1000000, error_rate: float = 0.001, lru_size: int = 100000):
+        self.bloom = ScalableBloomFilter(initial_capacity=capacity, error_rate=error_rate)
+        self.lru_size = lru_size
+        self.recent: OrderedDict = OrderedDict()
+        self.counters = {"lookups": 0, "bloom_negative": 0, "lru_hits": 0, "misses": 0,
+                         "bloom_positive_checked": 0, "false_positives": 0}
+
+    def remember(self, url: str, status: str):
+        self.bloom.add(url)
+        self.recent[url] = status
+        self.recent.move_to_end(url)
+        if len(self.recent) > self.lru_size:
+            self.recent.popitem(last=False)
+
+    def remember_many(self, urls: Iterable[str], status: str):
+        for url in urls:
+            self.remember(url, status)
+
+    def lookup(self, url: str) -> Tuple[bool, Optional[str]]:
+        #INFO: Returns (maybe_seen, status). (False, None) is authoritative, (True, None)
+        # means the caller has to ask the database
+        self.counters["lookups"] += 1
+        status = self.recent.get(url)
+        if status is not None:
+            self.recent.move_to_end(url)
+            self.counters["lru_hits"] += 1
+            return True, status
+        if url not in self.bloom:
+            self.counters["bloom_negative"] += 1
+            return False, None
+        self.counters["misses"] += 1
+        return True, None
+
+    def partition(self, urls: Iterable[str]) -> Tuple[List[str], List[str], List[str]]:
+        #INFO: Split discovered links into (known, new, unverified) without touching the DB
+        known, new, unverified = [], [], []
+        for url in urls:
+            maybe_seen, status = self.lookup(url)
+            if status is not None: known.append(url)
+            elif not maybe_seen: new.append(url)
+            else: unverified.append(url)
+        return known, new, unverified
+
+    def record_checked(self, checked: int, false_positives: int):
+        self.counters["bloom_positive_checked"] += checked
+        self.counters["false_positives"] += false_positives
+
+    def stats(self) -> Dict:
+        c = self.counters
+        lookups = c["lookups"] or 1
+        checked = c["bloom_positive_checked"] or 1
+        return {
+            **c,
+            "hit_rate": (c["lru_hits"] + c["bloom_negative"]) / lookups,
+            "miss_rate": c["misses"] / lookups,
+            "false_positive_rate": c["false_positives"] / checked,
+            "bloom_entries": len(self.bloom),
+            "bloom_bytes": self.bloom.size_bytes,
+            "lru_entries": len(self.recent),
+        }
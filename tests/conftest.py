@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+#INFO: src/ modules import each other flat, the same way the scripts run them
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+
+@pytest.fixture
+def database_url():
+    #INFO: Same server setting as the storage benchmarks; each test gets a throwaway database
+    server = os.getenv("BENCH_DATABASE_URL", "")
+    if not server:
+        pytest.skip("needs a Postgres server, set BENCH_DATABASE_URL")
+    from run_bench import throwaway_database
+    with throwaway_database(server, prefix="nl_test") as dsn:
+        yield dsn
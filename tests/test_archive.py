@@ -0,0 +1,78 @@
+import datetime
+
+from archive import PageArchive, iter_index, latest_entries, read_entry
+
+FETCHED = datetime.datetime(2024, 3, 10, 12, 0)
+PAGE = "<html><body>" + "post body " * 200 + "</body></html>"
+OTHER = "<html><body>another page</body></html>"
+
+
+def test_round_trip_and_dedupe(tmp_path):
+    archive = PageArchive(tmp_path, "w1")
+    first = archive.put("https://www.nairaland.com/1/a", PAGE, fetched_at=FETCHED)
+    again = archive.put("https://www.nairaland.com/1/a", PAGE, fetched_at=FETCHED + datetime.timedelta(hours=1))
+    other = archive.put("https://www.nairaland.com/2/b", OTHER, fetched_at=FETCHED)
+    archive.close()
+
+    assert first == again != other
+    #INFO: Three index entries, two blobs
+    assert archive.stats["pages"] == 3
+    assert archive.stats["stored"] == 2
+    entries = list(iter_index(tmp_path))
+    assert len(entries) == 3
+    assert (entries[0]["segment"], entries[0]["offset"]) == (entries[1]["segment"], entries[1]["offset"])
+    assert [read_entry(tmp_path, e) for e in entries] == [PAGE, PAGE, OTHER]
+
+    latest = latest_entries(tmp_path)
+    assert latest["https://www.nairaland.com/1/a"]["fetched_at"] == "2024-03-10T13:00:00"
+
+
+def test_digests_survive_a_restart(tmp_path):
+    archive = PageArchive(tmp_path, "w1")
+    archive.put("https://www.nairaland.com/1/a", PAGE, fetched_at=FETCHED)
+    archive.close()
+    archive = PageArchive(tmp_path, "w1")
+    archive.put("https://www.nairaland.com/1/a", PAGE, fetched_at=FETCHED)
+    archive.close()
+    assert archive.stats["stored"] == 0
+    assert len(list(tmp_path.glob("seg-*"))) == 1
+
+
+def test_peer_blob_is_not_stored_again(tmp_path):
+    peer = PageArchive(tmp_path, "w1")
+    peer.put("https://www.nairaland.com/1/a", PAGE, fetched_at=FETCHED)
+    archive = PageArchive(tmp_path, "w2")
+    archive.put("https://www.nairaland.com/1/b", PAGE, fetched_at=FETCHED)
+    peer.close()
+    archive.close()
+    assert archive.stats["stored"] == 0
+    entry = [e for e in iter_index(tmp_path) if e["url"].endswith("/b")][0]
+    assert entry["segment"].startswith("seg-w1-")
+    assert read_entry(tmp_path, entry) == PAGE
+
+
+def test_peer_started_later_is_picked_up_on_rotation(tmp_path):
+    archive = PageArchive(tmp_path, "w2", segment_bytes=1)
+    archive.put("https://www.nairaland.com/2/b", OTHER, fetched_at=FETCHED)
+    peer = PageArchive(tmp_path, "w1")
+    peer.put("https://www.nairaland.com/1/a", PAGE, fetched_at=FETCHED)
+    #INFO: The first segment is already full, this put rotates and rescans before looking up
+    archive.put("https://www.nairaland.com/3/c", "<html>third</html>", fetched_at=FETCHED)
+    archive.put("https://www.nairaland.com/1/b", PAGE, fetched_at=FETCHED)
+    peer.close()
+    archive.close()
+    assert archive.stats["stored"] == 2
+
+
+def test_broken_peer_is_dropped_alone(tmp_path):
+    peer = PageArchive(tmp_path, "w1")
+    peer.put("https://www.nairaland.com/1/a", PAGE, fetched_at=FETCHED)
+    (tmp_path / "digests-w0.sqlite").write_bytes(b"not a sqlite file" * 100)
+    archive = PageArchive(tmp_path, "w2")
+    archive.put("https://www.nairaland.com/2/b", OTHER, fetched_at=FETCHED)
+    assert sorted(archive._peer_digests) == ["digests-w1.sqlite"]
+    #INFO: The good peer still dedupes
+    archive.put("https://www.nairaland.com/1/b", PAGE, fetched_at=FETCHED)
+    peer.close()
+    archive.close()
+    assert archive.stats["stored"] == 1
@@ -0,0 +1,25 @@
+import pytest
+
+from db_pool import to_prepared
+
+
+@pytest.mark.parametrize("query, body, order", [
+    ("SELECT 1", "SELECT 1", []),
+    ("SELECT * FROM t WHERE a = %s AND b = %s", "SELECT * FROM t WHERE a = $1 AND b = $2", [0, 1]),
+    # A repeated name binds one parameter
+    ("UPDATE t SET n = n + %(inc)s WHERE n + %(inc)s < %(max)s AND id = %(id)s",
+     "UPDATE t SET n = n + $1 WHERE n + $1 < $2 AND id = $3", ["inc", "max", "id"]),
+    ("SELECT * FROM unnest(%s::text[], %s::int4[])", "SELECT * FROM unnest($1::text[], $2::int4[])", [0, 1]),
+    # %% is psycopg2's escape for a literal %
+    ("SELECT url FROM t WHERE url LIKE 'x%%' AND id = %s", "SELECT url FROM t WHERE url LIKE 'x%' AND id = $1", [0]),
+    ("SELECT n %% %(m)s", "SELECT n % $1", ["m"]),
+    ("SELECT '%%s'", "SELECT '%s'", []),
+])
+def test_to_prepared(query, body, order):
+    assert to_prepared(query) == (body, order)
+
+
+def test_params_are_pulled_in_placeholder_order():
+    _, order = to_prepared("SELECT %(b)s, %(a)s, %(b)s")
+    params = {"a": 1, "b": 2}
+    assert [params[key] for key in order] == [2, 1]
@@ -0,0 +1,81 @@
+import psycopg2
+import pytest
+
+from database import DatabaseManager
+
+TOPICS = [f"https://www.nairaland.com/{7012340 + i}/topic" for i in range(3)]
+
+
+def _post(post_id, content):
+    return {"post_id": post_id, "topic_id": "7012345", "author": "tester", "time": "3:15pm",
+            "content": content, "source_url": TOPICS[0], "posted_at": None}
+
+
+def _fail_on(db, monkeypatch, statement):
+    #INFO: The connection drops for one kind of statement, the way it would after every retry
+    execute = db._execute_with_retry
+
+    def flaky(query, *args, **kwargs):
+        if statement in query:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        return execute(query, *args, **kwargs)
+    monkeypatch.setattr(db, "_execute_with_retry", flaky)
+
+
+def _count(db, table):
+    return db._execute_with_retry(f"SELECT count(*) FROM {table}", is_select=True)[0]
+
+
+@pytest.fixture
+def db(database_url):
+    #INFO: Never flushes by itself, the test decides when
+    db = DatabaseManager(database_url, flush_rows=10 ** 6, flush_seconds=10 ** 6)
+    yield db
+    db.close()
+
+
+def test_failed_url_insert_keeps_every_row(db, monkeypatch):
+    db.add_urls(TOPICS)
+    db.save_posts([_post("1", "first")])
+    _fail_on(db, monkeypatch, "INSERT INTO visited_urls")
+    with pytest.raises(psycopg2.OperationalError):
+        db.flush()
+    assert db.pending_rows() == 4
+    assert db.write_stats["rows_written"] == 0
+    monkeypatch.undo()
+    assert db.flush() == 4
+    assert _count(db, "visited_urls") == 3
+    assert _count(db, "posts") == 1
+
+
+def test_failed_post_write_keeps_only_the_posts(db, monkeypatch):
+    db.add_urls(TOPICS)
+    db.save_posts([_post("1", "first"), _post("2", "second")])
+    _fail_on(db, monkeypatch, "INSERT INTO posts")
+    with pytest.raises(psycopg2.OperationalError):
+        db.flush()
+    #INFO: The URLs went in and are counted, the posts wait for the next flush
+    assert db.write_stats["rows_written"] == 3
+    assert db.pending_rows() == 2
+    monkeypatch.undo()
+    assert db.flush() == 2
+    assert _count(db, "posts") == 2
+
+
+def test_rows_buffered_during_a_failed_flush_win(db, monkeypatch):
+    db.save_posts([{**_post("1", "old"), "quotes": [{"post_id": "7"}, {"post_id": "8"}]}])
+    execute = db._execute_with_retry
+
+    def flaky(query, *args, **kwargs):
+        if "INSERT INTO posts" in query:
+            #INFO: Another thread saves a newer copy while this flush is out
+            db.save_posts([{**_post("1", "new"), "quotes": [{"post_id": "9"}]}])
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        return execute(query, *args, **kwargs)
+    monkeypatch.setattr(db, "_execute_with_retry", flaky)
+    with pytest.raises(psycopg2.OperationalError):
+        db.flush()
+    monkeypatch.undo()
+    db.flush()
+    assert db._execute_with_retry("SELECT content FROM posts", is_select=True) == ("new",)
+    assert db._execute_with_retry("SELECT quoted_post_id FROM post_quotes", is_select=True, fetch_all=True) == [("9",)]
@@ -0,0 +1,42 @@
+import pytest
+
+import config
+import frontier
+
+NOW = 1_700_000_000.0
+HOURS = NOW / 3600
+
+
+@pytest.fixture(autouse=True)
+def hours_per_point(monkeypatch):
+    monkeypatch.setattr(config, "PRIORITY_HOURS_PER_POINT", 24.0)
+
+
+@pytest.mark.parametrize("url, url_type, source_type, points", [
+    ("https://www.nairaland.com/", "listing", None, frontier.FRONT_PAGE),
+    ("https://www.nairaland.com/politics", "listing", None, frontier.LISTING),
+    ("https://www.nairaland.com/politics/3", "listing", None, frontier.LISTING - 3 * frontier.DEPTH_PENALTY),
+    ("https://www.nairaland.com/politics/500", "listing", None,
+     frontier.LISTING - frontier.MAX_DEPTH * frontier.DEPTH_PENALTY),
+    ("https://www.nairaland.com/7012345/t", "topic", None, frontier.TOPIC),
+    ("https://www.nairaland.com/7012345/t/4", "topic", None, frontier.TOPIC - 4 * frontier.DEPTH_PENALTY),
+    ("https://www.nairaland.com/7012345/t", "topic", "listing", frontier.TOPIC + frontier.LISTING_SOURCE_BONUS),
+    ("https://www.nairaland.com/7012345/t", "topic", "topic", frontier.TOPIC),
+])
+def test_score_is_discovery_hours_plus_weighted_points(url, url_type, source_type, points):
+    assert frontier.value_points(url, url_type, source_type) == pytest.approx(points)
+    assert frontier.score_url(url, url_type, source_type, now=NOW) == pytest.approx(HOURS + 24 * points)
+
+
+def test_one_point_is_worth_hours_per_point_of_freshness(monkeypatch):
+    topic = "https://www.nairaland.com/7012345/t"
+    board = "https://www.nairaland.com/politics"
+    older_board = frontier.score_url(board, "listing", now=NOW - 24 * 3600)
+    assert older_board == pytest.approx(frontier.score_url(topic, "topic", now=NOW))
+    monkeypatch.setattr(config, "PRIORITY_HOURS_PER_POINT", 6.0)
+    assert frontier.score_url(board, "listing", now=NOW) - frontier.score_url(topic, "topic", now=NOW) == pytest.approx(6)
+
+
+def test_newer_discoveries_win_among_equals():
+    url = "https://www.nairaland.com/7012345/t"
+    assert frontier.score_url(url, "topic", now=NOW + 60) > frontier.score_url(url, "topic", now=NOW)
@@ -0,0 +1,48 @@
+import pytest
+
+from migrate_data import _copy_field, plan_splits
+
+
+def _lines(path, splits):
+    data = path.read_bytes()
+    return [data[start:end].splitlines(keepends=True) for start, end in splits]
+
+
+@pytest.mark.parametrize("workers", [1, 2, 3, 7, 50])
+def test_splits_cover_the_file_on_line_boundaries(tmp_path, workers):
+    path = tmp_path / "posts.jsonl"
+    lines = [f'{{"post_id": "{i}", "content": "{"x" * (i % 37)}"}}\n'.encode() for i in range(40)]
+    path.write_bytes(b"".join(lines))
+    splits = plan_splits(path, workers)
+    assert splits[0][0] == 0 and splits[-1][1] == path.stat().st_size
+    assert all(end == nxt for (_, end), (nxt, _) in zip(splits, splits[1:]))
+    assert all(end > start for start, end in splits)
+    assert len(splits) <= workers
+    #INFO: Every line lands whole in exactly one split
+    assert [line for chunk in _lines(path, splits) for line in chunk] == lines
+
+
+def test_split_boundary_never_cuts_a_long_line(tmp_path):
+    path = tmp_path / "posts.jsonl"
+    path.write_bytes(b"a\n" + b"b" * 1000 + b"\n" + b"c\n")
+    splits = plan_splits(path, 4)
+    assert [chunk for chunk in _lines(path, splits)] == [[b"a\n", b"b" * 1000 + b"\n"], [b"c\n"]]
+
+
+def test_last_line_without_newline(tmp_path):
+    path = tmp_path / "posts.jsonl"
+    path.write_bytes(b"one\ntwo\nthree")
+    splits = plan_splits(path, 2)
+    assert [line for chunk in _lines(path, splits) for line in chunk] == [b"one\n", b"two\n", b"three"]
+
+
+@pytest.mark.parametrize("value, escaped", [
+    ("plain text", "plain text"),
+    ("tab\there", "tab\\there"),
+    ("two\nlines\r\n", "two\\nlines\\r\\n"),
+    ("C:\\path\\n", "C:\\\\path\\\\n"),
+    ("\\N", "\\\\N"),
+    ("", ""),
+])
+def test_copy_field_escapes_copy_text_format(value, escaped):
+    assert _copy_field(value) == escaped
@@ -0,0 +1,43 @@
+import datetime
+import json
+from pathlib import Path
+
+import pytest
+
+import config
+import parser as nl_parser
+
+FIXTURES = Path(__file__).resolve().parent.parent / "bench" / "fixtures"
+CORPUS = sorted(json.loads((FIXTURES / "manifest.json").read_text()).items())
+FETCHED = datetime.datetime(2024, 3, 10, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+def _parse_all(html, url):
+    page = nl_parser.parse_page(html, url, fetched_at=FETCHED)
+    wrappers = (sorted(nl_parser.extract_topic_links(html)),
+                sorted(nl_parser.extract_pagination_links(html)),
+                nl_parser.parse_topic_content(html, fetched_at=FETCHED))
+    return page, wrappers
+
+
+@pytest.mark.parametrize("name, url", CORPUS)
+def test_lxml_matches_html_parser(monkeypatch, name, url):
+    #INFO: PARSER_BACKEND=auto switches every entry point to lxml when it is installed
+    if not nl_parser.HAS_LXML:
+        pytest.skip("lxml is not installed")
+    html = (FIXTURES / name).read_text(encoding="utf-8")
+    monkeypatch.setattr(config, "PARSER_BACKEND", "html.parser")
+    expected = _parse_all(html, url)
+    monkeypatch.setattr(config, "PARSER_BACKEND", "lxml")
+    assert _parse_all(html, url) == expected
+
+
+@pytest.mark.parametrize("name, url", CORPUS)
+def test_parse_page_matches_wrappers(monkeypatch, name, url):
+    monkeypatch.setattr(config, "PARSER_BACKEND", "html.parser")
+    html = (FIXTURES / name).read_text(encoding="utf-8")
+    page, (topic_links, pagination_links, posts) = _parse_all(html, url)
+    assert sorted(page["topic_links"]) == topic_links
+    assert sorted(page["pagination_links"]) == pagination_links
+    if page["page_type"] == "topic":
+        assert page["posts"] == posts
@@ -0,0 +1,59 @@
+import datetime
+
+import pytest
+
+import config
+from database import DatabaseManager
+from parser import parse_post_time
+
+UTC = datetime.timezone.utc
+
+
+def _post(fetched_at):
+    #INFO: A "today" timestamp resolves to the day of whichever crawl saw it
+    return {"post_id": "91234567", "topic_id": "7012345", "author": "tester", "time": "3:15pm",
+            "content": "same post, fetched twice", "source_url": "https://www.nairaland.com/7012345/t",
+            "posted_at": parse_post_time("3:15pm", fetched_at)}
+
+
+def _stored(db):
+    return db._execute_with_retry("SELECT post_id, posted_at FROM posts", is_select=True, fetch_all=True)
+
+
+@pytest.mark.parametrize("partitioned", [False, True])
+@pytest.mark.parametrize("upsert", [False, True])
+def test_refetch_with_other_fetch_time_keeps_one_row(database_url, monkeypatch, partitioned, upsert):
+    now = datetime.datetime.now(UTC)
+    first, second = now - datetime.timedelta(days=40), now
+    assert parse_post_time("3:15pm", first) != parse_post_time("3:15pm", second)
+    if partitioned:
+        import partition_posts
+        monkeypatch.setattr(config, "DATABASE_URL", database_url)
+        DatabaseManager(database_url).close()
+        partition_posts.run_partition(first_month=(first - datetime.timedelta(days=31)).date())
+
+    db = DatabaseManager(database_url, upsert_posts=upsert)
+    try:
+        assert db.posts_partitioned == partitioned
+        db.save_posts([_post(first)])
+        db.flush()
+        db.save_posts([_post(second)])
+        db.flush()
+        rows = _stored(db)
+        assert len(rows) == 1
+        assert rows[0][1] == parse_post_time("3:15pm", first)
+    finally:
+        db.close()
+
+
+def test_missing_posted_at_is_filled_in(database_url):
+    db = DatabaseManager(database_url, upsert_posts=True)
+    try:
+        db.save_posts([{**_post(None), "posted_at": None}])
+        db.flush()
+        fetched_at = datetime.datetime(2024, 3, 10, 12, 0, tzinfo=UTC)
+        db.save_posts([_post(fetched_at)])
+        db.flush()
+        assert _stored(db) == [("91234567", parse_post_time("3:15pm", fetched_at))]
+    finally:
+        db.close()
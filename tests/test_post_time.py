@@ -0,0 +1,56 @@
+import datetime
+
+import pytest
+
+from parser import SITE_TZ, parse_post_time
+
+UTC = datetime.timezone.utc
+#INFO: 13:00 site time on Sun 10 Mar 2024
+FETCHED = datetime.datetime(2024, 3, 10, 12, 0, tzinfo=UTC)
+#INFO: 00:30 site time on Mon 11 Mar, still the 10th in UTC
+AFTER_MIDNIGHT = datetime.datetime(2024, 3, 10, 23, 30, tzinfo=UTC)
+
+
+def wat(*args):
+    return datetime.datetime(*args, tzinfo=SITE_TZ)
+
+
+@pytest.mark.parametrize("text, fetched_at, expected", [
+    # A bare time is today, in site time
+    ("3:15pm", FETCHED, wat(2024, 3, 10, 15, 15)),
+    ("12:05am", FETCHED, wat(2024, 3, 10, 0, 5)),
+    ("12:30pm", FETCHED, wat(2024, 3, 10, 12, 30)),
+    ("  3:15PM ", FETCHED, wat(2024, 3, 10, 15, 15)),
+    # A year-less date is this year, or last year if that would be after the fetch date
+    ("3:15pm On Mar 09", FETCHED, wat(2024, 3, 9, 15, 15)),
+    ("3:15pm On Mar 10", FETCHED, wat(2024, 3, 10, 15, 15)),
+    ("3:15pm On Mar 11", FETCHED, wat(2023, 3, 11, 15, 15)),
+    ("3:15pm On Dec 31", FETCHED, wat(2023, 12, 31, 15, 15)),
+    ("9:00am On Sept 05", FETCHED, wat(2023, 9, 5, 9, 0)),
+    # An explicit year is taken as is
+    ("3:15pm On Jan 05, 2021", FETCHED, wat(2021, 1, 5, 15, 15)),
+    ("3:15pm On Dec 31, 2024", FETCHED, wat(2024, 12, 31, 15, 15)),
+    # Just past midnight in WAT the site's "today" is already the next UTC day
+    ("12:10am", AFTER_MIDNIGHT, wat(2024, 3, 11, 0, 10)),
+    ("3:15pm On Mar 11", AFTER_MIDNIGHT, wat(2024, 3, 11, 15, 15)),
+    ("11:00pm On Dec 31", datetime.datetime(2023, 12, 31, 23, 30, tzinfo=UTC), wat(2023, 12, 31, 23, 0)),
+    # Not a post time
+    ("", FETCHED, None),
+    ("yesterday", FETCHED, None),
+    ("3:15pm On Feb 30", FETCHED, None),
+    ("3:15pm On Foo 05", FETCHED, None),
+])
+def test_parse_post_time(text, fetched_at, expected):
+    assert parse_post_time(text, fetched_at) == expected
+
+
+@pytest.mark.parametrize("text", ["12:10am", "3:15pm On Mar 11", "3:15pm On Jan 05, 2021"])
+def test_naive_fetched_at_is_utc(text):
+    naive = AFTER_MIDNIGHT.replace(tzinfo=None)
+    assert parse_post_time(text, naive) == parse_post_time(text, AFTER_MIDNIGHT)
+
+
+def test_result_is_aware_site_time():
+    posted = parse_post_time("12:10am", AFTER_MIDNIGHT)
+    assert posted.utcoffset() == datetime.timedelta(hours=1)
+    assert posted.astimezone(UTC) == datetime.datetime(2024, 3, 10, 23, 10, tzinfo=UTC)
@@ -0,0 +1,81 @@
+import pytest
+
+import rate_limit
+from rate_limit import LocalBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def test_first_reservation_is_free_then_slots_queue_at_the_rate(clock):
+    bucket = LocalBucket(rate=2.0, burst=3.0)
+    waits = [bucket.reserve()[0] for _ in range(4)]
+    #INFO: Slots handed out back to back wait 1/rate longer each
+    assert waits == pytest.approx([0.0, 0.5, 1.0, 1.5])
+
+
+def test_refill_over_time_is_capped_at_burst(clock):
+    bucket = LocalBucket(rate=2.0, burst=3.0)
+    bucket.reserve()
+    clock.now += 60
+    waits = [bucket.reserve()[0] for _ in range(5)]
+    #INFO: A long idle spell banks burst tokens, not rate * idle time
+    assert waits == pytest.approx([0.0, 0.0, 0.0, 0.5, 1.0])
+
+
+def test_partial_refill_pays_down_queued_debt(clock):
+    bucket = LocalBucket(rate=1.0, burst=2.0)
+    for _ in range(3):
+        bucket.reserve()
+    clock.now += 1.5
+    assert bucket.reserve()[0] == pytest.approx(1.5)
+
+
+def test_increase_waits_out_interval_and_respects_max(clock):
+    bucket = LocalBucket(rate=1.0, burst=2.0)
+    assert bucket.increase(0.5, max_rate=1.8, interval=30) is None
+    clock.now += 31
+    assert bucket.increase(0.5, max_rate=1.8, interval=30) == pytest.approx(1.5)
+    assert bucket.increase(0.5, max_rate=1.8, interval=30) is None
+    clock.now += 31
+    assert bucket.increase(0.5, max_rate=1.8, interval=30) == pytest.approx(1.8)
+
+
+def test_decrease_cuts_once_per_cooldown_and_drops_banked_tokens(clock):
+    bucket = LocalBucket(rate=2.0, burst=3.0)
+    clock.now += 10
+    assert bucket.decrease(0.5, min_rate=0.1, cooldown=5) == pytest.approx(1.0)
+    assert bucket.decrease(0.5, min_rate=0.1, cooldown=5) is None
+    #INFO: Three banked tokens are gone, the next slot is a full interval at the new rate away
+    assert [bucket.reserve()[0] for _ in range(2)] == pytest.approx([1.0, 2.0])
+    #INFO: No increase right after a cut
+    clock.now += 1
+    assert bucket.increase(0.1, max_rate=5, interval=5) is None
+
+
+def test_decrease_keeps_queued_slots_in_line(clock):
+    bucket = LocalBucket(rate=2.0, burst=2.0)
+    clock.now += 10
+    waits = [bucket.reserve()[0] for _ in range(4)]
+    assert waits == pytest.approx([0.0, 0.0, 0.5, 1.0])
+    bucket.decrease(0.5, min_rate=0.1, cooldown=5)
+    #INFO: Two slots are still queued, the next one comes after them at 1 req/s
+    assert bucket.reserve()[0] == pytest.approx(3.0)
+
+
+def test_decrease_never_goes_below_min_rate(clock):
+    bucket = LocalBucket(rate=0.3, burst=1.0)
+    clock.now += 10
+    assert bucket.decrease(0.5, min_rate=0.2, cooldown=5) == pytest.approx(0.2)
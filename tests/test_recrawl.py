@@ -0,0 +1,47 @@
+import pytest
+
+import config
+import recrawl
+
+
+@pytest.fixture(autouse=True)
+def bounds(monkeypatch):
+    monkeypatch.setattr(config, "RECRAWL_MIN_SECONDS", 1800)
+    monkeypatch.setattr(config, "RECRAWL_MAX_SECONDS", 14 * 24 * 3600)
+    monkeypatch.setattr(config, "RECRAWL_TARGET_POSTS", 20)
+
+
+@pytest.mark.parametrize("post_id, number", [
+    ("91234567", 91234567), (91234567, 91234567), ("0", 0), ("", 0), (None, 0), ("pid123", 0),
+])
+def test_post_number(post_id, number):
+    assert recrawl.post_number(post_id) == number
+
+
+def state(interval, since):
+    return {"recrawl_interval": interval, "seconds_since_crawl": since, "max_post_id": 100}
+
+
+@pytest.mark.parametrize("prior, fresh, interval", [
+    # First visit, or no crawl time yet: the minimum
+    (None, 5, 1800),
+    ({"recrawl_interval": 7200, "seconds_since_crawl": None}, 5, 1800),
+    # Nothing new doubles the interval, up to the cap
+    (state(7200, 7200), 0, 14400),
+    (state(10 * 24 * 3600, 3600), 0, 14 * 24 * 3600),
+    (state(None, 3600), 0, 3600),
+    # Otherwise aim for RECRAWL_TARGET_POSTS new posts per visit
+    (state(3600, 36000), 10, 72000),
+    (state(3600, 3600), 20, 3600),
+    # ...within the bounds
+    (state(3600, 3600), 200, 1800),
+    (state(3600, 10 * 24 * 3600), 1, 14 * 24 * 3600),
+])
+def test_next_interval(prior, fresh, interval):
+    assert recrawl.next_interval(prior, fresh) == interval
+
+
+def test_new_posts_are_above_the_stored_maximum():
+    posts = [{"post_id": "99"}, {"post_id": "100"}, {"post_id": "101"}, {"post_id": "bad"}]
+    assert recrawl.new_posts(posts, {"max_post_id": 100}) == [{"post_id": "101"}]
+    assert recrawl.new_posts(posts, None) == posts[:3]
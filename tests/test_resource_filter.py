@@ -0,0 +1,74 @@
+import pytest
+
+import config
+from browser import ResourceFilter
+
+
+class FakeRequest:
+    def __init__(self, url, resource_type):
+        self.url = url
+        self.resource_type = resource_type
+
+
+class FakeRoute:
+    def __init__(self, url, resource_type):
+        self.request = FakeRequest(url, resource_type)
+        self.outcome = None
+
+    def abort(self):
+        self.outcome = "abort"
+
+    def continue_(self):
+        self.outcome = "continue"
+
+
+@pytest.fixture
+def resource_filter():
+    return ResourceFilter(config.BLOCK_RESOURCE_TYPES, config.BLOCK_URL_PATTERNS, config.ALLOW_URL_PATTERNS)
+
+
+@pytest.mark.parametrize("url, resource_type, blocked", [
+    # The page itself and its scripts load
+    ("https://www.nairaland.com/7012345/some-topic", "document", False),
+    ("https://www.nairaland.com/static/site.js", "script", False),
+    ("https://www.nairaland.com/static/style.css", "stylesheet", False),
+    # Blocked by type
+    ("https://www.nairaland.com/attachments/1.jpg", "image", True),
+    ("https://www.nairaland.com/static/font.woff2", "font", True),
+    ("https://www.nairaland.com/clip.mp4", "media", True),
+    # Blocked by URL, whatever the type
+    ("https://pagead2.googlesyndication.com/pagead/show_ads.js", "script", True),
+    ("https://www.googletagmanager.com/gtag/js?id=G-1", "script", True),
+    ("https://connect.facebook.net/en_US/sdk.js", "script", True),
+    ("https://c.amazon-adsystem.com/aax2/apstag.js", "xhr", True),
+    # The Cloudflare challenge always loads, even where a block rule also matches
+    ("https://challenges.cloudflare.com/turnstile/v0/api.js", "script", False),
+    ("https://challenges.cloudflare.com/cdn-cgi/challenge-platform/logo.png", "image", False),
+    ("https://www.nairaland.com/cdn-cgi/challenge-platform/h/b/orchestrate/jsch/v1", "script", False),
+    ("https://www.nairaland.com/cdn-cgi/images/trace/jsch/transparent.gif", "image", False),
+])
+def test_should_block(resource_filter, url, resource_type, blocked):
+    assert resource_filter.should_block(url, resource_type) is blocked
+
+
+def test_allow_beats_block_pattern():
+    rf = ResourceFilter([], ["doubleclick.net"], ["doubleclick.net/keep"])
+    assert rf.should_block("https://doubleclick.net/keep/this.js", "script") is False
+    assert rf.should_block("https://doubleclick.net/other.js", "script") is True
+
+
+def test_nothing_blocked_without_rules():
+    rf = ResourceFilter([], [], [])
+    assert rf.should_block("https://pagead2.googlesyndication.com/ad.png", "image") is False
+
+
+def test_handle_route_counts_aborts(resource_filter):
+    routes = [FakeRoute("https://www.nairaland.com/", "document"),
+              FakeRoute("https://www.nairaland.com/a.png", "image"),
+              FakeRoute("https://www.nairaland.com/cdn-cgi/b.png", "image"),
+              FakeRoute("https://securepubads.g.doubleclick.net/tag.js", "script")]
+    for route in routes:
+        resource_filter.handle_route(route)
+    assert [r.outcome for r in routes] == ["continue", "abort", "continue", "abort"]
+    assert resource_filter.totals["requests"] == 4
+    assert resource_filter.totals["blocked"] == 2
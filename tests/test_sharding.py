@@ -0,0 +1,54 @@
+import pytest
+
+from sharding import SHARDS, HashRing
+
+MEMBERS = [f"crawler-{i}-{1000 + i}" for i in range(8)]
+
+
+def owners(ring):
+    return {shard: ring.owner(shard) for shard in range(SHARDS)}
+
+
+def test_empty_ring_owns_nothing():
+    ring = HashRing([])
+    assert ring.owner(0) is None
+    assert ring.assignment() == {}
+
+
+def test_member_order_does_not_change_the_ring():
+    #INFO: Every replica builds the ring from its own read of the workers table
+    assert owners(HashRing(MEMBERS)) == owners(HashRing(list(reversed(MEMBERS))))
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 4, 8])
+def test_every_shard_has_exactly_one_owner(n):
+    assignment = HashRing(MEMBERS[:n]).assignment()
+    assert sorted(s for shards in assignment.values() for s in shards) == list(range(SHARDS))
+
+
+@pytest.mark.parametrize("n", [2, 3, 4, 8])
+def test_shards_are_spread_over_members(n):
+    fair = SHARDS / n
+    sizes = [len(shards) for shards in HashRing(MEMBERS[:n]).assignment().values()]
+    #INFO: 256 shards over 128 vnodes a member is a coarse split, just no replica starved or swamped
+    assert min(sizes) >= fair * 0.5
+    assert max(sizes) <= fair * 1.5
+
+
+@pytest.mark.parametrize("n", [1, 3, 7])
+def test_joining_member_only_takes_shards(n):
+    before = owners(HashRing(MEMBERS[:n]))
+    joined = MEMBERS[n]
+    after = owners(HashRing(MEMBERS[:n + 1]))
+    moved = [s for s in range(SHARDS) if before[s] != after[s]]
+    assert moved
+    assert all(after[s] == joined for s in moved)
+
+
+@pytest.mark.parametrize("n", [2, 4, 8])
+def test_leaving_member_only_gives_up_its_own_shards(n):
+    before = owners(HashRing(MEMBERS[:n]))
+    gone = MEMBERS[n // 2]
+    after = owners(HashRing([m for m in MEMBERS[:n] if m != gone]))
+    moved = [s for s in range(SHARDS) if before[s] != after[s]]
+    assert sorted(moved) == sorted(s for s in range(SHARDS) if before[s] == gone)
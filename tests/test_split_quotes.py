@@ -0,0 +1,36 @@
+import pytest
+
+import parser as nl_parser
+from parser import _split_quotes, make_soup
+
+BACKENDS = ["html.parser"] + (["lxml"] if nl_parser.HAS_LXML else [])
+
+
+def split(html, backend):
+    div = make_soup(f'<div class="narrow">{html}</div>', backend).find("div")
+    return _split_quotes(div), div.get_text("|", strip=True)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("html, quotes, text", [
+    # A quote of another post becomes a reference and leaves the body
+    ('<blockquote><a href="/post/111">alice</a>: hi</blockquote>reply',
+     [{"post_id": "111", "author": "alice"}], "reply"),
+    ('<blockquote><a href="https://www.nairaland.com/post/444#msg">dave</a>: x</blockquote>ok',
+     [{"post_id": "444", "author": "dave"}], "ok"),
+    ('<blockquote><a href="/post/555?x=1">erin</a></blockquote>'
+     '<blockquote><a href="/post/556/">frank</a></blockquote>two',
+     [{"post_id": "555", "author": "erin"}, {"post_id": "556", "author": "frank"}], "two"),
+    # A quote nested in a post quote goes with it, only the outer one is referenced
+    ('<blockquote><a href="/post/111">alice</a>: outer '
+     '<blockquote><a href="/post/222">bob</a>: inner</blockquote></blockquote>reply',
+     [{"post_id": "111", "author": "alice"}], "reply"),
+    # Quotes that do not link a /post/<id> stay inline, nested post quotes included
+    ('<blockquote>free text</blockquote>reply', [], "free text|reply"),
+    ('<blockquote><a href="/7012345/topic">a topic</a> said</blockquote>reply', [], "a topic|said|reply"),
+    ('<blockquote><a href="/post/abc">z</a></blockquote>reply', [], "z|reply"),
+    ('<blockquote>free <blockquote><a href="/post/333">carol</a>: x</blockquote></blockquote>reply',
+     [], "free|carol|: x|reply"),
+])
+def test_split_quotes(backend, html, quotes, text):
+    assert split(html, backend) == (quotes, text)
@@ -0,0 +1,50 @@
+from url_cache import ScalableBloomFilter, VisitedCache
+
+
+def test_bloom_has_no_false_negatives_and_bounded_false_positives():
+    bloom = ScalableBloomFilter(initial_capacity=1000, error_rate=0.01)
+    added = [f"t:{i}:0" for i in range(5000)]
+    for key in added:
+        bloom.add(key)
+    assert all(key in bloom for key in added)
+    #INFO: The filter grew past its first capacity and still holds the compound error bound
+    assert len(bloom.filters) > 1
+    false_positives = sum(f"b:board{i}:0" in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.02
+
+
+def test_bloom_add_reports_repeats():
+    bloom = ScalableBloomFilter(initial_capacity=100, error_rate=0.01)
+    assert bloom.add("t:1:0")
+    assert not bloom.add("t:1:0")
+    assert len(bloom) == 1
+
+
+def test_lookup_unseen_seen_and_remembered():
+    cache = VisitedCache(capacity=1000, error_rate=0.001, lru_size=10)
+    assert cache.lookup("t:1:0") == (False, None)
+    cache.remember("t:1:0", "completed")
+    assert cache.lookup("t:1:0") == (True, "completed")
+    cache.bloom.add("t:2:0")
+    assert cache.lookup("t:2:0") == (True, None)
+
+
+def test_lru_evicts_least_recently_used_but_bloom_keeps_it():
+    cache = VisitedCache(capacity=1000, error_rate=0.001, lru_size=3)
+    for i in range(3):
+        cache.remember(f"t:{i}:0", "pending")
+    #INFO: A lookup refreshes the entry, so t:1:0 is now the oldest
+    cache.lookup("t:0:0")
+    cache.remember("t:3:0", "pending")
+    assert list(cache.recent) == ["t:2:0", "t:0:0", "t:3:0"]
+    assert cache.lookup("t:1:0") == (True, None)
+
+
+def test_partition_splits_known_new_and_unverified():
+    cache = VisitedCache(capacity=1000, error_rate=0.001, lru_size=1)
+    cache.remember("t:1:0", "completed")
+    cache.remember("t:2:0", "pending")
+    known, new, unverified = cache.partition(["t:1:0", "t:2:0", "t:3:0"])
+    assert (known, new, unverified) == (["t:2:0"], ["t:3:0"], ["t:1:0"])
+    stats = cache.stats()
+    assert stats["lru_entries"] == 1 and stats["bloom_entries"] == 2
@@ -0,0 +1,54 @@
+import pytest
+
+from parser import canonical_url, url_key
+
+TOPIC = "https://www.nairaland.com/7012345/some-topic"
+BOARD = "https://www.nairaland.com/politics"
+
+#INFO: (link as found on a page, fetchable spelling, dedupe key)
+CASES = [
+    # Slug variants of one topic page
+    (TOPIC, TOPIC, "t:7012345:0"),
+    ("https://nairaland.com/7012345/other-slug/", "https://www.nairaland.com/7012345/other-slug", "t:7012345:0"),
+    ("http://www.nairaland.com/7012345/some-topic", TOPIC, "t:7012345:0"),
+    ("https://www.nairaland.com/7012345", "https://www.nairaland.com/7012345", "t:7012345:0"),
+    ("https://www.nairaland.com/007012345/some-topic/1", "https://www.nairaland.com/007012345/some-topic/1",
+     "t:7012345:1"),
+    ("/7012345/some-topic/1", TOPIC + "/1", "t:7012345:1"),
+    # An explicit /0 is the first page
+    (TOPIC + "/0", TOPIC, "t:7012345:0"),
+    (BOARD + "/0", BOARD, "b:politics:0"),
+    # Topic pages, with and without a slug
+    (TOPIC + "/3", TOPIC + "/3", "t:7012345:3"),
+    ("https://www.nairaland.com/7012345/2", "https://www.nairaland.com/7012345/2", "t:7012345:2"),
+    # Query strings and fragments never make a new page
+    (TOPIC + "/3?x=1#msg9", TOPIC + "/3", "t:7012345:3"),
+    (TOPIC + "#msg123", TOPIC, "t:7012345:0"),
+    (BOARD + "?sort=new", BOARD, "b:politics:0"),
+    # Board pagination, board names are case-insensitive
+    (BOARD + "/2", BOARD + "/2", "b:politics:2"),
+    ("https://www.nairaland.com/Politics/2/", "https://www.nairaland.com/Politics/2", "b:politics:2"),
+    (BOARD + "/2#top", BOARD + "/2", "b:politics:2"),
+    ("/politics/4", BOARD + "/4", "b:politics:4"),
+    # Front page
+    ("https://www.nairaland.com", "https://www.nairaland.com/", "b::0"),
+    ("https://www.nairaland.com/", "https://www.nairaland.com/", "b::0"),
+    # Off-site links keep their own URL, minus the fragment
+    ("https://twitter.com/nairaland/status/1#x", "https://twitter.com/nairaland/status/1",
+     "url:https://twitter.com/nairaland/status/1"),
+    ("https://example.com/7012345/some-topic", "https://example.com/7012345/some-topic",
+     "url:https://example.com/7012345/some-topic"),
+]
+
+
+@pytest.mark.parametrize("url, canonical, key", CASES)
+def test_canonical_url_and_key(url, canonical, key):
+    assert canonical_url(url) == canonical
+    assert url_key(url) == key
+
+
+@pytest.mark.parametrize("url, canonical, key", CASES)
+def test_canonical_url_keeps_its_key(url, canonical, key):
+    #INFO: The spelling that gets queued must dedupe onto the same row as the original link
+    assert url_key(canonical) == key
+    assert canonical_url(canonical) == canonical